@@ -0,0 +1,91 @@
+# answer_cache.py
+
+import asyncio
+import logging
+import threading
+
+from settings import FOLLOWING_QUESTIONS
+from dir_cache import directory_cache
+from helpers import current_date
+from llm_service import LLMService
+
+# Prefetch requests are queued in the LLM scheduler under this id, as
+# background requests that only run while no user request is waiting.
+PREFETCH_USER_ID = "prefetch"
+
+
+class SuggestedAnswerCache:
+    """Precomputed answers to the suggested FOLLOWING_QUESTIONS.
+
+    Answers are stored per folder, index version (the snapshot fingerprint)
+    and day, since the questions are relative to today. When a folder
+    changes or the day ends, lookups miss and the old answers are dropped
+    by the next prefetch of that folder.
+    """
+
+    def __init__(self, questions=FOLLOWING_QUESTIONS):
+        self.questions = list(questions)
+        self._lock = threading.Lock()
+        # (folder_path, (fingerprint, day), question) -> (response, source_files)
+        self._answers = {}
+        self._in_progress = set()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, folder_path, question):
+        version = (directory_cache.get_snapshot(folder_path).fingerprint, current_date())
+        with self._lock:
+            answer = self._answers.get((folder_path, version, question))
+            if answer:
+                self.hits += 1
+            else:
+                self.misses += 1
+        return answer
+
+    def invalidate(self, folder_path, keep_version=None):
+        with self._lock:
+            for key in list(self._answers):
+                if key[0] == folder_path and key[1] != keep_version:
+                    del self._answers[key]
+
+    async def prefetch(self, folder_path, scheduler):
+        """Answer the suggested questions for the current index of ``folder_path``.
+
+        Only uses an index that is already built. Returns the number of new answers.
+        """
+        llm_service = LLMService()
+        if not await asyncio.to_thread(llm_service.attach_index, folder_path):
+            return 0
+        version = (llm_service.index_fingerprint, current_date())
+        with self._lock:
+            if (folder_path, version) in self._in_progress:
+                return 0
+            self._in_progress.add((folder_path, version))
+        self.invalidate(folder_path, keep_version=version)
+
+        prefetched = 0
+        try:
+            for question in self.questions:
+                key = (folder_path, version, question)
+                with self._lock:
+                    if key in self._answers:
+                        continue
+                try:
+                    # Asked right after project selection, so without chat history
+                    answer = await scheduler.submit(
+                        PREFETCH_USER_ID,
+                        llm_service.generate_response,
+                        question,
+                        chat_history=[],
+                        background=True,
+                    )
+                except Exception as e:
+                    logging.error(f"Error prefetching answer for {folder_path}: {e}")
+                    continue
+                with self._lock:
+                    self._answers[key] = answer
+                prefetched += 1
+        finally:
+            with self._lock:
+                self._in_progress.discard((folder_path, version))
+        return prefetched
@@ -0,0 +1,247 @@
+# archive_service.py
+
+import argparse
+import gzip
+import logging
+import os
+import re
+from datetime import date
+
+from db_service import DatabaseService
+from settings import (
+    PARTITIONED_TABLES,
+    PARTITION_MONTHS_AHEAD,
+    RETENTION_MONTHS,
+    ARCHIVE_DIR,
+)
+
+# Upper bound of a range partition as printed by pg_get_expr(relpartbound)
+PARTITION_UPPER_BOUND = re.compile(r"TO \('(\d{4}-\d{2}-\d{2})")
+
+
+def month_start(day, offset=0):
+    """First day of the month ``offset`` months after the month of ``day``."""
+    month_index = day.year * 12 + day.month - 1 + offset
+    return date(month_index // 12, month_index % 12 + 1, 1)
+
+
+def partition_name(table, start):
+    return f"{table}_p{start:%Y_%m}"
+
+
+class ArchiveService:
+    """Monthly range partitions for the log tables and their retention.
+
+    ``messages`` and ``event_log`` are partitioned by month so history
+    queries only scan recent partitions. Partitions older than the retention
+    period are detached, exported to gzipped CSV files and dropped.
+    """
+
+    def __init__(self, tables=None, archive_dir=ARCHIVE_DIR):
+        self.tables = tables or PARTITIONED_TABLES
+        self.archive_dir = archive_dir
+        self.db_service = DatabaseService()
+
+    def is_partitioned(self, cursor, table):
+        cursor.execute(
+            """
+            SELECT 1 FROM pg_partitioned_table pt
+            JOIN pg_class c ON c.oid = pt.partrelid
+            WHERE c.relname = %s
+            """,
+            (table,),
+        )
+        return cursor.fetchone() is not None
+
+    def migrate_to_partitioned(self, table, column):
+        """Turn an existing table into a partitioned one without copying rows.
+
+        The current table is kept as a single legacy partition covering
+        everything up to the start of next month; new months get their own
+        partitions. Non-unique indexes are recreated on the partitioned table
+        so every partition gets them; a primary key is not carried over, as
+        it would have to include the partition column.
+        """
+        connection = self.db_service.connect()
+        try:
+            with connection, connection.cursor() as cursor:
+                if self.is_partitioned(cursor, table):
+                    return False
+                legacy = f"{table}_legacy"
+                upper = month_start(date.today(), 1)
+                cursor.execute(f"ALTER TABLE {table} RENAME TO {legacy}")
+                cursor.execute(
+                    f"CREATE TABLE {table} (LIKE {legacy} INCLUDING DEFAULTS) "
+                    f"PARTITION BY RANGE ({column})"
+                )
+                cursor.execute(
+                    f"ALTER TABLE {table} ATTACH PARTITION {legacy} "
+                    "FOR VALUES FROM (MINVALUE) TO (%s)",
+                    (upper,),
+                )
+                self.copy_indexes(cursor, legacy, table)
+                cursor.execute(
+                    f"CREATE TABLE IF NOT EXISTS {table}_default "
+                    f"PARTITION OF {table} DEFAULT"
+                )
+            logging.info(f"Table {table} is now partitioned by {column}.")
+            return True
+        finally:
+            connection.close()
+
+    def copy_indexes(self, cursor, legacy, table):
+        """Create the non-unique indexes of ``legacy`` on the partitioned ``table``.
+
+        The legacy indexes are renamed and then attached to the new ones by
+        Postgres, so they are not rebuilt.
+        """
+        cursor.execute(
+            """
+            SELECT i.relname, pg_get_indexdef(ix.indexrelid)
+            FROM pg_index ix
+            JOIN pg_class i ON i.oid = ix.indexrelid
+            JOIN pg_class t ON t.oid = ix.indrelid
+            WHERE t.relname = %s AND NOT ix.indisunique
+            """,
+            (legacy,),
+        )
+        for index_name, definition in cursor.fetchall():
+            cursor.execute(f"ALTER INDEX {index_name} RENAME TO {index_name}_legacy")
+            # "CREATE INDEX name ON legacy USING btree (...)" -> "USING btree (...)"
+            method = definition[definition.index(" USING "):]
+            cursor.execute(f"CREATE INDEX {index_name} ON {table}{method}")
+
+    def ensure_partitions(self, months_ahead=PARTITION_MONTHS_AHEAD):
+        """Create monthly partitions from this month up to ``months_ahead``.
+
+        Months already covered by an existing partition (such as the legacy
+        one left by migrate_to_partitioned) are skipped.
+        """
+        connection = self.db_service.connect()
+        try:
+            with connection, connection.cursor() as cursor:
+                for table, column in self.tables.items():
+                    if not self.is_partitioned(cursor, table):
+                        logging.warning(f"Table {table} is not partitioned, skipping.")
+                        continue
+                    partitions = self.list_partitions(cursor, table)
+                    bounds = [upper for _, upper in partitions if upper is not None]
+                    default = next((name for name, upper in partitions if upper is None), None)
+                    covered_until = max(bounds, default=None)
+                    existing = {name for name, _ in partitions}
+                    for offset in range(months_ahead + 1):
+                        start = month_start(date.today(), offset)
+                        name = partition_name(table, start)
+                        if name in existing or (covered_until and start < covered_until):
+                            continue
+                        self.create_partition(cursor, table, column, name, start, default)
+        finally:
+            connection.close()
+
+    def create_partition(self, cursor, table, column, name, start, default=None):
+        """Create the partition of one month, moving its rows out of the DEFAULT partition.
+
+        Postgres refuses to attach a range while the DEFAULT partition holds
+        rows for it, so they are moved in the same transaction.
+        """
+        end = month_start(start, 1)
+        cursor.execute(f"CREATE TABLE {name} (LIKE {table} INCLUDING DEFAULTS)")
+        if default:
+            cursor.execute(
+                f"WITH moved AS (DELETE FROM {default} WHERE {column} >= %s AND {column} < %s "
+                f"RETURNING *) INSERT INTO {name} SELECT * FROM moved",
+                (start, end),
+            )
+        cursor.execute(
+            f"ALTER TABLE {table} ATTACH PARTITION {name} FOR VALUES FROM (%s) TO (%s)",
+            (start, end),
+        )
+        logging.info(f"Created partition {name}.")
+
+    def list_partitions(self, cursor, table):
+        """Return (partition_name, upper_bound) pairs; upper_bound is None for DEFAULT."""
+        cursor.execute(
+            """
+            SELECT child.relname, pg_get_expr(child.relpartbound, child.oid)
+            FROM pg_inherits
+            JOIN pg_class parent ON parent.oid = pg_inherits.inhparent
+            JOIN pg_class child ON child.oid = pg_inherits.inhrelid
+            WHERE parent.relname = %s
+            """,
+            (table,),
+        )
+        partitions = []
+        for name, bound in cursor.fetchall():
+            match = PARTITION_UPPER_BOUND.search(bound or "")
+            upper = date.fromisoformat(match.group(1)) if match else None
+            partitions.append((name, upper))
+        return partitions
+
+    def archive_old_partitions(self, retention_months=RETENTION_MONTHS):
+        """Detach, export and drop partitions that ended before the retention cutoff."""
+        cutoff = month_start(date.today(), -retention_months)
+        os.makedirs(self.archive_dir, exist_ok=True)
+        archived = []
+
+        connection = self.db_service.connect()
+        try:
+            for table in self.tables:
+                with connection, connection.cursor() as cursor:
+                    if not self.is_partitioned(cursor, table):
+                        continue
+                    expired = [
+                        name
+                        for name, upper in self.list_partitions(cursor, table)
+                        if upper is not None and upper <= cutoff
+                    ]
+                for name in expired:
+                    self.archive_partition(connection, table, name)
+                    archived.append(name)
+        finally:
+            connection.close()
+        return archived
+
+    def archive_partition(self, connection, table, name):
+        file_path = os.path.join(self.archive_dir, f"{name}.csv.gz")
+        with connection, connection.cursor() as cursor:
+            cursor.execute(f"ALTER TABLE {table} DETACH PARTITION {name}")
+        # The detached table is only dropped once the export is complete
+        with gzip.open(file_path, "wt", encoding="utf-8", newline="") as archive_file:
+            with connection, connection.cursor() as cursor:
+                cursor.copy_expert(f"COPY {name} TO STDOUT WITH CSV HEADER", archive_file)
+        with connection, connection.cursor() as cursor:
+            cursor.execute(f"DROP TABLE {name}")
+        logging.info(f"Archived partition {name} to {file_path}.")
+
+    def run_maintenance(self):
+        self.ensure_partitions()
+        return self.archive_old_partitions()
+
+    def close(self):
+        self.db_service.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Partition maintenance for log tables.")
+    parser.add_argument(
+        "--migrate", action="store_true",
+        help="Convert existing messages/event_log tables to partitioned tables first.",
+    )
+    parser.add_argument("--retention-months", type=int, default=RETENTION_MONTHS)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    archive_service = ArchiveService()
+    try:
+        if args.migrate:
+            for table, column in archive_service.tables.items():
+                archive_service.migrate_to_partitioned(table, column)
+        archive_service.ensure_partitions()
+        archived = archive_service.archive_old_partitions(args.retention_months)
+        logging.info(f"Archived {len(archived)} partitions.")
+    finally:
+        archive_service.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,22 +1,153 @@
 # auth.py
 
+import logging
+import select
+import threading
+import time
+from datetime import datetime
+
 from db_service import DatabaseService
+from settings import AUTH_CACHE_TTL, ACCESS_CHANGES_CHANNEL, LAST_ACTIVE_FLUSH_INTERVAL
+
 
 class AuthService:
-    def __init__(self):
+    def __init__(self, cache_ttl=AUTH_CACHE_TTL, flush_interval=LAST_ACTIVE_FLUSH_INTERVAL):
         self.db_service = DatabaseService()
+        self.cache_ttl = cache_ttl
+        self.flush_interval = flush_interval
+        self._lock = threading.Lock()
+        # user_id -> (access, expires_at)
+        self._access_cache = {}
+        # user_id -> (user_name, language_code) last written to the users table
+        self._profiles = {}
+        # user_id -> last activity not yet written to the users table
+        self._pending_last_active = {}
+        self._flush_lock = threading.Lock()
+        self._listener_thread = None
+        self._flusher_thread = None
+        self._stop_listener = threading.Event()
+        self._stop_flusher = threading.Event()
 
     def check_user_access(self, user_id):
-        return self.db_service.check_user_access(user_id)
+        now = time.monotonic()
+        with self._lock:
+            cached = self._access_cache.get(user_id)
+        if cached and cached[1] > now:
+            return cached[0]
+
+        access = self.db_service.check_user_access(user_id)
+        with self._lock:
+            self._access_cache[user_id] = (access, now + self.cache_ttl)
+        return access
 
     def save_user_info(self, user_id, user_name, language_code):
+        # Only upsert when the profile actually changed since the last write
+        fingerprint = (user_name, language_code)
+        with self._lock:
+            if self._profiles.get(user_id) == fingerprint:
+                return
         self.db_service.save_user_info(user_id, user_name, language_code)
+        with self._lock:
+            self._profiles[user_id] = fingerprint
 
     def update_last_active(self, user_id):
-        self.db_service.update_last_active(user_id)
+        # Collected in memory and written in bulk by flush_last_active
+        with self._lock:
+            self._pending_last_active[user_id] = datetime.utcnow()
+
+    def flush_last_active(self):
+        """Write all pending last_active timestamps in a single UPDATE."""
+        with self._flush_lock:
+            with self._lock:
+                pending = self._pending_last_active
+                self._pending_last_active = {}
+            if not pending:
+                return 0
+            if not self.db_service.bulk_update_last_active(list(pending.items())):
+                # Keep the timestamps for the next attempt unless newer ones arrived
+                with self._lock:
+                    for user_id, last_active in pending.items():
+                        self._pending_last_active.setdefault(user_id, last_active)
+                return 0
+            return len(pending)
+
+    def start_last_active_flusher(self):
+        """Flush last_active timestamps every flush_interval seconds."""
+        if self._flusher_thread and self._flusher_thread.is_alive():
+            return
+        self._stop_flusher.clear()
+        self._flusher_thread = threading.Thread(
+            target=self._flush_periodically,
+            name="auth-last-active-flusher",
+            daemon=True,
+        )
+        self._flusher_thread.start()
+
+    def _flush_periodically(self):
+        while not self._stop_flusher.wait(self.flush_interval):
+            try:
+                self.flush_last_active()
+            except Exception as e:
+                logging.error(f"Error flushing last_active: {e}")
 
     def grant_access(self, user_id):
         self.db_service.grant_access(user_id)
+        self.invalidate(user_id)
+
+    def invalidate(self, user_id=None):
+        """Drop cached access decisions for one user, or for everybody."""
+        with self._lock:
+            if user_id is None:
+                self._access_cache.clear()
+            else:
+                self._access_cache.pop(user_id, None)
+
+    def start_access_listener(self):
+        """Invalidate cached decisions when another process grants access."""
+        if not self.db_service.supports_notifications:
+            return
+        if self._listener_thread and self._listener_thread.is_alive():
+            return
+        self._stop_listener.clear()
+        self._listener_thread = threading.Thread(
+            target=self._listen_for_access_changes,
+            name="auth-access-listener",
+            daemon=True,
+        )
+        self._listener_thread.start()
+
+    def _listen_for_access_changes(self):
+        while not self._stop_listener.is_set():
+            try:
+                connection = self.db_service.listen(ACCESS_CHANGES_CHANNEL)
+            except Exception as e:
+                logging.error(f"Error subscribing to access changes: {e}")
+                self._stop_listener.wait(self.cache_ttl)
+                continue
+
+            # Notifications may have been missed while we were disconnected
+            self.invalidate()
+            try:
+                while not self._stop_listener.is_set():
+                    if select.select([connection], [], [], 5) == ([], [], []):
+                        continue
+                    connection.poll()
+                    while connection.notifies:
+                        notify = connection.notifies.pop(0)
+                        try:
+                            self.invalidate(int(notify.payload))
+                        except ValueError:
+                            self.invalidate()
+            except Exception as e:
+                logging.error(f"Access listener connection lost: {e}")
+            finally:
+                connection.close()
 
     def close(self):
+        self._stop_listener.set()
+        self._stop_flusher.set()
+        if self._flusher_thread:
+            self._flusher_thread.join()
+        # Final flush so no activity is lost at shutdown
+        self.flush_last_active()
         self.db_service.close()
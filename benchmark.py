@@ -0,0 +1,130 @@
+# benchmark.py
+"""Offline benchmark of LLMService ingestion and query paths.
+
+    python benchmark.py --files 60 --paragraphs 40 --queries 50 --json results.json
+
+Documents come from corpus_generator and the OpenAI clients are replaced by
+fake_backends, so no network is needed and runs are comparable release over
+release. Latency flags make the fakes behave like slower real APIs.
+"""
+
+import argparse
+import json
+import os
+import resource
+import statistics
+import sys
+import tempfile
+import time
+
+import corpus_generator
+import fake_backends
+import llm_service
+from dir_cache import directory_cache
+from helpers import percentile
+from llm_service import LLMService
+
+QUESTIONS = (
+    "Who approved the facade mock-up?",
+    "When was the roof drainage layout inspected?",
+    "What happened to the level 3 slab pour?",
+    "Which consultant priced the fire strategy?",
+    "Summarise the status of the landscape tender.",
+)
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process so far."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def timed(func, *args, **kwargs):
+    started = time.perf_counter()
+    result = func(*args, **kwargs)
+    return result, time.perf_counter() - started
+
+
+def forget_indexes(folder_path):
+    """Drop in-memory state so the next load reads the disk cache."""
+    LLMService._indexes.pop(folder_path, None)
+    LLMService._token_counts.pop(folder_path, None)
+
+
+def run(args, corpus_path):
+    results = {"files": len(directory_cache.get_snapshot(corpus_path).valid_files)}
+
+    service = LLMService()
+    status, seconds = timed(service.load_and_index_documents, corpus_path)
+    if status != "Documents successfully indexed.":
+        raise RuntimeError(status)
+    results["chunks"] = service.vector_store.index.ntotal
+    results["index_cold_s"] = seconds
+    results["files_per_s"] = results["files"] / seconds
+    results["chunks_per_s"] = results["chunks"] / seconds
+
+    forget_indexes(corpus_path)
+    _, results["index_from_disk_s"] = timed(LLMService().load_and_index_documents, corpus_path)
+
+    forget_indexes(corpus_path)
+    tokens, results["count_tokens_cold_s"] = timed(service.count_tokens_in_context, corpus_path)
+    _, results["count_tokens_cached_s"] = timed(service.count_tokens_in_context, corpus_path)
+    results["context_tokens"] = tokens
+
+    for name, method in (
+        ("query", lambda question: service.generate_response(question, [])),
+        ("query_pipelined", lambda question: service.generate_response_pipelined(question, list)),
+    ):
+        latencies = []
+        for index in range(args.queries):
+            _, seconds = timed(method, QUESTIONS[index % len(QUESTIONS)])
+            latencies.append(seconds)
+        results[f"{name}_p50_s"] = statistics.median(latencies)
+        results[f"{name}_p95_s"] = percentile(latencies, 0.95)
+
+    results["peak_rss_mb"] = peak_rss_mb()
+    return results
+
+
+def print_results(results):
+    width = max(len(name) for name in results)
+    for name, value in results.items():
+        if isinstance(value, float):
+            print(f"{name:<{width}}  {value:.4f}")
+        else:
+            print(f"{name:<{width}}  {value}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--corpus", help="Existing folder to index instead of a generated corpus")
+    parser.add_argument("--files", type=int, default=30)
+    parser.add_argument("--paragraphs", type=int, default=40, help="Filler paragraphs per file")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--queries", type=int, default=20)
+    parser.add_argument("--chat-latency", type=float, default=0.0, help="Seconds per chat call")
+    parser.add_argument("--embedding-latency", type=float, default=0.0, help="Seconds per embeddings call")
+    parser.add_argument("--json", help="Also write the results to this file")
+    args = parser.parse_args()
+
+    fake_backends.install(chat_latency=args.chat_latency, embedding_latency=args.embedding_latency)
+    with tempfile.TemporaryDirectory() as workdir:
+        corpus_path = args.corpus or os.path.join(workdir, "corpus")
+        if not args.corpus:
+            corpus_generator.generate_corpus(corpus_path, args.files, args.paragraphs, seed=args.seed)
+        # Keep the real index cache untouched
+        llm_service.INDEX_CACHE_DIR = os.path.join(workdir, "index_cache")
+        try:
+            results = run(args, corpus_path)
+        finally:
+            fake_backends.uninstall()
+
+    print_results(results)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -11,9 +11,20 @@ from telegram.ext import (
 )
 from telegram.error import BadRequest
 
-from settings import TELEGRAM_TOKEN
+from settings import (
+    TELEGRAM_TOKEN,
+    DB_BACKEND,
+    BOT_MODE,
+    WEBHOOK_URL,
+    WEBHOOK_LISTEN,
+    WEBHOOK_PORT,
+    WEBHOOK_PATH,
+    WEBHOOK_SECRET_TOKEN,
+)
+from update_processor import PerUserUpdateProcessor
 from llm_service import LLMService
 from db_service import DatabaseService
+from archive_service import ArchiveService
 from handlers import (
     BotHandlers,
     WAITING_FOR_FOLDER_PATH,
@@ -29,12 +40,44 @@ from exception_handlers import (
 def main():
     logging.basicConfig(level=logging.INFO)
 
+    # Apply idempotent schema changes before serving updates
+    db_service = DatabaseService()
+    db_service.ensure_schema()
+    db_service.close()
+
+    # Make sure the upcoming monthly log partitions exist
+    if DB_BACKEND == "postgres":
+        # Partition maintenance must not keep the bot from starting
+        try:
+            archive_service = ArchiveService()
+            try:
+                archive_service.ensure_partitions()
+            finally:
+                archive_service.close()
+        except Exception as e:
+            logging.error(f"Error ensuring log partitions: {e}")
+
     handlers = BotHandlers()
 
     application = (
-        ApplicationBuilder().token(TELEGRAM_TOKEN).post_init(handlers.post_init).build()
+        ApplicationBuilder()
+        .token(TELEGRAM_TOKEN)
+        .concurrent_updates(PerUserUpdateProcessor())
+        .post_init(handlers.post_init)
+        .post_shutdown(handlers.post_shutdown)
+        .build()
     )
 
+    add_handlers(application, handlers)
+
+    if BOT_MODE == "webhook":
+        run_webhook(application)
+    else:
+        application.run_polling()
+
+
+def add_handlers(application, handlers):
+    """Route updates to BotHandlers; shared with loadtest_harness."""
     folder_conv_handler = ConversationHandler(
         entry_points=[
             CommandHandler("folder", handlers.folder),
@@ -83,6 +126,8 @@ def main():
     # Handlers for access control
     application.add_handler(CommandHandler("request_access", handlers.request_access))
     application.add_handler(CommandHandler("grant_access", handlers.grant_access))
+    application.add_handler(CommandHandler("usage_report", handlers.usage_report))
+    application.add_handler(CommandHandler("runtime_stats", handlers.runtime_stats))
 
     application.add_handler(
         MessageHandler(filters.TEXT & ~filters.COMMAND, handlers.handle_message)
@@ -90,7 +135,23 @@ def main():
 
     application.add_error_handler(error_handler)
 
-    application.run_polling()
+
+def run_webhook(application):
+    """Serve updates through the built-in webhook server.
+
+    Requests without the configured secret token are rejected by the server.
+    SIGINT/SIGTERM stop it gracefully, running post_shutdown.
+    """
+    if not WEBHOOK_URL or not WEBHOOK_SECRET_TOKEN:
+        raise ValueError("Webhook mode requires WEBHOOK_URL and WEBHOOK_SECRET_TOKEN.")
+
+    application.run_webhook(
+        listen=WEBHOOK_LISTEN,
+        port=WEBHOOK_PORT,
+        url_path=WEBHOOK_PATH,
+        webhook_url=f"{WEBHOOK_URL.rstrip('/')}/{WEBHOOK_PATH}",
+        secret_token=WEBHOOK_SECRET_TOKEN,
+    )
 
 
 if __name__ == "__main__":
@@ -0,0 +1,13 @@
+# conftest.py
+
+import os
+import tempfile
+
+# Run the suite against the embedded SQLite backend unless a backend is
+# chosen explicitly, so no Postgres server is needed.
+os.environ.setdefault("DB_BACKEND", "sqlite")
+os.environ.setdefault(
+    "SQLITE_PATH", os.path.join(tempfile.mkdtemp(prefix="ask_andrew_bot_"), "test.sqlite3")
+)
+# Clients are constructed in tests but never reach the API
+os.environ.setdefault("OPENAI_API_KEY", "test-key")
@@ -0,0 +1,117 @@
+# conversation_history.py
+
+import asyncio
+import logging
+import threading
+
+from langchain.schema import SystemMessage
+from langchain_core.output_parsers import StrOutputParser
+from langchain_core.prompts import ChatPromptTemplate
+
+from settings import (
+    CHAT_HISTORY_LEVEL,
+    CONVERSATION_SUMMARIES,
+    HISTORY_VERBATIM_CONVERSATIONS,
+    SUMMARY_BATCH_CONVERSATIONS,
+    SUMMARY_MAX_WORDS,
+)
+from helpers import messages_to_langchain_messages
+from llm_clients import get_stage_model
+from metrics import detached_context
+
+SUMMARY_PROMPT = ChatPromptTemplate.from_messages(
+    [
+        (
+            "system",
+            "You maintain a running summary of a user's conversation with a project "
+            "assistant for design and construction projects. Keep facts, decisions, "
+            "project and document names and open questions the user may refer to "
+            "later. Reply with the updated summary only, at most {max_words} words.",
+        ),
+        ("user", "Current summary:\n{summary}\n\nNew conversation turns:\n{turns}"),
+    ]
+)
+
+
+class ConversationHistory:
+    """Chat history for prompts: a rolling summary plus the latest conversations.
+
+    Conversations newer than the summary are passed verbatim. Once more than
+    ``verbatim + batch`` of them pile up, all but the latest ``verbatim`` are
+    folded into the summary, so prompt size stays bounded however long a
+    user keeps chatting.
+    """
+
+    def __init__(self, verbatim=HISTORY_VERBATIM_CONVERSATIONS, batch=SUMMARY_BATCH_CONVERSATIONS):
+        self.verbatim = verbatim
+        self.batch = batch
+        self._lock = threading.Lock()
+        self._refreshing = set()
+        self._background_tasks = set()
+
+    def load(self, db_service, user_id):
+        """Chat history of the user as langchain messages."""
+        if not CONVERSATION_SUMMARIES:
+            chat_history_texts = db_service.get_chat_history(CHAT_HISTORY_LEVEL, user_id)
+            return messages_to_langchain_messages(chat_history_texts)
+
+        summary_row = db_service.get_conversation_summary(user_id)
+        summary, summarized_until = summary_row if summary_row else ("", None)
+
+        conversations = db_service.get_conversations(
+            user_id, after=summarized_until, limit=CHAT_HISTORY_LEVEL
+        )
+        chat_history = []
+        if summary:
+            chat_history.append(SystemMessage(content=f"Summary of the earlier conversation: {summary}"))
+        for _, chat_history_texts in conversations:
+            chat_history.extend(messages_to_langchain_messages(chat_history_texts))
+        return chat_history
+
+    def refresh(self, db_service, user_id):
+        """Fold conversations that left the verbatim window into the summary.
+
+        Returns True if the summary was updated.
+        """
+        summary_row = db_service.get_conversation_summary(user_id)
+        summary, summarized_until = summary_row if summary_row else ("", None)
+
+        conversations = db_service.get_conversations(user_id, after=summarized_until)
+        if len(conversations) < self.verbatim + self.batch:
+            return False
+
+        to_summarize = conversations[:len(conversations) - self.verbatim]
+        turns = "\n".join(
+            text for _, chat_history_texts in to_summarize for text in chat_history_texts
+        )
+        chain = SUMMARY_PROMPT | get_stage_model("summarization") | StrOutputParser()
+        new_summary = chain.invoke(
+            {"summary": summary or "(none)", "turns": turns, "max_words": SUMMARY_MAX_WORDS}
+        )
+        db_service.save_conversation_summary(user_id, new_summary.strip(), to_summarize[-1][0])
+        return True
+
+    def schedule_refresh(self, db_service, user_id):
+        """Refresh the user's summary in the background, one refresh per user at a time."""
+        if not CONVERSATION_SUMMARIES:
+            return
+        with self._lock:
+            if user_id in self._refreshing:
+                return
+            self._refreshing.add(user_id)
+        # Outlives the update, so it must not write into the update's timings
+        task = asyncio.create_task(
+            self._refresh_in_background(db_service, user_id), context=detached_context()
+        )
+        # Keep a reference until the task finishes
+        self._background_tasks.add(task)
+        task.add_done_callback(self._background_tasks.discard)
+
+    async def _refresh_in_background(self, db_service, user_id):
+        try:
+            await asyncio.to_thread(self.refresh, db_service, user_id)
+        except Exception as e:
+            logging.error(f"Error updating conversation summary for user {user_id}: {e}")
+        finally:
+            with self._lock:
+                self._refreshing.discard(user_id)
@@ -0,0 +1,140 @@
+# corpus_generator.py
+"""Generate synthetic project folders with PDF, DOCX and XLSX documents.
+
+    python corpus_generator.py corpus --files 30 --paragraphs 40 --seed 1
+
+Text is drawn from a construction-project vocabulary with a fixed seed, so
+the same arguments always produce the same documents. Every document also
+contains numbered facts ("Fact <n>: ...") that retrieval evaluations can
+ask about.
+"""
+
+import argparse
+import os
+import random
+
+import fitz
+import pandas as pd
+from docx import Document as DocxDocument
+
+VOCABULARY = (
+    "architect structural facade concrete steel timber foundation slab column beam "
+    "roof drainage permit zoning contractor subcontractor schedule deadline budget "
+    "invoice variation drawing revision specification tender site inspection safety "
+    "handover milestone meeting minutes client consultant mechanical electrical "
+    "plumbing fire acoustic insulation glazing landscape survey geotechnical "
+    "excavation formwork reinforcement curing waterproofing balcony staircase lift "
+    "corridor lobby parking ventilation lighting finishes tiles paint ceiling "
+    "approval authority compliance risk delay claim warranty defect snagging"
+).split()
+
+SUBJECTS = ("The contractor", "The architect", "The client", "The structural engineer", "The site manager")
+ACTIONS = ("approved", "rejected", "requested a revision of", "scheduled", "inspected", "priced")
+OBJECTS = (
+    "the facade mock-up", "the roof drainage layout", "the level 3 slab pour",
+    "the lift shaft formwork", "the fire strategy", "the landscape tender",
+    "the glazing samples", "the parking ventilation design",
+)
+DAYS = ("Monday", "Tuesday", "Wednesday", "Thursday", "Friday")
+
+
+def fact(number, rng):
+    """A checkable statement with a unique number."""
+    return (
+        f"Fact {number}: {rng.choice(SUBJECTS)} {rng.choice(ACTIONS)} "
+        f"{rng.choice(OBJECTS)} on {rng.choice(DAYS)} in week {rng.randint(1, 52)}."
+    )
+
+
+def paragraph(rng, words=60):
+    text = " ".join(rng.choice(VOCABULARY) for _ in range(words))
+    return text[0].upper() + text[1:] + "."
+
+
+def document_paragraphs(rng, paragraphs, fact_numbers):
+    """Filler paragraphs with the given facts spread between them."""
+    texts = [paragraph(rng) for _ in range(paragraphs)]
+    for number in fact_numbers:
+        texts.insert(rng.randint(0, len(texts)), fact(number, rng))
+    return texts
+
+
+def write_pdf(path, texts, paragraphs_per_page=8):
+    document = fitz.open()
+    for start in range(0, len(texts), paragraphs_per_page):
+        page = document.new_page()
+        page.insert_textbox(
+            fitz.Rect(50, 50, page.rect.width - 50, page.rect.height - 50),
+            "\n\n".join(texts[start:start + paragraphs_per_page]),
+            fontsize=9,
+        )
+    document.save(path)
+    document.close()
+
+
+def write_docx(path, texts):
+    document = DocxDocument()
+    for text in texts:
+        document.add_paragraph(text)
+    document.save(path)
+
+
+def write_xlsx(path, texts, rng):
+    rows = [
+        {
+            "item": index + 1,
+            "description": text,
+            "cost": rng.randint(100, 100000),
+            "status": rng.choice(("open", "closed", "pending")),
+        }
+        for index, text in enumerate(texts)
+    ]
+    pd.DataFrame(rows).to_excel(path, index=False)
+
+
+def generate_corpus(folder_path, files=30, paragraphs=40, facts_per_file=3, seed=1):
+    """Write ``files`` documents, rotating PDF, DOCX and XLSX.
+
+    Returns {fact number: (file name, fact text)} for every fact written.
+    """
+    os.makedirs(folder_path, exist_ok=True)
+    rng = random.Random(seed)
+    facts = {}
+    writers = (".pdf", ".docx", ".xlsx")
+    for index in range(files):
+        extension = writers[index % len(writers)]
+        file_name = f"document_{index:04d}{extension}"
+        path = os.path.join(folder_path, file_name)
+
+        fact_numbers = list(range(index * facts_per_file + 1, (index + 1) * facts_per_file + 1))
+        fact_rng = random.Random(seed * 100003 + index)
+        texts = document_paragraphs(fact_rng, paragraphs, fact_numbers)
+        for text in texts:
+            if text.startswith("Fact "):
+                facts[int(text.split(":")[0].split()[1])] = (file_name, text)
+
+        if extension == ".pdf":
+            write_pdf(path, texts)
+        elif extension == ".docx":
+            write_docx(path, texts)
+        else:
+            # Spreadsheets hold shorter rows than text documents
+            write_xlsx(path, texts, fact_rng)
+    return facts
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("folder", help="Output folder")
+    parser.add_argument("--files", type=int, default=30)
+    parser.add_argument("--paragraphs", type=int, default=40, help="Filler paragraphs per file")
+    parser.add_argument("--facts-per-file", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    facts = generate_corpus(args.folder, args.files, args.paragraphs, args.facts_per_file, args.seed)
+    print(f"Wrote {args.files} files with {len(facts)} facts to {args.folder}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,16 @@
 # db_service.py
 import os
+import json
+import weakref
+from abc import ABC, abstractmethod
 import psycopg2
-from datetime import datetime
+from psycopg2.extras import execute_values
+from datetime import datetime, date, timedelta
 from dotenv import load_dotenv
 from collections import defaultdict
 
+from settings import ACCESS_CHANGES_CHANNEL, HISTORY_LOOKBACK_DAYS, DB_BACKEND
+
 
 load_dotenv()
 db_password = os.getenv("DB_PASSWORD")
@@ -13,8 +19,197 @@ db_user = os.getenv("DB_USER")
 db_name = os.getenv("DB_NAME")
 db_port = os.getenv("DB_PORT")
 
+# Idempotent schema changes applied by DatabaseService.ensure_schema at startup
+SCHEMA_MIGRATIONS = [
+    """
+    ALTER TABLE exceptions
+        ADD COLUMN IF NOT EXISTS fingerprint TEXT,
+        ADD COLUMN IF NOT EXISTS occurrence_count INTEGER NOT NULL DEFAULT 1,
+        ADD COLUMN IF NOT EXISTS last_occurred_at TIMESTAMP
+    """,
+    "CREATE INDEX IF NOT EXISTS exceptions_fingerprint_idx ON exceptions (fingerprint)",
+    # Seconds per stage of the logged update, see metrics.span
+    "ALTER TABLE event_log ADD COLUMN IF NOT EXISTS timings JSONB",
+    """
+    CREATE TABLE IF NOT EXISTS telegram_file_cache (
+        file_path TEXT PRIMARY KEY,
+        file_size BIGINT NOT NULL,
+        file_mtime DOUBLE PRECISION NOT NULL,
+        file_id TEXT NOT NULL,
+        updated_at TIMESTAMP NOT NULL DEFAULT now()
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS token_usage (
+        day DATE NOT NULL,
+        user_id BIGINT NOT NULL,
+        project TEXT NOT NULL,
+        model TEXT NOT NULL,
+        requests INTEGER NOT NULL DEFAULT 0,
+        prompt_tokens BIGINT NOT NULL DEFAULT 0,
+        completion_tokens BIGINT NOT NULL DEFAULT 0,
+        cached_tokens BIGINT NOT NULL DEFAULT 0,
+        embedding_tokens BIGINT NOT NULL DEFAULT 0,
+        PRIMARY KEY (day, user_id, project, model)
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS conversation_summaries (
+        user_id BIGINT PRIMARY KEY,
+        summary TEXT NOT NULL,
+        summarized_until TIMESTAMP NOT NULL,
+        updated_at TIMESTAMP NOT NULL DEFAULT now()
+    )
+    """,
+]
+
+
+def get_backend_class(backend):
+    if backend == "postgres":
+        return PostgresDatabaseService
+    if backend == "sqlite":
+        from sqlite_db_service import SQLiteDatabaseService
+
+        return SQLiteDatabaseService
+    raise ValueError(f"Unknown database backend: {backend}")
+
+
+class DatabaseService(ABC):
+    """Storage interface used by the bot.
+
+    ``DatabaseService()`` returns an instance of the backend selected by the
+    DB_BACKEND setting, so callers never pick an implementation themselves.
+    Backends must implement every abstract method; a missing one fails when
+    the service is created.
+    """
+
+    # Whether listen() can deliver notifications from other processes
+    supports_notifications = False
+    # Services of this process; each one holds its own connection
+    _instances = weakref.WeakSet()
+
+    def __new__(cls, *args, **kwargs):
+        if cls is DatabaseService:
+            cls = get_backend_class(DB_BACKEND)
+        instance = super().__new__(cls)
+        DatabaseService._instances.add(instance)
+        return instance
+
+    @classmethod
+    def open_connections(cls):
+        """Connections currently held by services of this process."""
+        return len(DatabaseService._instances)
+
+    @abstractmethod
+    def ensure_schema(self):
+        raise NotImplementedError
+
+    @abstractmethod
+    def save_folder(self, user_id, user_name, folder):
+        raise NotImplementedError
+
+    @abstractmethod
+    def get_last_folder(self, user_id):
+        raise NotImplementedError
+
+    @abstractmethod
+    def save_event_log(self, user_id, event_type, user_message, system_response, conversation_id, timestamp=None, timings=None):
+        raise NotImplementedError
+
+    @abstractmethod
+    def log_exception(
+        self,
+        exception_id,
+        exception_type,
+        exception_message,
+        stack_trace,
+        occurred_at,
+        user_id,
+        data_context,
+        resolved,
+        resolved_at=None,
+        resolver_notes=None,
+        fingerprint=None,
+        occurrence_count=1,
+    ):
+        raise NotImplementedError
+
+    @abstractmethod
+    def add_exception_occurrences(self, rows):
+        raise NotImplementedError
+
+    @abstractmethod
+    def save_message(self, conversation_id, sender_type, user_id, message_text):
+        raise NotImplementedError
+
+    @abstractmethod
+    def get_chat_history(self, dialog_numbers, user_id):
+        raise NotImplementedError
+
+    @abstractmethod
+    def get_conversations(self, user_id, after=None, limit=None):
+        raise NotImplementedError
+
+    @abstractmethod
+    def get_conversation_summary(self, user_id):
+        raise NotImplementedError
+
+    @abstractmethod
+    def save_conversation_summary(self, user_id, summary, summarized_until):
+        raise NotImplementedError
+
+    @abstractmethod
+    def add_token_usage(self, rows):
+        raise NotImplementedError
+
+    @abstractmethod
+    def get_token_usage(self, since, user_id=None):
+        raise NotImplementedError
+
+    @abstractmethod
+    def get_cached_file_id(self, file_path, file_size, file_mtime):
+        raise NotImplementedError
+
+    @abstractmethod
+    def save_file_id(self, file_path, file_size, file_mtime, file_id):
+        raise NotImplementedError
+
+    @abstractmethod
+    def delete_file_id(self, file_path):
+        raise NotImplementedError
+
+    @abstractmethod
+    def check_user_access(self, user_id):
+        raise NotImplementedError
+
+    @abstractmethod
+    def save_user_info(self, user_id, user_name, language_code):
+        raise NotImplementedError
+
+    @abstractmethod
+    def update_last_active(self, user_id):
+        raise NotImplementedError
+
+    @abstractmethod
+    def bulk_update_last_active(self, rows):
+        raise NotImplementedError
+
+    @abstractmethod
+    def grant_access(self, user_id):
+        raise NotImplementedError
+
+    def listen(self, channel):
+        # Only backends with supports_notifications
+        raise NotImplementedError
+
+    @abstractmethod
+    def close(self):
+        raise NotImplementedError
+
+
+class PostgresDatabaseService(DatabaseService):
+    supports_notifications = True
 
-class DatabaseService:
     def __init__(self):
         self.dbname = db_name
         self.user = db_user
@@ -33,6 +228,18 @@ class DatabaseService:
             port=self.port,
         )
 
+    def ensure_schema(self):
+        cursor = self.conn.cursor()
+        try:
+            for statement in SCHEMA_MIGRATIONS:
+                cursor.execute(statement)
+            print("Database schema is up to date.")
+        except Exception as e:
+            print(f"Error applying schema migrations: {e}")
+            self.conn.rollback()
+        finally:
+            cursor.close()
+
     def save_folder(self, user_id, user_name, folder):
         try:
             connection = self.connect()
@@ -76,19 +283,19 @@ class DatabaseService:
 
         return folder
 
-    def save_event_log(self, user_id, event_type, user_message, system_response, conversation_id, timestamp=None):
+    def save_event_log(self, user_id, event_type, user_message, system_response, conversation_id, timestamp=None, timings=None):
         try:
             connection = self.connect()
             cursor = connection.cursor()
             if timestamp is None:
                 timestamp = datetime.now()
             query = """
-                INSERT INTO event_log (user_id, event_type, user_message, system_response, conversation_id)
-                VALUES (%s, %s, %s, %s, %s)
+                INSERT INTO event_log (user_id, event_type, user_message, system_response, conversation_id, timings)
+                VALUES (%s, %s, %s, %s, %s, %s)
             """
             cursor.execute(
                 query,
-                (user_id, event_type, user_message, system_response, conversation_id),
+                (user_id, event_type, user_message, system_response, conversation_id, json.dumps(timings) if timings else None),
             )
             connection.commit()
             print("Event log saved successfully.")
@@ -111,13 +318,15 @@ class DatabaseService:
         resolved,
         resolved_at=None,
         resolver_notes=None,
+        fingerprint=None,
+        occurrence_count=1,
     ):
         try:
             connection = self.connect()
             cursor = connection.cursor()
             query = """
-                INSERT INTO exceptions (exception_id, exception_type, exception_message, stack_trace, occurred_at, user_id, data_context, resolved, resolved_at, resolver_notes)
-                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+                INSERT INTO exceptions (exception_id, exception_type, exception_message, stack_trace, occurred_at, user_id, data_context, resolved, resolved_at, resolver_notes, fingerprint, occurrence_count, last_occurred_at)
+                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
             """
             cursor.execute(
                 query,
@@ -132,6 +341,9 @@ class DatabaseService:
                     resolved,
                     resolved_at,
                     resolver_notes,
+                    fingerprint,
+                    occurrence_count,
+                    occurred_at,
                 ),
             )
             connection.commit()
@@ -140,6 +352,29 @@ class DatabaseService:
         except Exception as e:
             print(f"Failed to log exception: {e}")
 
+    def add_exception_occurrences(self, rows):
+        """Bump occurrence counters from (exception_id, count, last_occurred_at) rows."""
+        try:
+            connection = self.connect()
+            cursor = connection.cursor()
+            execute_values(
+                cursor,
+                """
+                UPDATE exceptions
+                SET occurrence_count = exceptions.occurrence_count + v.count,
+                    last_occurred_at = GREATEST(exceptions.last_occurred_at, v.last_occurred_at)
+                FROM (VALUES %s) AS v (exception_id, count, last_occurred_at)
+                WHERE exceptions.exception_id::text = v.exception_id
+                """,
+                rows,
+                template="(%s, %s::integer, %s::timestamp)",
+            )
+            connection.commit()
+            cursor.close()
+            connection.close()
+        except Exception as e:
+            print(f"Failed to update exception counters: {e}")
+
     def save_message(self, conversation_id, sender_type, user_id, message_text):
         try:
             connection = self.connect()
@@ -166,17 +401,20 @@ class DatabaseService:
             connection = self.connect()
             cursor = connection.cursor()
 
+            # Bounding the date lets Postgres prune old message partitions
+            since = date.today() - timedelta(days=HISTORY_LOOKBACK_DAYS)
+
             # Step 1: Get the last 'dialog_numbers' conversation_ids for the user
             query_conversation_ids = """
                 SELECT conversation_id, MAX(date + timestamp) as last_datetime
                 FROM messages
-                WHERE user_id = %s AND sender_type = 'user'
+                WHERE user_id = %s AND sender_type = 'user' AND date >= %s
                 GROUP BY conversation_id
                 ORDER BY last_datetime DESC
                 LIMIT %s
             """
 
-            cursor.execute(query_conversation_ids, (user_id, dialog_numbers))
+            cursor.execute(query_conversation_ids, (user_id, since, dialog_numbers))
             conversation_data = cursor.fetchall()
             conversation_ids = [str(row[0]) for row in conversation_data]
 
@@ -187,10 +425,10 @@ class DatabaseService:
             query_messages = """
                 SELECT conversation_id, sender_type, message_text, date + timestamp as datetime
                 FROM messages
-                WHERE conversation_id = ANY(%s::uuid[])
+                WHERE conversation_id = ANY(%s::uuid[]) AND date >= %s
                 ORDER BY conversation_id, datetime ASC
             """
-            cursor.execute(query_messages, (conversation_ids,))
+            cursor.execute(query_messages, (conversation_ids, since))
             messages = cursor.fetchall()
 
             conversations = defaultdict(list)
@@ -220,6 +458,210 @@ class DatabaseService:
             if connection:
                 connection.close()
 
+    def get_conversations(self, user_id, after=None, limit=None):
+        """Newest ``limit`` conversations whose last user message is later than ``after``.
+
+        Returns (last_datetime, chat_history_texts) tuples, oldest first.
+        """
+        connection = None
+        cursor = None
+        try:
+            connection = self.connect()
+            cursor = connection.cursor()
+
+            since = date.today() - timedelta(days=HISTORY_LOOKBACK_DAYS)
+            cursor.execute(
+                """
+                SELECT conversation_id, MAX(date + timestamp) AS last_datetime
+                FROM messages
+                WHERE user_id = %s AND sender_type = 'user' AND date >= %s
+                GROUP BY conversation_id
+                HAVING %s::timestamp IS NULL OR MAX(date + timestamp) > %s::timestamp
+                ORDER BY last_datetime DESC
+                LIMIT %s
+                """,
+                (user_id, since, after, after, limit)
+            )
+            conversation_data = cursor.fetchall()[::-1]
+            if not conversation_data:
+                return []
+
+            conversation_ids = [str(row[0]) for row in conversation_data]
+            cursor.execute(
+                """
+                SELECT conversation_id, sender_type, message_text
+                FROM messages
+                WHERE conversation_id = ANY(%s::uuid[]) AND date >= %s
+                ORDER BY date + timestamp ASC
+                """,
+                (conversation_ids, since)
+            )
+            conversations = defaultdict(list)
+            for conversation_id, sender_type, message_text in cursor.fetchall():
+                if sender_type == "user":
+                    conversations[str(conversation_id)].append(f"HumanMessage: {message_text}")
+                elif sender_type == "bot":
+                    conversations[str(conversation_id)].append(f"AIMessage: {message_text}")
+
+            return [
+                (last_datetime, conversations.get(str(conversation_id), []))
+                for conversation_id, last_datetime in conversation_data
+            ]
+
+        except Exception as e:
+            print(f"Error reading conversations: {e}")
+            return []
+        finally:
+            if cursor:
+                cursor.close()
+            if connection:
+                connection.close()
+
+    def get_conversation_summary(self, user_id):
+        """(summary, summarized_until) of the user's older conversations, if any."""
+        try:
+            cursor = self.conn.cursor()
+            cursor.execute(
+                "SELECT summary, summarized_until FROM conversation_summaries WHERE user_id = %s",
+                (user_id,)
+            )
+            return cursor.fetchone()
+        except Exception as e:
+            print(f"Error reading conversation summary: {e}")
+            return None
+        finally:
+            cursor.close()
+
+    def save_conversation_summary(self, user_id, summary, summarized_until):
+        try:
+            cursor = self.conn.cursor()
+            cursor.execute(
+                """
+                INSERT INTO conversation_summaries (user_id, summary, summarized_until, updated_at)
+                VALUES (%s, %s, %s, now())
+                ON CONFLICT (user_id) DO UPDATE
+                SET summary = EXCLUDED.summary,
+                    summarized_until = EXCLUDED.summarized_until,
+                    updated_at = EXCLUDED.updated_at
+                """,
+                (user_id, summary, summarized_until)
+            )
+        except Exception as e:
+            print(f"Error saving conversation summary: {e}")
+            self.conn.rollback()
+        finally:
+            cursor.close()
+
+    def add_token_usage(self, rows):
+        """Add (day, user_id, project, model, requests, prompt_tokens, completion_tokens,
+        cached_tokens, embedding_tokens) rows to the daily totals. Returns True on success.
+        """
+        try:
+            connection = self.connect()
+            cursor = connection.cursor()
+            execute_values(
+                cursor,
+                """
+                INSERT INTO token_usage (
+                    day, user_id, project, model, requests, prompt_tokens,
+                    completion_tokens, cached_tokens, embedding_tokens
+                )
+                VALUES %s
+                ON CONFLICT (day, user_id, project, model) DO UPDATE
+                SET requests = token_usage.requests + EXCLUDED.requests,
+                    prompt_tokens = token_usage.prompt_tokens + EXCLUDED.prompt_tokens,
+                    completion_tokens = token_usage.completion_tokens + EXCLUDED.completion_tokens,
+                    cached_tokens = token_usage.cached_tokens + EXCLUDED.cached_tokens,
+                    embedding_tokens = token_usage.embedding_tokens + EXCLUDED.embedding_tokens
+                """,
+                rows,
+            )
+            connection.commit()
+            cursor.close()
+            connection.close()
+            return True
+        except Exception as e:
+            print(f"Failed to save token usage: {e}")
+            return False
+
+    def get_token_usage(self, since, user_id=None):
+        """Token totals since ``since`` as (user_id, project, model, requests, prompt_tokens,
+        completion_tokens, cached_tokens, embedding_tokens) rows.
+        """
+        try:
+            cursor = self.conn.cursor()
+            cursor.execute(
+                """
+                SELECT user_id, project, model, SUM(requests)::bigint, SUM(prompt_tokens)::bigint,
+                       SUM(completion_tokens)::bigint, SUM(cached_tokens)::bigint,
+                       SUM(embedding_tokens)::bigint
+                FROM token_usage
+                WHERE day >= %s AND (%s::bigint IS NULL OR user_id = %s::bigint)
+                GROUP BY user_id, project, model
+                """,
+                (since, user_id, user_id)
+            )
+            return cursor.fetchall()
+        except Exception as e:
+            print(f"Error reading token usage: {e}")
+            return []
+        finally:
+            cursor.close()
+
+    def get_cached_file_id(self, file_path, file_size, file_mtime):
+        """Telegram file_id of an uploaded file, if the file is unchanged since."""
+        try:
+            cursor = self.conn.cursor()
+            cursor.execute(
+                """
+                SELECT file_id FROM telegram_file_cache
+                WHERE file_path = %s AND file_size = %s AND file_mtime = %s
+                """,
+                (file_path, file_size, file_mtime)
+            )
+            result = cursor.fetchone()
+            return result[0] if result else None
+        except Exception as e:
+            print(f"Error reading cached file_id: {e}")
+            return None
+        finally:
+            cursor.close()
+
+    def save_file_id(self, file_path, file_size, file_mtime, file_id):
+        try:
+            cursor = self.conn.cursor()
+            cursor.execute(
+                """
+                INSERT INTO telegram_file_cache (file_path, file_size, file_mtime, file_id, updated_at)
+                VALUES (%s, %s, %s, %s, now())
+                ON CONFLICT (file_path) DO UPDATE
+                SET file_size = EXCLUDED.file_size,
+                    file_mtime = EXCLUDED.file_mtime,
+                    file_id = EXCLUDED.file_id,
+                    updated_at = EXCLUDED.updated_at
+                """,
+                (file_path, file_size, file_mtime, file_id)
+            )
+        except Exception as e:
+            print(f"Error saving file_id: {e}")
+            self.conn.rollback()
+        finally:
+            cursor.close()
+
+    def delete_file_id(self, file_path):
+        try:
+            cursor = self.conn.cursor()
+            cursor.execute(
+                "DELETE FROM telegram_file_cache WHERE file_path = %s",
+                (file_path,)
+            )
+        except Exception as e:
+            print(f"Error deleting file_id: {e}")
+            self.conn.rollback()
+        finally:
+            cursor.close()
+
+
     def check_user_access(self, user_id):
         try:
             cursor = self.conn.cursor()
@@ -275,6 +717,30 @@ class DatabaseService:
         finally:
             cursor.close()
 
+    def bulk_update_last_active(self, rows):
+        """Set last_active for many users at once from (user_id, last_active) rows."""
+        try:
+            cursor = self.conn.cursor()
+            execute_values(
+                cursor,
+                """
+                UPDATE users SET last_active = v.last_active
+                FROM (VALUES %s) AS v (user_id, last_active)
+                WHERE users.user_id = v.user_id
+                """,
+                rows,
+                template="(%s::bigint, %s::timestamp)",
+                page_size=len(rows),
+            )
+            print(f"last_active updated for {len(rows)} users.")
+            return True
+        except Exception as e:
+            print(f"Error updating last_active in bulk: {e}")
+            self.conn.rollback()
+            return False
+        finally:
+            cursor.close()
+
     def grant_access(self, user_id):
         try:
             cursor = self.conn.cursor()
@@ -282,6 +748,11 @@ class DatabaseService:
                 "UPDATE users SET access = True WHERE user_id = %s",
                 (user_id,)
             )
+            # Let other bot processes drop their cached access decision
+            cursor.execute(
+                "SELECT pg_notify(%s, %s)",
+                (ACCESS_CHANGES_CHANNEL, str(user_id))
+            )
             print(f"Access granted to user {user_id}.")
         except Exception as e:
             print(f"Error granting access: {e}")
@@ -289,6 +760,16 @@ class DatabaseService:
         finally:
             cursor.close()
 
+    def listen(self, channel):
+        """Open a dedicated connection subscribed to a NOTIFY channel."""
+        connection = self.connect()
+        connection.autocommit = True
+        cursor = connection.cursor()
+        cursor.execute(f'LISTEN "{channel}"')
+        cursor.close()
+        return connection
+
     def close(self):
         self.conn.close()
+        DatabaseService._instances.discard(self)
 
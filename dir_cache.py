@@ -0,0 +1,164 @@
+# dir_cache.py
+
+import hashlib
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from settings import (
+    VALID_FILE_EXTENSIONS,
+    DIR_SCAN_REFRESH_INTERVAL,
+    DIR_SCAN_IDLE_SECONDS,
+    DIR_SCAN_MAX_FOLDERS,
+)
+
+
+class FolderSnapshot:
+    """File listing of one folder with the size and mtime of every file."""
+
+    def __init__(self, folder_path, entries):
+        self.folder_path = folder_path
+        # file name -> (size, mtime)
+        self.entries = entries
+        self.scanned_at = time.time()
+        self.valid_files = sorted(
+            name for name in entries if name.endswith(VALID_FILE_EXTENSIONS)
+        )
+        self.fingerprint = hashlib.sha1(
+            "\n".join(
+                f"{name}|{entries[name][0]}|{entries[name][1]}" for name in self.valid_files
+            ).encode("utf-8")
+        ).hexdigest()
+
+    def stat(self, file_name):
+        return self.entries.get(file_name)
+
+
+def scan_folder(folder_path):
+    entries = {}
+    with os.scandir(folder_path) as it:
+        for entry in it:
+            if not entry.is_file():
+                continue
+            # On Windows shares scandir already carries the stat data
+            stat = entry.stat()
+            entries[entry.name] = (stat.st_size, stat.st_mtime)
+    return FolderSnapshot(folder_path, entries)
+
+
+class DirectoryScanCache:
+    """Cached listings of document folders on slow (network) drives.
+
+    Handlers read valid-file lists from memory. A background thread rescans
+    every known folder each ``refresh_interval`` seconds. Folders unused
+    for ``idle_seconds`` are dropped instead, as are the least recently
+    used ones beyond ``max_folders``. Snapshot
+    fingerprints change whenever a valid file is added, removed or modified.
+    Indexing uses them to detect changes.
+    """
+
+    def __init__(self, refresh_interval=DIR_SCAN_REFRESH_INTERVAL,
+                 idle_seconds=DIR_SCAN_IDLE_SECONDS, max_folders=DIR_SCAN_MAX_FOLDERS):
+        self.refresh_interval = refresh_interval
+        self.idle_seconds = idle_seconds
+        self.max_folders = max_folders
+        self._lock = threading.Lock()
+        # folder_path -> snapshot, least recently used first
+        self._snapshots = OrderedDict()
+        # folder_path -> time.monotonic() of the last use by a handler
+        self._last_used = {}
+        self._refresher_thread = None
+        self._stop_refresher = threading.Event()
+        self.hits = 0
+        self.misses = 0
+
+    def is_dir(self, folder_path):
+        with self._lock:
+            if folder_path in self._snapshots:
+                self._touch(folder_path)
+                return True
+        return os.path.isdir(folder_path)
+
+    def get_snapshot(self, folder_path):
+        with self._lock:
+            snapshot = self._snapshots.get(folder_path)
+            if snapshot is not None:
+                self.hits += 1
+                self._touch(folder_path)
+                return snapshot
+            self.misses += 1
+        return self.refresh(folder_path)
+
+    def valid_files(self, folder_path):
+        return list(self.get_snapshot(folder_path).valid_files)
+
+    def refresh(self, folder_path):
+        snapshot = scan_folder(folder_path)
+        with self._lock:
+            self._snapshots[folder_path] = snapshot
+            self._touch(folder_path)
+            while len(self._snapshots) > self.max_folders:
+                evicted, _ = self._snapshots.popitem(last=False)
+                self._last_used.pop(evicted, None)
+        return snapshot
+
+    def invalidate(self, folder_path):
+        with self._lock:
+            self._snapshots.pop(folder_path, None)
+            self._last_used.pop(folder_path, None)
+
+    def _touch(self, folder_path):
+        # Callers hold self._lock
+        self._snapshots.move_to_end(folder_path)
+        self._last_used[folder_path] = time.monotonic()
+
+    def evict_idle(self):
+        """Drop folders no handler has used for idle_seconds; returns them."""
+        cutoff = time.monotonic() - self.idle_seconds
+        with self._lock:
+            idle = [folder for folder, used in self._last_used.items() if used < cutoff]
+            for folder_path in idle:
+                self._snapshots.pop(folder_path, None)
+                self._last_used.pop(folder_path, None)
+        return idle
+
+    def start(self):
+        """Refresh known folders in the background."""
+        if self._refresher_thread and self._refresher_thread.is_alive():
+            return
+        self._stop_refresher.clear()
+        self._refresher_thread = threading.Thread(
+            target=self._refresh_periodically,
+            name="directory-scan-refresher",
+            daemon=True,
+        )
+        self._refresher_thread.start()
+
+    def stop(self):
+        self._stop_refresher.set()
+
+    def _refresh_periodically(self):
+        while not self._stop_refresher.wait(self.refresh_interval):
+            self.evict_idle()
+            with self._lock:
+                folders = list(self._snapshots)
+            for folder_path in folders:
+                try:
+                    self._rescan(folder_path)
+                except OSError as e:
+                    # Folder was removed or the share is unavailable
+                    logging.warning(f"Error rescanning {folder_path}: {e}")
+                    self.invalidate(folder_path)
+
+
+    def _rescan(self, folder_path):
+        """Background refresh; does not count as a use or revive a dropped folder."""
+        snapshot = scan_folder(folder_path)
+        with self._lock:
+            if folder_path in self._snapshots:
+                self._snapshots[folder_path] = snapshot
+
+
+directory_cache = DirectoryScanCache()
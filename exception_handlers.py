@@ -1,16 +1,164 @@
 # exception_handlers.py
-import os
+import asyncio
+import hashlib
 import logging
+import os
+import threading
+import time
 import traceback  # Added missing import
+import uuid
 from telegram import Update
 from telegram.ext import ContextTypes
 
 from datetime import datetime
-from dotenv import load_dotenv
 from db_service import DatabaseService
+from settings import (
+    EXCEPTION_WINDOW_SECONDS,
+    EXCEPTION_MAX_INSERTS_PER_WINDOW,
+    EXCEPTION_CONTEXT_MAX_CHARS,
+)
+
+
+def exception_fingerprint(error):
+    """Stable id for an exception: its type plus the functions on its stack."""
+    frames = traceback.extract_tb(error.__traceback__) if error.__traceback__ else []
+    signature = [type(error).__name__] + [
+        f"{os.path.basename(frame.filename)}:{frame.name}" for frame in frames
+    ]
+    return hashlib.sha1("|".join(signature).encode("utf-8")).hexdigest()
+
+
+def capture_context(update, max_chars=EXCEPTION_CONTEXT_MAX_CHARS):
+    """Summarize the update that failed without serializing all of it."""
+    if not update:
+        return "No update available"
+
+    if isinstance(update, Update):
+        message = update.effective_message
+        data = {
+            "update_id": update.update_id,
+            "chat_id": update.effective_chat.id if update.effective_chat else None,
+            "message_text": message.text if message else None,
+            "callback_data": update.callback_query.data if update.callback_query else None,
+        }
+        data_context = str(data)
+    else:
+        data_context = str(update)
+
+    if len(data_context) > max_chars:
+        data_context = data_context[:max_chars] + "...[truncated]"
+    return data_context
+
+
+class ExceptionTracker:
+    """Groups exceptions by fingerprint so error storms cost bounded I/O.
+
+    The first occurrence of a fingerprint in a window is inserted, further
+    occurrences only bump a counter that is written when the window closes.
+    At most ``max_inserts`` rows are inserted per window.
+    """
+
+    def __init__(
+        self,
+        window_seconds=EXCEPTION_WINDOW_SECONDS,
+        max_inserts=EXCEPTION_MAX_INSERTS_PER_WINDOW,
+    ):
+        self.window_seconds = window_seconds
+        self.max_inserts = max_inserts
+        self._db_service = None
+        self._lock = threading.Lock()
+        self._window_started = time.monotonic()
+        self._inserts_in_window = 0
+        self._suppressed = 0
+        # fingerprint -> {"exception_id", "pending", "last_occurred_at"}
+        self._groups = {}
 
-# Initialize the DatabaseService
-db_service = DatabaseService()
+    @property
+    def db_service(self):
+        # Connect on first use rather than at import time
+        if self._db_service is None:
+            self._db_service = DatabaseService()
+        return self._db_service
+
+    def record(
+        self,
+        exception_type,
+        exception_message,
+        stack_trace,
+        fingerprint,
+        occurred_at,
+        user_id,
+        data_context,
+    ):
+        with self._lock:
+            closed_groups, suppressed = self._roll_window()
+            group = self._groups.get(fingerprint)
+            if group:
+                group["pending"] += 1
+                group["last_occurred_at"] = occurred_at
+                exception_id = None
+            elif self._inserts_in_window >= self.max_inserts:
+                self._suppressed += 1
+                exception_id = None
+            else:
+                exception_id = str(uuid.uuid4())
+                self._groups[fingerprint] = {
+                    "exception_id": exception_id,
+                    "pending": 0,
+                    "last_occurred_at": occurred_at,
+                }
+                self._inserts_in_window += 1
+
+        self._write_counters(closed_groups, suppressed)
+
+        if exception_id:
+            self.db_service.log_exception(
+                exception_id=exception_id,
+                exception_type=exception_type,
+                exception_message=exception_message,
+                stack_trace=stack_trace,
+                occurred_at=occurred_at,
+                user_id=user_id,
+                data_context=data_context,
+                resolved=False,
+                fingerprint=fingerprint,
+            )
+
+    def flush(self):
+        """Write the counters of the current window, e.g. at shutdown."""
+        with self._lock:
+            closed_groups, suppressed = self._close_window()
+        self._write_counters(closed_groups, suppressed)
+
+    def _roll_window(self):
+        if time.monotonic() - self._window_started < self.window_seconds:
+            return [], 0
+        return self._close_window()
+
+    def _close_window(self):
+        closed_groups = [
+            (group["exception_id"], group["pending"], group["last_occurred_at"])
+            for group in self._groups.values()
+            if group["pending"]
+        ]
+        suppressed = self._suppressed
+        self._groups = {}
+        self._suppressed = 0
+        self._inserts_in_window = 0
+        self._window_started = time.monotonic()
+        return closed_groups, suppressed
+
+    def _write_counters(self, closed_groups, suppressed):
+        if suppressed:
+            logging.warning(
+                f"{suppressed} exceptions were not stored: insert limit of "
+                f"{self.max_inserts} per {self.window_seconds}s reached."
+            )
+        if closed_groups:
+            self.db_service.add_exception_occurrences(closed_groups)
+
+
+exception_tracker = ExceptionTracker()
 
 async def error_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Log the error and send a message to notify the developer."""
@@ -22,23 +170,23 @@ async def error_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
     exception_message = str(context.error)
     stack_trace = ''.join(traceback.format_exception(None, context.error, context.error.__traceback__))
     occurred_at = datetime.now()
-    user_id = update.effective_user.id if update and update.effective_user else None
-    data_context = str(update.to_dict()) if update else "No update available"
-    resolved = False
+    user_id = update.effective_user.id if isinstance(update, Update) and update.effective_user else None
+    data_context = capture_context(update)
 
-    # Log the exception to the database
-    db_service.log_exception(
+    # Log the exception to the database without blocking the event loop
+    await asyncio.to_thread(
+        exception_tracker.record,
         exception_type=exception_type,
         exception_message=exception_message,
         stack_trace=stack_trace,
+        fingerprint=exception_fingerprint(context.error),
         occurred_at=occurred_at,
         user_id=user_id,
         data_context=data_context,
-        resolved=resolved,
     )
 
     # Notify the user
-    if update and update.message:
+    if isinstance(update, Update) and update.message:
         await update.message.reply_text("An unexpected error occurred. The support team has been notified.")
 
 def handle_telegram_context_length_exceeded_error(error, user_id, data_context):
@@ -46,15 +194,14 @@ def handle_telegram_context_length_exceeded_error(error, user_id, data_context):
     exception_message = str(error)
     stack_trace = "No stack trace available for context length exceeded."
     occurred_at = datetime.now()
-    resolved = False
 
     # Log the exception to the database
-    db_service.log_exception(
+    exception_tracker.record(
         exception_type=exception_type,
         exception_message=exception_message,
         stack_trace=stack_trace,
+        fingerprint=hashlib.sha1(exception_type.encode("utf-8")).hexdigest(),
         occurred_at=occurred_at,
         user_id=user_id,
-        data_context=data_context,
-        resolved=resolved,
+        data_context=capture_context(data_context),
     )
@@ -0,0 +1,125 @@
+# fake_backends.py
+"""Deterministic stand-ins for the OpenAI chat and embeddings clients.
+
+They run offline with a configurable latency, so benchmarks and load tests
+measure the bot's own overhead. install() routes llm_clients to them and
+uninstall() restores the real clients.
+"""
+
+import hashlib
+import math
+import re
+import time
+from typing import Any, List
+
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+
+import llm_clients
+import llm_usage
+
+_words = re.compile(r"\w+")
+
+
+def _approximate_tokens(text):
+    return len(text) // 4 + 1
+
+
+class FakeChatModel(BaseChatModel):
+    """Answers with the last message it was given, after ``latency`` seconds.
+
+    ``latency_per_token`` adds time per prompt token to mimic long contexts.
+    Responses carry usage metadata like the OpenAI client's.
+    """
+
+    model_name: str = "fake-chat"
+    latency: float = 0.0
+    latency_per_token: float = 0.0
+
+    @property
+    def _llm_type(self):
+        return "fake-chat"
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs: Any):
+        prompt_tokens = sum(_approximate_tokens(str(message.content)) for message in messages)
+        time.sleep(self.latency + self.latency_per_token * prompt_tokens)
+
+        last_message = str(messages[-1].content) if messages else ""
+        if "Classify the user's question" in str(messages[0].content):
+            content = "SIMPLE" if len(last_message) < 60 else "COMPLEX"
+        else:
+            content = f"Answer: {last_message[:200]}"
+        completion_tokens = _approximate_tokens(content)
+        message = AIMessage(
+            content=content,
+            usage_metadata={
+                "input_tokens": prompt_tokens,
+                "output_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens,
+            },
+            response_metadata={"model_name": self.model_name},
+        )
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+
+class HashingEmbeddings(Embeddings):
+    """Bag-of-words vectors via the hashing trick.
+
+    Texts sharing words get similar vectors, so retrieval quality is
+    meaningful without a model. ``latency`` is spent per call and
+    ``latency_per_text`` per embedded text.
+    """
+
+    def __init__(self, size=256, latency=0.0, latency_per_text=0.0, model="fake-embeddings"):
+        self.size = size
+        self.latency = latency
+        self.latency_per_text = latency_per_text
+        self.model = model
+
+    def _embed(self, text):
+        vector = [0.0] * self.size
+        for word in _words.findall(text.lower()):
+            digest = hashlib.md5(word.encode("utf-8")).digest()
+            index = int.from_bytes(digest[:4], "little") % self.size
+            vector[index] += 1.0 if digest[4] & 1 else -1.0
+        norm = math.sqrt(sum(value * value for value in vector)) or 1.0
+        return [value / norm for value in vector]
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        time.sleep(self.latency + self.latency_per_text * len(texts))
+        return [self._embed(text) for text in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        time.sleep(self.latency + self.latency_per_text)
+        return self._embed(text)
+
+
+def install(chat_latency=0.0, chat_latency_per_token=0.0, embedding_latency=0.0,
+            embedding_latency_per_text=0.0, embedding_size=256):
+    """Make llm_clients hand out fake clients and estimate token counts offline."""
+
+    def chat_factory(model_name, **params):
+        return FakeChatModel(
+            model_name=model_name,
+            latency=chat_latency,
+            latency_per_token=chat_latency_per_token,
+        )
+
+    def embeddings_factory(model=None, **params):
+        return HashingEmbeddings(
+            size=embedding_size,
+            latency=embedding_latency,
+            latency_per_text=embedding_latency_per_text,
+            model=model or "fake-embeddings",
+        )
+
+    llm_clients.set_factories(chat_factory=chat_factory, embeddings_factory=embeddings_factory)
+    # The tokenizer download needs network
+    llm_usage.set_token_estimator(llm_usage.estimate_tokens)
+
+
+def uninstall():
+    llm_clients.set_factories()
+    llm_usage.set_token_estimator(None)
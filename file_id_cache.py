@@ -0,0 +1,60 @@
+# file_id_cache.py
+
+import threading
+
+from db_service import DatabaseService
+
+
+class FileIdCache:
+    """Telegram file_ids of uploaded reference files.
+
+    Entries are keyed by (absolute path, size, mtime) so a changed file
+    misses the cache and is uploaded again. Lookups go to memory first and to
+    the telegram_file_cache table after a restart.
+    """
+
+    def __init__(self):
+        self._db_service = None
+        self._lock = threading.Lock()
+        # file_path -> (file_size, file_mtime, file_id)
+        self._entries = {}
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def db_service(self):
+        if self._db_service is None:
+            self._db_service = DatabaseService()
+        return self._db_service
+
+    def get(self, file_path, file_size, file_mtime):
+        with self._lock:
+            entry = self._entries.get(file_path)
+        if entry and entry[:2] == (file_size, file_mtime):
+            file_id = entry[2]
+        elif entry:
+            # The file changed since it was uploaded
+            self.invalidate(file_path)
+            file_id = None
+        else:
+            file_id = self.db_service.get_cached_file_id(file_path, file_size, file_mtime)
+            if file_id:
+                with self._lock:
+                    self._entries[file_path] = (file_size, file_mtime, file_id)
+
+        with self._lock:
+            if file_id:
+                self.hits += 1
+            else:
+                self.misses += 1
+        return file_id
+
+    def put(self, file_path, file_size, file_mtime, file_id):
+        with self._lock:
+            self._entries[file_path] = (file_size, file_mtime, file_id)
+        self.db_service.save_file_id(file_path, file_size, file_mtime, file_id)
+
+    def invalidate(self, file_path):
+        with self._lock:
+            self._entries.pop(file_path, None)
+        self.db_service.delete_file_id(file_path)
@@ -1,16 +1,31 @@
 # handlers.py
 
+import asyncio
 import logging
 import os
 import uuid
+from datetime import date, timedelta
 from telegram import Update, BotCommand, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import ContextTypes, ConversationHandler
+from telegram.error import BadRequest
 
-from settings import PROJECT_PATHS, MAX_TOKENS_IN_CONTEXT, KNOWLEDGE_BASE_PATH, CHAT_HISTORY_LEVEL, FOLLOWING_QUESTIONS
+from settings import PROJECT_PATHS, MAX_TOKENS_IN_CONTEXT, KNOWLEDGE_BASE_PATH, FOLLOWING_QUESTIONS, INDEX_WARMUP_CONCURRENCY, PREFETCH_SUGGESTED_ANSWERS, QA_MODE, METRICS_HOST, METRICS_PORT, EVENT_LOOP_LAG_INTERVAL, DB_BACKEND
 from db_service import DatabaseService
 from llm_service import LLMService
-from helpers import messages_to_langchain_messages
+import llm_clients
+from dir_cache import directory_cache
+from file_id_cache import FileIdCache
+from session_store import restore_session
 from auth import AuthService
+from exception_handlers import exception_tracker
+from llm_scheduler import LLMScheduler, QueueTimeoutError
+from answer_cache import SuggestedAnswerCache
+from message_writer import MessageWriter
+from metrics import span, collect_timings, detached_context, start_metrics_server, stage_seconds, event_loop_lag_seconds, EventLoopLagMonitor
+from llm_usage import usage_scope, token_usage_tracker, estimate_cost, prompt_cache_stats
+from conversation_history import ConversationHistory
+from helpers import process_rss_bytes
+from profiling import profile_methods
 
 # Decorators:
 def authorized_only(func):
@@ -24,21 +39,25 @@ def authorized_only(func):
         if 'db_service' not in context.user_data:
             context.user_data['db_service'] = DatabaseService()
 
-        # Save or update user info
-        self.auth_service.save_user_info(user_id, user_name, language_code)
-
-        # Check if user has access
-        if not self.auth_service.check_user_access(user_id):
-            if update.message:
-                await update.message.reply_text("You do not have access, please make the /request_access.")
-            elif update.callback_query:
-                await update.callback_query.answer("You do not have access, please make the /request_access.", show_alert=True)
-            return
-        else:
-            # Update last_active
-            self.auth_service.update_last_active(user_id)
+        # Spans of this update end up in its event_log row, see log_event
+        with collect_timings():
+            with span("auth"):
+                # Save or update user info
+                self.auth_service.save_user_info(user_id, user_name, language_code)
+                has_access = self.auth_service.check_user_access(user_id)
+
+            # Check if user has access
+            if not has_access:
+                if update.message:
+                    await update.message.reply_text("You do not have access, please make the /request_access.")
+                elif update.callback_query:
+                    await update.callback_query.answer("You do not have access, please make the /request_access.", show_alert=True)
+                return
+            else:
+                # Update last_active
+                self.auth_service.update_last_active(user_id)
 
-        return await func(self, update, context, *args, **kwargs)
+            return await func(self, update, context, *args, **kwargs)
     return wrapper
 
 def initialize_services(func):
@@ -53,7 +72,15 @@ def initialize_services(func):
             context.user_data['user_name'] = update.effective_user.full_name
         if 'language_code' not in context.user_data:
             context.user_data['language_code'] = update.effective_user.language_code
-        return await func(self, update, context, *args, **kwargs)
+
+        db_service = context.user_data['db_service']
+        user_id = context.user_data['user_id']
+        # Pick up the folder this user had before the bot restarted
+        await restore_session(db_service, context.user_data['llm_service'], user_id, context.user_data)
+
+        # Token usage of this update is billed to the user
+        with usage_scope(user_id=user_id):
+            return await func(self, update, context, *args, **kwargs)
     return wrapper
 
 def ensure_documents_indexed(func):
@@ -79,7 +106,8 @@ def log_event(event_type):
             conversation_id = str(uuid.uuid4())
 
             # Execute the handler function
-            result = await func(self, update, context, *args, **kwargs)
+            with collect_timings() as timings:
+                result = await func(self, update, context, *args, **kwargs)
 
             # After executing the handler function
             # Retrieve system_response from context.user_data
@@ -94,6 +122,7 @@ def log_event(event_type):
                     user_message=user_message,
                     system_response=system_response,
                     conversation_id=conversation_id,
+                    timings=timings,
                 )
             else:
                 logging.error("db_service not found in context.user_data")
@@ -104,9 +133,26 @@ def log_event(event_type):
 
 WAITING_FOR_FOLDER_PATH, WAITING_FOR_QUESTION, WAITING_FOR_PROJECT_SELECTION = range(3)
 
+def queue_position_notifier(message):
+    async def notify(position):
+        await message.reply_text(
+            f"You're #{position} in line, your answer will follow shortly."
+        )
+    return notify
+
 class BotHandlers:
     def __init__(self):
         self.auth_service = AuthService()
+        self.llm_scheduler = LLMScheduler()
+        self.file_id_cache = FileIdCache()
+        # Project name -> warm-up state of its index
+        self.index_readiness = {}
+        self.answer_cache = SuggestedAnswerCache()
+        self.message_writer = MessageWriter()
+        self.conversation_history = ConversationHistory()
+        self._background_tasks = set()
+        self.metrics_server = None
+        self.loop_lag_monitor = EventLoopLagMonitor(EVENT_LOOP_LAG_INTERVAL)
 
     async def post_init(self, application):
         commands = [
@@ -118,9 +164,156 @@ class BotHandlers:
             BotCommand("knowledge_base", "Set context to knowledge base"),
             BotCommand("request_access", "Request access to the bot"),
             BotCommand("grant_access", "Grant access to a user (Admin only)"),
+            BotCommand("usage_report", "Token usage and cost report (Admin only)"),
+            BotCommand("runtime_stats", "Live process statistics (Admin only)"),
         ]
         await application.bot.set_my_commands(commands)
 
+        # Keep cached access decisions in sync with grants from other processes
+        self.auth_service.start_access_listener()
+        self.auth_service.start_last_active_flusher()
+        token_usage_tracker.start_flusher()
+
+        # Keep cached folder listings fresh
+        directory_cache.start()
+
+        if METRICS_PORT:
+            self.metrics_server = start_metrics_server(METRICS_HOST, METRICS_PORT)
+        self.loop_lag_monitor.start()
+
+        # Open pooled API connections before the first user needs them
+        application.create_task(asyncio.to_thread(llm_clients.warm_up))
+
+        # Index predefined projects while the bot already accepts traffic
+        application.create_task(self.warm_up_indexes())
+
+    async def warm_up_indexes(self):
+        """Load or build the indexes of all predefined projects and the knowledge base."""
+        folders = dict(PROJECT_PATHS)
+        folders["knowledge_base"] = KNOWLEDGE_BASE_PATH
+        self.index_readiness = {name: "pending" for name in folders}
+        semaphore = asyncio.Semaphore(INDEX_WARMUP_CONCURRENCY)
+
+        async def warm_up(name, folder_path):
+            async with semaphore:
+                self.index_readiness[name] = "indexing"
+                try:
+                    if not await asyncio.to_thread(directory_cache.is_dir, folder_path):
+                        status = "unavailable"
+                    else:
+                        llm_service = await asyncio.to_thread(LLMService)
+                        index_status = await asyncio.to_thread(
+                            llm_service.load_and_index_documents, folder_path
+                        )
+                        if index_status == "Documents successfully indexed.":
+                            status = "ready"
+                            if name in PROJECT_PATHS:
+                                self.prefetch_suggested_answers(folder_path)
+                        else:
+                            status = "no valid files"
+                except Exception as e:
+                    logging.error(f"Error warming up index for {name}: {e}")
+                    status = "failed"
+                self.index_readiness[name] = status
+                logging.info(f"Index warm-up: {name} is {status}.")
+
+        await asyncio.gather(*(warm_up(name, path) for name, path in folders.items()))
+
+    def prefetch_suggested_answers(self, folder_path):
+        """Answer the suggested questions for a project in the background."""
+        if not PREFETCH_SUGGESTED_ANSWERS:
+            return
+        # Billed to the bot, not to the user who selected the project
+        with usage_scope(user_id=0):
+            task = asyncio.create_task(
+                self.answer_cache.prefetch(folder_path, self.llm_scheduler),
+                context=detached_context(),
+            )
+        # Keep a reference until the task finishes
+        self._background_tasks.add(task)
+        task.add_done_callback(self._background_tasks.discard)
+
+    async def generate_answer(self, context, conversation_id, question, message):
+        """Save the user's question and answer it using their chat history."""
+        db_service = context.user_data["db_service"]
+        llm_service = context.user_data["llm_service"]
+        user_id = context.user_data["user_id"]
+
+        if QA_MODE == "pipelined":
+            question_saved = False
+
+            def load_chat_history():
+                nonlocal question_saved
+                with span("db_history"):
+                    chat_history = self.conversation_history.load(db_service, user_id)
+                # Saved after loading, so the question is not part of its own history
+                self.message_writer.save_message(db_service, conversation_id, "user", user_id, question)
+                question_saved = True
+                return chat_history
+
+            try:
+                return await self.llm_scheduler.submit(
+                    user_id,
+                    llm_service.generate_response_pipelined,
+                    question,
+                    load_chat_history,
+                    on_queued=queue_position_notifier(message),
+                )
+            finally:
+                if not question_saved:
+                    self.message_writer.save_message(db_service, conversation_id, "user", user_id, question)
+
+        db_service.save_message(conversation_id, "user", user_id, question)
+
+        with span("db_history"):
+            chat_history = self.conversation_history.load(db_service, user_id)
+
+        return await self.llm_scheduler.submit(
+            user_id,
+            llm_service.generate_response,
+            question,
+            chat_history=chat_history,
+            on_queued=queue_position_notifier(message),
+        )
+
+    def save_bot_message(self, db_service, conversation_id, user_id, bot_message):
+        if QA_MODE == "pipelined":
+            self.message_writer.save_message(db_service, conversation_id, "bot", None, bot_message)
+        else:
+            db_service.save_message(conversation_id, "bot", None, bot_message)
+        # Fold older conversations into the user's summary once enough piled up
+        self.conversation_history.schedule_refresh(db_service, user_id)
+
+    def usage_summary(self, user_id):
+        """Token usage and estimated cost of a user today and over the last 30 days."""
+        today = date.today()
+        lines = ["Token usage:"]
+        for label, since in (("Today", today), ("Last 30 days", today - timedelta(days=29))):
+            rows = token_usage_tracker.usage(since, user_id)
+            tokens = sum(row[4] + row[5] + row[7] for row in rows)
+            cost = sum(estimate_cost(row[2], *row[4:]) for row in rows)
+            lines.append(f"{label}: {tokens:,} tokens (~${cost:.2f})")
+        return "\n".join(lines)
+
+    async def post_shutdown(self, application):
+        # Writes the remaining last_active timestamps and exception counters
+        self.auth_service.close()
+        exception_tracker.flush()
+        token_usage_tracker.close()
+        llm_clients.close()
+        directory_cache.stop()
+        self.message_writer.close()
+        self.loop_lag_monitor.stop()
+        if self.metrics_server:
+            self.metrics_server.shutdown()
+
+    def project_label(self, project_name):
+        """Button text for a project, with its warm-up state until it is ready."""
+        status = self.index_readiness.get(project_name)
+        if status in (None, "ready"):
+            return project_name
+        return f"{project_name} ({status})"
+
     @initialize_services
     @log_event(event_type='command')
     async def start(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -137,17 +330,13 @@ class BotHandlers:
         # Try to get the last folder from the database for the user
         last_folder = db_service.get_last_folder(user_id)
 
-        if last_folder and os.path.isdir(last_folder):
+        if last_folder and directory_cache.is_dir(last_folder):
             context.user_data["folder_path"] = last_folder
-            valid_files_in_folder = [
-                f
-                for f in os.listdir(last_folder)
-                if f.endswith((".pdf", ".docx", ".xlsx"))
-            ]
+            valid_files_in_folder = await asyncio.to_thread(directory_cache.valid_files, last_folder)
             context.user_data["valid_files_in_folder"] = valid_files_in_folder
 
             if valid_files_in_folder:
-                index_status = llm_service.load_and_index_documents(last_folder)
+                index_status = await asyncio.to_thread(llm_service.load_and_index_documents, last_folder)
                 if index_status != "Documents successfully indexed.":
                     logging.error(
                         f"Error during load_and_index_documents: {index_status}"
@@ -160,7 +349,7 @@ class BotHandlers:
                 context.user_data["vector_store_loaded"] = True
 
                 # Evaluate token count
-                token_count = llm_service.count_tokens_in_context(last_folder)
+                token_count = await asyncio.to_thread(llm_service.count_tokens_in_context, last_folder)
                 percentage_full = (
                     (token_count / MAX_TOKENS_IN_CONTEXT) * 100
                     if MAX_TOKENS_IN_CONTEXT
@@ -211,7 +400,7 @@ class BotHandlers:
         user_message = '/projects'
 
         keyboard = [
-            [InlineKeyboardButton(project_name, callback_data=project_name)]
+            [InlineKeyboardButton(self.project_label(project_name), callback_data=project_name)]
             for project_name in PROJECT_PATHS.keys()
         ]
         reply_markup = InlineKeyboardMarkup(keyboard)
@@ -245,18 +434,14 @@ class BotHandlers:
 
         if folder_path:
             # Check if the folder path exists
-            if not os.path.isdir(folder_path):
+            if not directory_cache.is_dir(folder_path):
                 system_response = "The selected project's folder path does not exist."
                 await query.edit_message_text(system_response)
                 context.user_data['system_response'] = system_response
                 return ConversationHandler.END
 
             # Check for valid files
-            valid_files_in_folder = [
-                f
-                for f in os.listdir(folder_path)
-                if f.endswith((".pdf", ".docx", ".xlsx"))
-            ]
+            valid_files_in_folder = await asyncio.to_thread(directory_cache.valid_files, folder_path)
             if not valid_files_in_folder:
                 system_response = "No valid files found in the selected project's folder."
                 await query.edit_message_text(system_response)
@@ -268,7 +453,7 @@ class BotHandlers:
             # Set user-specific folder path and process the documents
             context.user_data["folder_path"] = folder_path
             context.user_data["valid_files_in_folder"] = valid_files_in_folder
-            index_status = llm_service.load_and_index_documents(folder_path)
+            index_status = await asyncio.to_thread(llm_service.load_and_index_documents, folder_path)
             if index_status != "Documents successfully indexed.":
                 logging.error(f"Error during load_and_index_documents: {index_status}")
                 system_response = "An error occurred while loading and indexing the project documents. Please try again later."
@@ -277,9 +462,11 @@ class BotHandlers:
                 return ConversationHandler.END
 
             context.user_data["vector_store_loaded"] = True
+            # Answers for the question buttons below, unless already prefetched
+            self.prefetch_suggested_answers(folder_path)
 
             # Evaluate token count
-            token_count = llm_service.count_tokens_in_context(folder_path)
+            token_count = await asyncio.to_thread(llm_service.count_tokens_in_context, folder_path)
             percentage_full = (
                 (token_count / MAX_TOKENS_IN_CONTEXT) * 100
                 if MAX_TOKENS_IN_CONTEXT
@@ -333,18 +520,26 @@ class BotHandlers:
             conversation_id = str(uuid.uuid4())
 
             db_service = context.user_data["db_service"]
-            db_service.save_message(conversation_id, "user", user_id, question)
 
-            chat_history_texts = db_service.get_chat_history(CHAT_HISTORY_LEVEL, user_id)
-            # Convert chat_history_texts to list of HumanMessage and AIMessage
-            chat_history = messages_to_langchain_messages(chat_history_texts)
-
-            llm_service = context.user_data["llm_service"]
+            folder_path = context.user_data.get("folder_path")
+            cached_answer = None
+            if folder_path and context.user_data.get("vector_store_loaded"):
+                cached_answer = await asyncio.to_thread(self.answer_cache.get, folder_path, question)
 
             try:
-                response, source_files = llm_service.generate_response(
-                    question, chat_history=chat_history
-                )
+                if cached_answer:
+                    db_service.save_message(conversation_id, "user", user_id, question)
+                    response, source_files = cached_answer
+                else:
+                    response, source_files = await self.generate_answer(
+                        context, conversation_id, question, query.message
+                    )
+            except QueueTimeoutError:
+                system_response = "The assistant is busy right now. Please try again in a minute."
+                await query.message.reply_text(system_response)
+
+                context.user_data['system_response'] = system_response
+                return
             except Exception as e:
                 logging.error(f"Error during generate_response: {e}")
                 system_response = "An error occurred while processing your question. Please try again later."
@@ -356,19 +551,20 @@ class BotHandlers:
             # Prepare the bot's response
             bot_message = f"{response}\n\nReferences:"
 
-            if source_files:
-                # Create buttons for each source file
-                keyboard = [
-                    [InlineKeyboardButton(file, callback_data=f"get_file:{file}")]
-                    for file in source_files
-                ]
-                reply_markup = InlineKeyboardMarkup(keyboard)
-                await query.message.reply_text(bot_message, reply_markup=reply_markup)
-            else:
-                await query.message.reply_text(response)
+            with span("telegram_reply"):
+                if source_files:
+                    # Create buttons for each source file
+                    keyboard = [
+                        [InlineKeyboardButton(file, callback_data=f"get_file:{file}")]
+                        for file in source_files
+                    ]
+                    reply_markup = InlineKeyboardMarkup(keyboard)
+                    await query.message.reply_text(bot_message, reply_markup=reply_markup)
+                else:
+                    await query.message.reply_text(response)
 
             # Save the bot's message
-            db_service.save_message(conversation_id, "bot", None, bot_message)
+            self.save_bot_message(db_service, conversation_id, context.user_data["user_id"], bot_message)
             context.user_data['system_response'] = bot_message
 
     @authorized_only
@@ -383,6 +579,7 @@ class BotHandlers:
         conversation_id = str(uuid.uuid4())
         folder_path = context.user_data.get("folder_path", "")
         valid_files_in_folder = context.user_data.get("valid_files_in_folder", [])
+        usage_info = await asyncio.to_thread(self.usage_summary, user_id)
 
         if not folder_path:
             system_response = (
@@ -390,6 +587,7 @@ class BotHandlers:
                 f"Name: {user_name}\n"
                 "No folder path has been set yet. Please set it using the /folder command."
             )
+            system_response += f"\n\n{usage_info}"
             await update.message.reply_text(system_response)
         else:
             if valid_files_in_folder:
@@ -400,7 +598,7 @@ class BotHandlers:
                 )
 
                 # Evaluate token count
-                token_count = llm_service.count_tokens_in_context(folder_path)
+                token_count = await asyncio.to_thread(llm_service.count_tokens_in_context, folder_path)
                 percentage_full = (
                     (token_count / MAX_TOKENS_IN_CONTEXT) * 100
                     if MAX_TOKENS_IN_CONTEXT
@@ -414,6 +612,7 @@ class BotHandlers:
                     f"{folder_info}\n\n"
                     f"Context storage is {percentage_full:.2f}% full."
                 )
+                system_response += f"\n\n{usage_info}"
                 await update.message.reply_text(system_response)
             else:
                 system_response = (
@@ -421,6 +620,7 @@ class BotHandlers:
                     f"Name: {user_name}\n"
                     f"The folder path is currently set to: {folder_path}, but no valid files were found."
                 )
+                system_response += f"\n\n{usage_info}"
                 await update.message.reply_text(system_response)
 
             # Save event log
@@ -459,7 +659,7 @@ class BotHandlers:
         conversation_id = str(uuid.uuid4())
 
         # Check if the folder path exists
-        if not os.path.isdir(folder_path):
+        if not directory_cache.is_dir(folder_path):
             system_response = "Invalid folder path. Please provide a valid path."
             await update.message.reply_text(system_response)
             # Save event log
@@ -467,9 +667,7 @@ class BotHandlers:
             return ConversationHandler.END
 
         # Check for valid files
-        valid_files_in_folder = [
-            f for f in os.listdir(folder_path) if f.endswith((".pdf", ".docx", ".xlsx"))
-        ]
+        valid_files_in_folder = await asyncio.to_thread(directory_cache.valid_files, folder_path)
         if not valid_files_in_folder:
             system_response = "No valid files found in the folder. Please provide a folder containing valid documents."
             await update.message.reply_text(system_response)
@@ -480,7 +678,7 @@ class BotHandlers:
         # Set user-specific folder path and process the documents
         context.user_data["folder_path"] = folder_path
         context.user_data["valid_files_in_folder"] = valid_files_in_folder
-        index_status = llm_service.load_and_index_documents(folder_path)
+        index_status = await asyncio.to_thread(llm_service.load_and_index_documents, folder_path)
         if index_status != "Documents successfully indexed.":
             logging.error(f"Error during load_and_index_documents: {index_status}")
             system_response = "An error occurred while loading and indexing your documents. Please try again later."
@@ -492,7 +690,7 @@ class BotHandlers:
         context.user_data["vector_store_loaded"] = True
 
         # Evaluate token count
-        token_count = llm_service.count_tokens_in_context(folder_path)
+        token_count = await asyncio.to_thread(llm_service.count_tokens_in_context, folder_path)
         percentage_full = (
             (token_count / MAX_TOKENS_IN_CONTEXT) * 100 if MAX_TOKENS_IN_CONTEXT else 0
         )
@@ -530,7 +728,7 @@ class BotHandlers:
         conversation_id = str(uuid.uuid4())
 
         # Check if the folder path exists
-        if not os.path.isdir(folder_path):
+        if not directory_cache.is_dir(folder_path):
             system_response = "The knowledge base folder path does not exist."
             await update.message.reply_text(system_response)
             # Save event log
@@ -538,9 +736,7 @@ class BotHandlers:
             return
 
         # Check for valid files
-        valid_files_in_folder = [
-            f for f in os.listdir(folder_path) if f.endswith((".pdf", ".docx", ".xlsx"))
-        ]
+        valid_files_in_folder = await asyncio.to_thread(directory_cache.valid_files, folder_path)
         if not valid_files_in_folder:
             system_response = "No valid files found in the knowledge base folder."
             await update.message.reply_text(system_response)
@@ -551,7 +747,7 @@ class BotHandlers:
         # Set user-specific folder path and process the documents
         context.user_data["folder_path"] = folder_path
         context.user_data["valid_files_in_folder"] = valid_files_in_folder
-        index_status = llm_service.load_and_index_documents(folder_path)
+        index_status = await asyncio.to_thread(llm_service.load_and_index_documents, folder_path)
         if index_status != "Documents successfully indexed.":
             logging.error(f"Error during load_and_index_documents: {index_status}")
             system_response = "An error occurred while loading and indexing the knowledge base documents. Please try again later."
@@ -563,7 +759,7 @@ class BotHandlers:
         context.user_data["vector_store_loaded"] = True
 
         # Evaluate token count
-        token_count = llm_service.count_tokens_in_context(folder_path)
+        token_count = await asyncio.to_thread(llm_service.count_tokens_in_context, folder_path)
         percentage_full = (
             (token_count / MAX_TOKENS_IN_CONTEXT) * 100 if MAX_TOKENS_IN_CONTEXT else 0
         )
@@ -617,18 +813,16 @@ class BotHandlers:
         conversation_id = str(uuid.uuid4())
 
         db_service = context.user_data["db_service"]
-        db_service.save_message(conversation_id, "user", user_id, user_prompt)
-
-        chat_history_texts = db_service.get_chat_history(CHAT_HISTORY_LEVEL, user_id)
-        # Convert chat_history_texts to list of HumanMessage and AIMessage
-        chat_history = messages_to_langchain_messages(chat_history_texts)
-
-        llm_service = context.user_data["llm_service"]
 
         try:
-            response, source_files = llm_service.generate_response(
-                user_prompt, chat_history=chat_history
+            response, source_files = await self.generate_answer(
+                context, conversation_id, user_prompt, update.message
             )
+        except QueueTimeoutError:
+            system_response = "The assistant is busy right now. Please try again in a minute."
+            await update.message.reply_text(system_response)
+            context.user_data['system_response'] = system_response
+            return ConversationHandler.END
         except Exception as e:
             logging.error(f"Error during generate_response: {e}")
             system_response = "An error occurred while processing your question. Please try again later."
@@ -640,19 +834,20 @@ class BotHandlers:
         # Prepare the bot's response
         bot_message = f"{response}\n\nReferences:"
 
-        if source_files:
-            # Create buttons for each source file
-            keyboard = [
-                [InlineKeyboardButton(file, callback_data=f"get_file:{file}")]
-                for file in source_files
-            ]
-            reply_markup = InlineKeyboardMarkup(keyboard)
-            await update.message.reply_text(bot_message, reply_markup=reply_markup)
-        else:
-            await update.message.reply_text(response)
+        with span("telegram_reply"):
+            if source_files:
+                # Create buttons for each source file
+                keyboard = [
+                    [InlineKeyboardButton(file, callback_data=f"get_file:{file}")]
+                    for file in source_files
+                ]
+                reply_markup = InlineKeyboardMarkup(keyboard)
+                await update.message.reply_text(bot_message, reply_markup=reply_markup)
+            else:
+                await update.message.reply_text(response)
 
         # Save the bot's message
-        db_service.save_message(conversation_id, "bot", None, bot_message)
+        self.save_bot_message(db_service, conversation_id, context.user_data["user_id"], bot_message)
 
         # Save event log
         context.user_data['system_response'] = bot_message
@@ -667,20 +862,18 @@ class BotHandlers:
         """Handle any text message sent by the user."""
 
         db_service = context.user_data["db_service"]
-        llm_service = context.user_data["llm_service"]
         user_message = update.message.text
-        user_id = context.user_data["user_id"]
         conversation_id = str(uuid.uuid4())
 
-        # Save the user's message
-        db_service.save_message(conversation_id, "user", user_id, user_message)
-
-        chat_history_texts = db_service.get_chat_history(CHAT_HISTORY_LEVEL, user_id)
-        # Convert chat_history_texts to list of HumanMessage and AIMessage
-        chat_history = messages_to_langchain_messages(chat_history_texts)
-
         try:
-            response, source_files = llm_service.generate_response(user_message, chat_history=chat_history)
+            response, source_files = await self.generate_answer(
+                context, conversation_id, user_message, update.message
+            )
+        except QueueTimeoutError:
+            system_response = "The assistant is busy right now. Please try again in a minute."
+            await update.message.reply_text(system_response)
+            context.user_data['system_response'] = system_response
+            return ConversationHandler.END
         except Exception as e:
             logging.error(f"Error during generate_response: {e}")
             system_response = "An error occurred while processing your message. Please try again later."
@@ -692,19 +885,20 @@ class BotHandlers:
             # Prepare the bot's response
         bot_message = f"{response}\n\nReferences:"
 
-        if source_files:
-            # Create buttons for each source file
-            keyboard = [
-                [InlineKeyboardButton(file, callback_data=f"get_file:{file}")]
-                for file in source_files
-            ]
-            reply_markup = InlineKeyboardMarkup(keyboard)
-            await update.message.reply_text(bot_message, reply_markup=reply_markup)
-        else:
-            await update.message.reply_text(response)
+        with span("telegram_reply"):
+            if source_files:
+                # Create buttons for each source file
+                keyboard = [
+                    [InlineKeyboardButton(file, callback_data=f"get_file:{file}")]
+                    for file in source_files
+                ]
+                reply_markup = InlineKeyboardMarkup(keyboard)
+                await update.message.reply_text(bot_message, reply_markup=reply_markup)
+            else:
+                await update.message.reply_text(response)
 
         # Save the bot's message
-        db_service.save_message(conversation_id, "bot", None, bot_message)
+        self.save_bot_message(db_service, conversation_id, context.user_data["user_id"], bot_message)
 
         context.user_data['system_response'] = bot_message
 
@@ -718,11 +912,10 @@ class BotHandlers:
             file_name = data[len("get_file:"):]
             folder_path = context.user_data.get("folder_path")
             if folder_path:
-                file_path = os.path.join(folder_path, file_name)
+                file_path = os.path.abspath(os.path.join(folder_path, file_name))
                 if os.path.isfile(file_path):
                     try:
-                        with open(file_path, 'rb') as f:
-                            await query.message.reply_document(document=f, filename=file_name)
+                        await self._send_document(query.message, file_path, file_name)
                     except Exception as e:
                         logging.error(f"Error sending file: {e}")
                         await query.message.reply_text("An error occurred while sending the file.")
@@ -733,6 +926,27 @@ class BotHandlers:
         else:
             await query.message.reply_text("Unknown command.")
 
+    async def _send_document(self, message, file_path, file_name):
+        """Send a file by its cached Telegram file_id, uploading it only when needed."""
+        stat = os.stat(file_path)
+        file_id = await asyncio.to_thread(self.file_id_cache.get, file_path, stat.st_size, stat.st_mtime)
+        if file_id:
+            try:
+                await message.reply_document(document=file_id, filename=file_name)
+                return
+            except BadRequest as e:
+                # The file_id is no longer valid on Telegram's side
+                logging.warning(f"Cached file_id for {file_path} rejected: {e}")
+                await asyncio.to_thread(self.file_id_cache.invalidate, file_path)
+
+        with open(file_path, 'rb') as f:
+            sent_message = await message.reply_document(document=f, filename=file_name)
+        if sent_message and sent_message.document:
+            await asyncio.to_thread(
+                self.file_id_cache.put,
+                file_path, stat.st_size, stat.st_mtime, sent_message.document.file_id,
+            )
+
     @log_event(event_type='command')
     async def request_access(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         user = update.effective_user
@@ -770,3 +984,120 @@ class BotHandlers:
             await update.message.reply_text(f"User {user_id_to_grant} has been granted access.")
         except (IndexError, ValueError):
             await update.message.reply_text("Usage: /grant_access <user_id>")
+
+    async def usage_report(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Admin report of token usage and estimated cost per user, project and model."""
+        admin_id = update.effective_user.id
+        if str(admin_id) != os.getenv("ADMIN_TELEGRAM_ID"):
+            await update.message.reply_text("You are not authorized to perform this action.")
+            return
+
+        try:
+            days = int(context.args[0]) if context.args else 30
+        except ValueError:
+            days = 0
+        if days < 1:
+            await update.message.reply_text("Usage: /usage_report [days]")
+            return
+
+        since = date.today() - timedelta(days=days - 1)
+        rows = await asyncio.to_thread(token_usage_tracker.usage, since)
+        if not rows:
+            await update.message.reply_text(f"No token usage in the last {days} days.")
+            return
+
+        totals = {"user": {}, "project": {}, "model": {}}
+        for user_id, project, model, requests, prompt_tokens, completion_tokens, cached_tokens, embedding_tokens in rows:
+            tokens = prompt_tokens + completion_tokens + embedding_tokens
+            cost = estimate_cost(model, prompt_tokens, completion_tokens, cached_tokens, embedding_tokens)
+            for group, key in (("user", user_id or "bot"), ("project", project or "-"), ("model", model)):
+                group_tokens, group_cost = totals[group].get(key, (0, 0.0))
+                totals[group][key] = (group_tokens + tokens, group_cost + cost)
+
+        total_tokens = sum(tokens for tokens, _ in totals["model"].values())
+        total_cost = sum(cost for _, cost in totals["model"].values())
+        lines = [f"Token usage, last {days} days: {total_tokens:,} tokens (~${total_cost:.2f})"]
+        for group, title in (("user", "Top users"), ("project", "Top projects"), ("model", "Models")):
+            lines.append(f"\n{title}:")
+            ranked = sorted(totals[group].items(), key=lambda item: item[1][1], reverse=True)
+            for key, (tokens, cost) in ranked[:10]:
+                lines.append(f"{key}: {tokens:,} tokens (~${cost:.2f})")
+        await update.message.reply_text("\n".join(lines))
+
+    def runtime_stats_report(self):
+        """Indexes, caches, database, LLM queue and process figures of this process."""
+        lines = ["Indexes:"]
+        indexes = LLMService.loaded_indexes()
+        for folder_path, vectors, size in indexes:
+            lines.append(f"{folder_path}: {vectors:,} vectors, ~{size / 2**20:.1f} MB")
+        if not indexes:
+            lines.append("None loaded")
+
+        lookups = LLMService.index_lookups
+        lines.append("\nCache hit rates:")
+        lines.append(
+            f"Indexes: {hit_rate(lookups['memory'] + lookups['disk'], lookups['built'])} "
+            f"({lookups['memory']} memory, {lookups['disk']} disk, {lookups['built']} built)"
+        )
+        for label, cache in (
+            ("Folder listings", directory_cache),
+            ("Telegram file ids", self.file_id_cache),
+            ("Suggested answers", self.answer_cache),
+        ):
+            lines.append(f"{label}: {hit_rate(cache.hits, cache.misses)}")
+        for model, stats in sorted(prompt_cache_stats.snapshot().items()):
+            if stats["prompt_tokens"]:
+                lines.append(f"Prompt cache {model}: {prompt_cache_stats.hit_rate(model):.0%} of tokens")
+
+        lines.append(f"\nDatabase ({DB_BACKEND}): {DatabaseService.open_connections()} open connections")
+        lines.append(
+            f"LLM requests: {self.llm_scheduler.running}/{self.llm_scheduler.max_concurrent} running, "
+            f"{self.llm_scheduler.queued} queued, {self.llm_scheduler.timed_out} timed out"
+        )
+
+        lag_p95 = event_loop_lag_seconds.quantile(None, 0.95)
+        lines.append(
+            f"Event loop lag: {self.loop_lag_monitor.last_lag * 1000:.1f} ms last"
+            + (f", {lag_p95 * 1000:.1f} ms p95" if lag_p95 is not None else "")
+        )
+        rss = process_rss_bytes()
+        lines.append(f"RSS: {rss / 2**20:.0f} MB" if rss is not None else "RSS: unavailable")
+
+        stages = sorted(stage_seconds.stages())
+        if stages:
+            lines.append("\nStage latency p50/p95:")
+            for stage in stages:
+                p50 = stage_seconds.quantile(stage, 0.5)
+                p95 = stage_seconds.quantile(stage, 0.95)
+                lines.append(f"{stage}: {p50 * 1000:.0f}/{p95 * 1000:.0f} ms")
+        return "\n".join(lines)
+
+    async def runtime_stats(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Admin report of live process statistics."""
+        admin_id = update.effective_user.id
+        if str(admin_id) != os.getenv("ADMIN_TELEGRAM_ID"):
+            await update.message.reply_text("You are not authorized to perform this action.")
+            return
+
+        # Sizing the indexes walks their stored chunks
+        report = await asyncio.to_thread(self.runtime_stats_report)
+        await update.message.reply_text(report)
+
+
+def hit_rate(hits, misses):
+    total = hits + misses
+    return f"{hits / total:.0%}" if total else "n/a"
+
+
+# No-op unless PROFILING is on
+profile_methods(BotHandlers, (
+    "start",
+    "handle_project_selection_callback",
+    "handle_question_callback",
+    "status",
+    "set_folder",
+    "knowledge_base",
+    "ask_question",
+    "handle_message",
+    "send_file",
+))
@@ -1,5 +1,12 @@
+import sys
 from datetime import datetime
 
+try:
+    import resource
+except ImportError:
+    # Not available on Windows
+    resource = None
+
 from langchain.schema import Document, HumanMessage, AIMessage
 
 
@@ -24,3 +31,47 @@ def current_timestamp():
             + datetime.now().time().strftime("%H:%M:%S")
     )
     return date_time
+
+def current_date():
+    # Day granularity keeps prompts identical within a day for prompt caching
+    return datetime.now().date().strftime("%Y-%m-%d")
+
+
+def process_rss_bytes():
+    """Current resident set size, or the peak where /proc is not available.
+
+    None when neither is available.
+    """
+    if resource is None:
+        return None
+    try:
+        with open("/proc/self/statm") as f:
+            pages = int(f.read().split()[1])
+        return pages * resource.getpagesize()
+    except (OSError, ValueError, IndexError):
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # Kilobytes on Linux, bytes on macOS
+        return peak if sys.platform == "darwin" else peak * 1024
+
+
+def percentile(values, q):
+    """Nearest-rank q-quantile of ``values``, 0.0 when empty."""
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    index = min(len(ordered) - 1, max(0, round(q * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def print_table(rows, float_format=".3f", min_width=8):
+    """Print dict rows as right-aligned columns, headed by the first row's keys."""
+    columns = list(rows[0])
+    widths = {column: max(len(column), min_width) for column in columns}
+    print("  ".join(f"{column:>{widths[column]}}" for column in columns))
+    for row in rows:
+        cells = []
+        for column in columns:
+            value = row.get(column, "")
+            text = f"{value:{float_format}}" if isinstance(value, float) else str(value)
+            cells.append(f"{text:>{widths[column]}}")
+        print("  ".join(cells))
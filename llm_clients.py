@@ -0,0 +1,122 @@
+# llm_clients.py
+
+import logging
+import threading
+
+import httpx
+from langchain_openai import ChatOpenAI, OpenAIEmbeddings
+
+from llm_usage import prompt_cache_stats, token_usage_tracker
+from settings import OPENAI_API_KEY, MODEL_NAME, MODEL_ROUTING, OPENAI_MAX_CONNECTIONS, OPENAI_TIMEOUT
+
+# Process-wide clients keyed by (kind, model, parameters). All of them share
+# one HTTP connection pool, so keep-alive connections and TLS sessions are
+# reused across users and calls.
+_lock = threading.Lock()
+_clients = {}
+_http_client = None
+
+
+def default_chat_factory(model_name, **params):
+    return ChatOpenAI(
+        openai_api_key=OPENAI_API_KEY,
+        model_name=model_name,
+        http_client=get_http_client(),
+        # Record token usage reported in each response
+        callbacks=[prompt_cache_stats, token_usage_tracker],
+        **params,
+    )
+
+
+def default_embeddings_factory(model=None, **params):
+    if model:
+        params["model"] = model
+    return OpenAIEmbeddings(
+        openai_api_key=OPENAI_API_KEY,
+        http_client=get_http_client(),
+        **params,
+    )
+
+
+_factories = {
+    "chat": default_chat_factory,
+    "embeddings": default_embeddings_factory,
+}
+
+
+def get_http_client():
+    global _http_client
+    with _lock:
+        if _http_client is None:
+            _http_client = httpx.Client(
+                limits=httpx.Limits(
+                    max_connections=OPENAI_MAX_CONNECTIONS,
+                    max_keepalive_connections=OPENAI_MAX_CONNECTIONS,
+                ),
+                timeout=OPENAI_TIMEOUT,
+            )
+        return _http_client
+
+
+def _get_client(kind, model, params):
+    key = (kind, model, tuple(sorted(params.items())))
+    with _lock:
+        client = _clients.get(key)
+    if client is not None:
+        return client
+
+    client = _factories[kind](model, **params)
+    with _lock:
+        # Another thread may have created the same client meanwhile
+        return _clients.setdefault(key, client)
+
+
+def get_chat_model(model_name=MODEL_NAME, **params):
+    """Shared chat model for ``model_name`` and the given parameters."""
+    return _get_client("chat", model_name, params)
+
+
+def get_stage_model(stage, **params):
+    """Shared chat model configured for a pipeline stage in MODEL_ROUTING."""
+    return get_chat_model(MODEL_ROUTING.get(stage, MODEL_NAME), **params)
+
+
+def get_embeddings(model=None, **params):
+    """Shared embeddings client."""
+    return _get_client("embeddings", model, params)
+
+
+def set_factories(chat_factory=None, embeddings_factory=None):
+    """Replace how clients are built, e.g. with fake backends for benchmarks.
+
+    Passing no arguments restores the OpenAI clients. Cached clients are dropped.
+    """
+    with _lock:
+        _factories["chat"] = chat_factory or default_chat_factory
+        _factories["embeddings"] = embeddings_factory or default_embeddings_factory
+        _clients.clear()
+
+
+def registered_clients():
+    with _lock:
+        return list(_clients)
+
+
+def warm_up():
+    """Open a pooled connection to the API so the first user request skips the TLS handshake."""
+    try:
+        get_http_client().get(
+            "https://api.openai.com/v1/models",
+            headers={"Authorization": f"Bearer {OPENAI_API_KEY}"},
+        )
+    except Exception as e:
+        logging.error(f"Error warming up OpenAI connections: {e}")
+
+
+def close():
+    global _http_client
+    with _lock:
+        _clients.clear()
+        if _http_client is not None:
+            _http_client.close()
+            _http_client = None
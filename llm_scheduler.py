@@ -0,0 +1,136 @@
+# llm_scheduler.py
+
+import asyncio
+import time
+from collections import OrderedDict, deque
+
+from settings import LLM_MAX_CONCURRENT_REQUESTS, LLM_QUEUE_TIMEOUT
+
+
+class QueueTimeoutError(Exception):
+    """Raised when a request waited longer than the queue timeout."""
+
+
+class _QueuedRequest:
+    def __init__(self, loop, background=False):
+        self.granted = loop.create_future()
+        self.enqueued_at = time.monotonic()
+        self.background = background
+
+
+class LLMScheduler:
+    """Admission control for LLM calls.
+
+    At most ``max_concurrent`` calls run at once. Waiting requests are queued
+    per user and dispatched round-robin across users, so one user sending a
+    burst cannot starve everybody else. Background requests (such as answer
+    prefetching) are only dispatched while no user request is waiting.
+    Requests that wait longer than ``max_wait`` seconds are cancelled with
+    QueueTimeoutError.
+    """
+
+    def __init__(self, max_concurrent=LLM_MAX_CONCURRENT_REQUESTS, max_wait=LLM_QUEUE_TIMEOUT):
+        self.max_concurrent = max_concurrent
+        self.max_wait = max_wait
+        self.running = 0
+        self.timed_out = 0
+        # user_id -> deque of waiting requests, in round-robin order
+        self._queues = OrderedDict()
+        # Same for background requests, served when _queues is empty
+        self._background_queues = OrderedDict()
+
+    @property
+    def queued(self):
+        return sum(
+            len(queue)
+            for queues in (self._queues, self._background_queues)
+            for queue in queues.values()
+        )
+
+    async def submit(self, user_id, func, *args, on_queued=None, background=False, **kwargs):
+        """Run ``func(*args, **kwargs)`` in a worker thread once admitted.
+
+        ``on_queued`` is awaited with the 1-based queue position when the
+        request cannot start immediately. ``background`` requests yield to
+        every waiting user request.
+        """
+        request = _QueuedRequest(asyncio.get_running_loop(), background)
+        self._queues_for(request).setdefault(user_id, deque()).append(request)
+        self._dispatch()
+
+        try:
+            if not request.granted.done():
+                if on_queued:
+                    await on_queued(self.position(user_id, request))
+                await self._wait_for_slot(request)
+        except BaseException:
+            # Timed out, cancelled or on_queued failed: never leak the request
+            self._abandon(user_id, request)
+            raise
+
+        try:
+            return await asyncio.to_thread(func, *args, **kwargs)
+        finally:
+            self.running -= 1
+            self._dispatch()
+
+    def position(self, user_id, request):
+        """Number of requests dispatched before ``request``, plus one."""
+        queues = self._queues_for(request)
+        queue = queues.get(user_id)
+        if not queue or request not in queue:
+            return 0
+        index = queue.index(request)
+        ahead = index
+        if request.background:
+            # Everything waiting for users goes first
+            ahead += sum(len(other_queue) for other_queue in self._queues.values())
+        before_user = True
+        for other_id, other_queue in queues.items():
+            if other_id == user_id:
+                before_user = False
+                continue
+            # Users ahead in the rotation are served once more per round
+            ahead += min(len(other_queue), index + 1 if before_user else index)
+        return ahead + 1
+
+    async def _wait_for_slot(self, request):
+        remaining = self.max_wait - (time.monotonic() - request.enqueued_at)
+        try:
+            await asyncio.wait_for(asyncio.shield(request.granted), timeout=max(remaining, 0))
+        except asyncio.TimeoutError:
+            if request.granted.done():
+                return
+            self.timed_out += 1
+            raise QueueTimeoutError(f"Request waited more than {self.max_wait} seconds.")
+
+    def _abandon(self, user_id, request):
+        if request.granted.done():
+            # The slot was already handed over, give it back
+            self.running -= 1
+            self._dispatch()
+        else:
+            self._remove(user_id, request)
+
+    def _queues_for(self, request):
+        return self._background_queues if request.background else self._queues
+
+    def _remove(self, user_id, request):
+        queues = self._queues_for(request)
+        queue = queues.get(user_id)
+        if queue and request in queue:
+            queue.remove(request)
+            if not queue:
+                del queues[user_id]
+
+    def _dispatch(self):
+        while self.running < self.max_concurrent and (self._queues or self._background_queues):
+            queues = self._queues or self._background_queues
+            user_id, queue = next(iter(queues.items()))
+            request = queue.popleft()
+            if queue:
+                queues.move_to_end(user_id)
+            else:
+                del queues[user_id]
+            self.running += 1
+            request.granted.set_result(True)
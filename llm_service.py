@@ -1,30 +1,102 @@
 # llm_service.py
 
 import os
+import json
+import hashlib
+import logging
 import pandas as pd
 from io import StringIO
 from docx import Document as DocxDocument
 import asyncio
-from langchain.chains.history_aware_retriever import create_history_aware_retriever
-from langchain.chains.retrieval import create_retrieval_chain
+import threading
+import time
+from collections import OrderedDict
+import contextvars
+import functools
+from concurrent.futures import ThreadPoolExecutor
 from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder, PromptTemplate
-from langchain_openai import ChatOpenAI, OpenAIEmbeddings
+from langchain_core.output_parsers import StrOutputParser
 from langchain_community.vectorstores import FAISS
 from langchain_community.document_loaders import PyMuPDFLoader
 from langchain.text_splitter import CharacterTextSplitter
 from langchain.schema import Document
 from langchain.chains.combine_documents import create_stuff_documents_chain
-import tiktoken
 
-from settings import OPENAI_API_KEY, MODEL_NAME, CHAT_HISTORY_LEVEL, DOCS_IN_RETRIEVER
-from helpers import current_timestamp
+from settings import (
+    MODEL_ROUTING,
+    COMPLEXITY_ROUTING,
+    CHAT_HISTORY_LEVEL,
+    DOCS_IN_RETRIEVER,
+    INDEX_CACHE_DIR,
+    INDEX_MEMORY_MAX_FOLDERS,
+    INDEX_IDLE_SECONDS,
+    DIR_SCAN_MAX_FOLDERS,
+)
+from helpers import current_date
+from llm_clients import get_chat_model, get_stage_model, get_embeddings
+from dir_cache import directory_cache
+from metrics import span
+from profiling import profile_methods
+from llm_usage import usage_scope, token_usage_tracker, count_text_tokens
+
+
+# Static instructions come first and never change, so providers can serve
+# them from their prompt cache. Volatile parts follow in a fixed order:
+# date, chat history, retrieved context, question.
+ANSWER_SYSTEM_PROMPT = (
+    "You are a project assistant on design and construction projects. "
+    "Use the pieces of retrieved context provided below to answer "
+    "the question. If you don't know the answer, say that you "
+    "don't know. Do not include references to the source documents in your answer. "
+    "If Prompt include request to provide a link to documents in context, respond have to be: Please follow the link below:"
+)
+
+
+def build_answer_prompt():
+    return ChatPromptTemplate.from_messages(
+        [
+            ("system", ANSWER_SYSTEM_PROMPT),
+            ("system", "If you need to use current date, today is {current_date}."),
+            MessagesPlaceholder(variable_name="chat_history"),
+            ("system", "Retrieved context:\n\n{context}"),
+            ("user", "{input}"),
+        ]
+    )
+
+
+def billed_to_folder(method):
+    """Attribute the token usage of an LLMService method to its current folder."""
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with usage_scope(project=self.folder_path):
+            return method(self, *args, **kwargs)
+    return wrapper
+
+
+def embeddings_model_name(embeddings):
+    return getattr(embeddings, "model", None) or type(embeddings).__name__
 
 
 class LLMService:
-    vector_store = None  # Class variable to store the vector store
-    def __init__(self, model_name=MODEL_NAME):
-        self.llm = ChatOpenAI(openai_api_key=OPENAI_API_KEY, model_name=model_name)
-#        self.vector_store = None
+    # Indexes are shared by all users of a folder, least recently used first:
+    # folder_path -> (snapshot fingerprint, vector store)
+    _indexes = OrderedDict()
+    # folder_path -> time.monotonic() of the last lookup
+    _index_last_used = {}
+    # folder_path -> (snapshot fingerprint, token count)
+    _token_counts = OrderedDict()
+    _folder_locks = {}
+    _registry_lock = threading.Lock()
+    # Where index lookups were served from, for /runtime_stats
+    index_lookups = {"memory": 0, "disk": 0, "built": 0}
+
+    def __init__(self, model_name=MODEL_ROUTING["answer"]):
+        # Shared across users, see llm_clients
+        self.llm = get_chat_model(model_name)
+        self.vector_store = None
+        self.folder_path = None
+        # Snapshot fingerprint of the folder the vector store was built from
+        self.index_fingerprint = None
 
     def load_excel_file(self, file_path):
         data = pd.read_excel(file_path)
@@ -67,11 +139,10 @@ class LLMService:
 
         return context
 
-    def load_and_index_documents(self, folder_path):
+    def load_documents(self, folder_path, filenames):
         documents = []
-        found_valid_file = False
 
-        for filename in os.listdir(folder_path):
+        for filename in filenames:
             file_path = os.path.join(folder_path, filename)
 
             if filename.endswith(".pdf"):
@@ -80,153 +151,386 @@ class LLMService:
                 for doc in docs:
                     doc.metadata = {"source": filename}
                     documents.append(doc)
-                found_valid_file = True
 
             elif filename.endswith(".docx"):
                 content = self.load_word_file(file_path)
                 doc = Document(page_content=content, metadata={"source": filename})
                 documents.append(doc)
-                found_valid_file = True
 
             elif filename.endswith(".xlsx"):
                 content = self.load_excel_file(file_path)
                 doc = Document(page_content=content, metadata={"source": filename})
                 documents.append(doc)
-                found_valid_file = True
 
-        if not found_valid_file:
-            return "No valid files found in the folder. Please provide PDF, Word, or Excel files."
+        return documents
+
+    @classmethod
+    def _get_built_index(cls, folder_path, fingerprint):
+        """Index for this folder snapshot from memory or from the index cache."""
+        cached = cls._indexes.get(folder_path)
+        if cached and cached[0] == fingerprint:
+            cls.index_lookups["memory"] += 1
+            cls._remember_index(folder_path, fingerprint, cached[1])
+            return cached[1]
+        vector_store = load_cached_index(folder_path, fingerprint)
+        if vector_store is not None:
+            cls.index_lookups["disk"] += 1
+            cls._remember_index(folder_path, fingerprint, vector_store)
+        return vector_store
+
+    @classmethod
+    def _remember_index(cls, folder_path, fingerprint, vector_store):
+        """Keep an index in memory as the most recently used one."""
+        with cls._registry_lock:
+            cls._indexes[folder_path] = (fingerprint, vector_store)
+            cls._indexes.move_to_end(folder_path)
+            cls._index_last_used[folder_path] = time.monotonic()
+            cls._evict_indexes()
+
+    @classmethod
+    def _evict_indexes(cls):
+        """Drop idle and least recently used indexes; callers hold _registry_lock.
+
+        Users still holding an evicted vector store keep it until they switch
+        folders; everybody else reloads it from the index cache.
+        """
+        cutoff = time.monotonic() - INDEX_IDLE_SECONDS
+        for folder_path in list(cls._indexes):
+            if len(cls._indexes) <= INDEX_MEMORY_MAX_FOLDERS and cls._index_last_used.get(folder_path, 0) >= cutoff:
+                continue
+            del cls._indexes[folder_path]
+            cls._index_last_used.pop(folder_path, None)
+        # Locks of folders without an index in memory
+        for folder_path, lock in list(cls._folder_locks.items()):
+            if folder_path not in cls._indexes and not lock.locked():
+                del cls._folder_locks[folder_path]
+        # Token counts are small, keep one per folder listing
+        while len(cls._token_counts) > DIR_SCAN_MAX_FOLDERS:
+            cls._token_counts.popitem(last=False)
+
+    @classmethod
+    def _set_token_count(cls, folder_path, fingerprint, token_count):
+        with cls._registry_lock:
+            cls._token_counts[folder_path] = (fingerprint, token_count)
+            cls._token_counts.move_to_end(folder_path)
+            cls._evict_indexes()
+
+    @classmethod
+    def loaded_indexes(cls):
+        """(folder_path, vector count, estimated bytes) of the indexes in memory."""
+        with cls._registry_lock:
+            indexes = list(cls._indexes.items())
+        return [
+            (folder_path, vector_store.index.ntotal, index_memory_bytes(vector_store))
+            for folder_path, (_, vector_store) in indexes
+        ]
+
+    def attach_index(self, folder_path):
+        """Use an already built index for the folder without running ingestion.
+
+        Returns False when the folder has no up-to-date index in memory or
+        in the index cache.
+        """
+        snapshot = directory_cache.get_snapshot(folder_path)
+        if not snapshot.valid_files:
+            return False
+        with self._folder_lock(folder_path):
+            vector_store = self._get_built_index(folder_path, snapshot.fingerprint)
+        if vector_store is None:
+            return False
+        self.vector_store = vector_store
+        self.folder_path = folder_path
+        self.index_fingerprint = snapshot.fingerprint
+        return True
+
+    @classmethod
+    def _folder_lock(cls, folder_path):
+        with cls._registry_lock:
+            return cls._folder_locks.setdefault(folder_path, threading.Lock())
 
-        text_splitter = CharacterTextSplitter(chunk_size=1000, chunk_overlap=100)
-        split_docs = text_splitter.split_documents(documents)
+    def load_and_index_documents(self, folder_path):
+        with span("ingest_list"):
+            snapshot = directory_cache.get_snapshot(folder_path)
+        if not snapshot.valid_files:
+            return "No valid files found in the folder. Please provide PDF, Word, or Excel files."
 
-        embeddings = OpenAIEmbeddings(openai_api_key=OPENAI_API_KEY)
-        LLMService.vector_store = FAISS.from_documents(split_docs, embeddings)
+        # One build per folder at a time; other users wait and reuse it
+        with self._folder_lock(folder_path), usage_scope(project=folder_path):
+            vector_store = self._get_built_index(folder_path, snapshot.fingerprint)
+            if vector_store is None:
+                with span("ingest_parse"):
+                    documents = self.load_documents(folder_path, snapshot.valid_files)
+
+                with span("ingest_split"):
+                    text_splitter = CharacterTextSplitter(chunk_size=1000, chunk_overlap=100)
+                    split_docs = text_splitter.split_documents(documents)
+
+                # Same as FAISS.from_documents, with embedding and index build timed apart
+                embeddings = get_embeddings()
+                texts = [doc.page_content for doc in split_docs]
+                with span("ingest_embed"):
+                    vectors = embeddings.embed_documents(texts)
+                token_usage_tracker.record_embeddings(embeddings_model_name(embeddings), texts)
+                with span("ingest_index_build"):
+                    vector_store = FAISS.from_embeddings(
+                        list(zip(texts, vectors)),
+                        embeddings,
+                        metadatas=[doc.metadata for doc in split_docs],
+                    )
+                try:
+                    token_count = count_tokens(documents)
+                except Exception as e:
+                    # Left to count_tokens_in_context rather than stored as a guess
+                    logging.error(f"Error counting tokens for {folder_path}: {e}")
+                    token_count = None
+                LLMService._set_token_count(folder_path, snapshot.fingerprint, token_count)
+                save_cached_index(folder_path, snapshot.fingerprint, vector_store, token_count)
+                LLMService._remember_index(folder_path, snapshot.fingerprint, vector_store)
+                LLMService.index_lookups["built"] += 1
+
+        self.vector_store = vector_store
+        self.folder_path = folder_path
+        self.index_fingerprint = snapshot.fingerprint
         return "Documents successfully indexed."
 
-    def generate_response(self, prompt, chat_history=None):
+    def rewrite_query(self, prompt, chat_history):
+        """Turn a follow-up question into a standalone search query."""
+        if not chat_history:
+            return prompt
 
-        if not LLMService.vector_store:
-            return (
-                "Please set the folder path using /folder and ensure documents are loaded.",
-                None,
-            )
-
-        # Ensure chat_history is a list
-        if chat_history is None:
-            chat_history = []
-
-        # Get the top k relevant documents
-#        similar_docs = get_relevant_documents(prompt, k=2)
-
-#        if not similar_docs:
-#            return "No relevant documents found.", None
-
-        # Create the retriever
-        retriever = LLMService.vector_store.as_retriever(search_kwargs={'k': DOCS_IN_RETRIEVER})
-
-        # Create the history-aware retriever
+        # Instruction first, so every rewrite request starts with the same prefix
         retriever_prompt = ChatPromptTemplate.from_messages(
             [
-                MessagesPlaceholder(variable_name="chat_history"),
-                ("user", "{input}"),
                 (
-                    "user",
-                    "Given the above conversation, generate a search query to look up in order to get information relevant to the conversation",
+                    "system",
+                    "Given the conversation and the latest user message, generate a search query to look up in order to get information relevant to the conversation. Reply with the query only.",
                 ),
+                MessagesPlaceholder(variable_name="chat_history"),
+                ("user", "{input}"),
             ]
         )
+        chain = retriever_prompt | get_stage_model("rewrite") | StrOutputParser()
+        with span("rewrite"):
+            return chain.invoke({"input": prompt, "chat_history": chat_history})
 
-        history_aware_retriever = create_history_aware_retriever(
-            llm=self.llm, retriever=retriever, prompt=retriever_prompt
-        )
-
-        # Create the question-answering chain
-        system_prompt = (
-            "You are a project assistant on design and construction projects. "
-            "Use the following pieces of retrieved context to answer "
-            "the question. If you don't know the answer, say that you "
-            f"don't know. If you need to use current date, today is {current_timestamp()}."
-            " Do not include references to the source documents in your answer."
-            "If Prompt include request to provide a link to documents in context, respond have to be: Please follow the link below:"
-            " \n\n{context}"
-        )
-
-        prompt_template = ChatPromptTemplate.from_messages(
+    def classify_question(self, prompt):
+        """'simple' for single-fact lookups, 'complex' for anything else."""
+        classifier_prompt = ChatPromptTemplate.from_messages(
             [
-                ("system", system_prompt),
-                MessagesPlaceholder(variable_name="chat_history"),
+                (
+                    "system",
+                    "Classify the user's question about project documents. Answer SIMPLE "
+                    "if it asks for a single fact that can be looked up directly (a date, "
+                    "a name, a number, a document). Answer COMPLEX if it needs analysis, "
+                    "comparison, summarizing or several steps. Answer with one word.",
+                ),
                 ("user", "{input}"),
             ]
         )
+        chain = classifier_prompt | get_stage_model("classification") | StrOutputParser()
+        with span("classification"):
+            label = chain.invoke({"input": prompt})
+        return "simple" if label.strip().upper().startswith("SIMPLE") else "complex"
+
+    def answer_model(self, prompt):
+        """Chat model for the answer step; simple lookups may go to a cheaper model."""
+        if not COMPLEXITY_ROUTING:
+            return self.llm
+        try:
+            if self.classify_question(prompt) == "simple":
+                return get_stage_model("simple_answer")
+        except Exception as e:
+            # Fall back to the full model rather than failing the question
+            logging.error(f"Error classifying question: {e}")
+        return self.llm
+
+    def retrieve(self, query, k=DOCS_IN_RETRIEVER):
+        with span("retrieval"):
+            documents = get_relevant_documents(self.vector_store, query, k)
+        if self.vector_store:
+            # The query itself is embedded for the search
+            token_usage_tracker.record_embeddings(
+                embeddings_model_name(self.vector_store.embeddings), [query]
+            )
+        return documents
+
+    def answer_from_documents(self, prompt, chat_history, documents, llm=None):
+        # Create the question-answering chain
+        prompt_template = build_answer_prompt()
+
+        question_answer_chain = create_stuff_documents_chain(llm or self.llm, prompt_template)
+        with span("generation"):
+            answer = question_answer_chain.invoke(
+                {
+                    "input": prompt,
+                    "chat_history": chat_history,
+                    "context": documents,
+                    "current_date": current_date(),
+                }
+            )
 
-        question_answer_chain = create_stuff_documents_chain(self.llm, prompt_template)
+        if not documents:
+            return answer, None
 
-        # Create the retrieval chain using create_retrieval_chain
-        rag_chain = create_retrieval_chain(
-            retriever=history_aware_retriever, combine_docs_chain=question_answer_chain
+        source_files = set(
+            [doc.metadata["source"] for doc in documents if "source" in doc.metadata]
         )
 
-        # Run the chain with the provided prompt and chat history
-        result = rag_chain.invoke({"input": prompt, "chat_history": chat_history})
+        return answer, source_files
 
-        answer = result.get("answer", "")
-        sources = result.get("context", [])
+    @billed_to_folder
+    def generate_response(self, prompt, chat_history=None):
 
-        if not sources:
-            return answer, None
+        if not self.vector_store:
+            return (
+                "Please set the folder path using /folder and ensure documents are loaded.",
+                None,
+            )
 
-        source_files = set(
-            [doc.metadata["source"] for doc in sources if "source" in doc.metadata]
+        # Ensure chat_history is a list
+        if chat_history is None:
+            chat_history = []
+
+        # Same steps as a history-aware retrieval chain: rewrite, search, answer
+        query = self.rewrite_query(prompt, chat_history)
+        documents = self.retrieve(query)
+        return self.answer_from_documents(
+            prompt, chat_history, documents, llm=self.answer_model(prompt)
         )
 
-        return answer, source_files
+    @billed_to_folder
+    def generate_response_pipelined(self, prompt, load_chat_history):
+        """Like generate_response, with retrieval overlapped with history loading.
+
+        Documents for the raw question are searched while ``load_chat_history``
+        runs and the question is rewritten. If the rewrite changes the query,
+        its results come first and the speculative ones fill the remaining slots.
+        """
+        if not self.vector_store:
+            return (
+                "Please set the folder path using /folder and ensure documents are loaded.",
+                None,
+            )
+
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            # Copied contexts keep the spans attached to the current update
+            speculative = executor.submit(contextvars.copy_context().run, self.retrieve, prompt)
+            answer_model = executor.submit(contextvars.copy_context().run, self.answer_model, prompt)
+            chat_history = load_chat_history() or []
+            query = self.rewrite_query(prompt, chat_history)
+            if query.strip() == prompt.strip():
+                documents = speculative.result()
+            else:
+                documents = merge_documents(
+                    self.retrieve(query), speculative.result(), DOCS_IN_RETRIEVER
+                )
+
+        return self.answer_from_documents(
+            prompt, chat_history, documents, llm=answer_model.result()
+        )
 
     def count_tokens_in_context(self, folder_path):
         """Counts the total number of tokens in documents within a folder."""
-        documents = []
-        found_valid_file = False
+        snapshot = directory_cache.get_snapshot(folder_path)
+        if not snapshot.valid_files:
+            return "No valid files found in the folder. Please provide PDF, Word, or Excel files."
 
-        for filename in os.listdir(folder_path):
-            file_path = os.path.join(folder_path, filename)
+        # Reuse the count from indexing while the folder is unchanged
+        cached = LLMService._token_counts.get(folder_path)
+        if cached and cached[0] == snapshot.fingerprint and cached[1] is not None:
+            return cached[1]
 
-            if filename.endswith(".pdf"):
-                loader = PyMuPDFLoader(file_path)
-                docs = loader.load()
-                for doc in docs:
-                    doc.metadata = {"source": filename}
-                    documents.append(doc)
-                found_valid_file = True
+        documents = self.load_documents(folder_path, snapshot.valid_files)
+        total_tokens = count_tokens(documents)
+        LLMService._set_token_count(folder_path, snapshot.fingerprint, total_tokens)
+        return total_tokens
 
-            elif filename.endswith(".docx"):
-                content = self.load_word_file(file_path)
-                doc = Document(page_content=content, metadata={"source": filename})
-                documents.append(doc)
-                found_valid_file = True
 
-            elif filename.endswith(".xlsx"):
-                content = self.load_excel_file(file_path)
-                doc = Document(page_content=content, metadata={"source": filename})
-                documents.append(doc)
-                found_valid_file = True
+def index_cache_path(folder_path):
+    return os.path.join(
+        INDEX_CACHE_DIR, hashlib.sha1(folder_path.encode("utf-8")).hexdigest()
+    )
 
-        if not found_valid_file:
-            return "No valid files found in the folder. Please provide PDF, Word, or Excel files."
 
-        # Count tokens in the documents
-        tokenizer = tiktoken.encoding_for_model(
-            "gpt-4"
-        )  # Tokenizer for the specific model
+def load_cached_index(folder_path, fingerprint):
+    """Load a saved index if it was built from the same folder snapshot."""
+    path = index_cache_path(folder_path)
+    try:
+        with open(os.path.join(path, "snapshot.json"), encoding="utf-8") as f:
+            metadata = json.load(f)
+        if metadata.get("fingerprint") != fingerprint:
+            return None
+        vector_store = FAISS.load_local(
+            path, get_embeddings(), allow_dangerous_deserialization=True
+        )
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        logging.error(f"Error loading cached index for {folder_path}: {e}")
+        return None
+
+    LLMService._set_token_count(folder_path, fingerprint, metadata.get("token_count"))
+    return vector_store
+
+
+def save_cached_index(folder_path, fingerprint, vector_store, token_count):
+    path = index_cache_path(folder_path)
+    metadata_path = os.path.join(path, "snapshot.json")
+    try:
+        if os.path.exists(metadata_path):
+            os.remove(metadata_path)
+        vector_store.save_local(path)
+        # Written last, so a partially saved index is never trusted
+        with open(metadata_path, "w", encoding="utf-8") as f:
+            json.dump(
+                {"folder_path": folder_path, "fingerprint": fingerprint, "token_count": token_count},
+                f,
+            )
+    except Exception as e:
+        logging.error(f"Error saving index for {folder_path}: {e}")
+
 
-        total_tokens = 0
-        for doc in documents:
-            total_tokens += len(tokenizer.encode(doc.page_content))
+def index_memory_bytes(vector_store):
+    """Rough size of a FAISS store: float32 vectors plus the stored chunk texts."""
+    index = vector_store.index
+    vectors = index.ntotal * index.d * 4
+    texts = sum(
+        len(doc.page_content.encode("utf-8"))
+        for doc in getattr(vector_store.docstore, "_dict", {}).values()
+    )
+    return vectors + texts
+
+
+def count_tokens(documents):
+    # cl100k_base is the gpt-4 tokenizer; raises when it cannot be loaded
+    return count_text_tokens(doc.page_content for doc in documents)
 
-        return total_tokens
 
-def get_relevant_documents(query, k):
-    if not LLMService.vector_store:
+def get_relevant_documents(vector_store, query, k):
+    if not vector_store:
         return []
 
-    similar_docs = LLMService.vector_store.similarity_search(query, k=k)
-    return similar_docs
\ No newline at end of file
+    similar_docs = vector_store.similarity_search(query, k=k)
+    return similar_docs
+
+
+def merge_documents(primary, secondary, k):
+    """Documents of ``primary`` followed by unseen ones of ``secondary``, at most k."""
+    merged = []
+    seen = set()
+    for doc in list(primary) + list(secondary):
+        key = (doc.metadata.get("source"), doc.page_content)
+        if key in seen:
+            continue
+        seen.add(key)
+        merged.append(doc)
+    return merged[:k]
+
+
+# No-op unless PROFILING is on
+profile_methods(LLMService, (
+    "load_and_index_documents",
+    "generate_response",
+    "generate_response_pipelined",
+    "count_tokens_in_context",
+))
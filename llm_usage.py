@@ -0,0 +1,246 @@
+# llm_usage.py
+
+import contextvars
+import logging
+import threading
+from collections import defaultdict
+from contextlib import contextmanager
+from datetime import date
+
+import tiktoken
+from langchain_core.callbacks import BaseCallbackHandler
+
+from settings import MODEL_PRICES, EMBEDDING_PRICES, TOKEN_USAGE_FLUSH_INTERVAL
+from db_service import DatabaseService
+
+# Who and what LLM calls are billed to, see usage_scope. User 0 stands for
+# the bot itself (warm-up, prefetching).
+_usage_scope = contextvars.ContextVar("usage_scope", default={"user_id": 0, "project": ""})
+_encoding = None
+_estimator = None
+
+
+def usage_from_result(response):
+    """(model, input tokens, cached input tokens, output tokens) per generation of an LLMResult."""
+    usages = []
+    for generations in response.generations:
+        for generation in generations:
+            message = getattr(generation, "message", None)
+            usage = getattr(message, "usage_metadata", None)
+            if not usage:
+                continue
+            model = message.response_metadata.get("model_name", "unknown")
+            cached_tokens = (usage.get("input_token_details") or {}).get("cache_read", 0) or 0
+            usages.append(
+                (model, usage.get("input_tokens", 0), cached_tokens, usage.get("output_tokens", 0))
+            )
+    return usages
+
+
+class PromptCacheStats(BaseCallbackHandler):
+    """Prompt tokens and prompt tokens served from the provider's cache, per model."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._models = defaultdict(lambda: {"requests": 0, "prompt_tokens": 0, "cached_tokens": 0})
+
+    def on_llm_end(self, response, **kwargs):
+        for model, prompt_tokens, cached_tokens, _ in usage_from_result(response):
+            with self._lock:
+                stats = self._models[model]
+                stats["requests"] += 1
+                stats["prompt_tokens"] += prompt_tokens
+                stats["cached_tokens"] += cached_tokens
+            logging.debug(f"{model}: {cached_tokens} of {prompt_tokens} prompt tokens cached")
+
+    def hit_rate(self, model):
+        """Share of prompt tokens that were cached."""
+        with self._lock:
+            stats = self._models.get(model)
+            if not stats or not stats["prompt_tokens"]:
+                return 0.0
+            return stats["cached_tokens"] / stats["prompt_tokens"]
+
+    def snapshot(self):
+        with self._lock:
+            return {model: dict(stats) for model, stats in self._models.items()}
+
+
+prompt_cache_stats = PromptCacheStats()
+
+
+@contextmanager
+def usage_scope(**fields):
+    """Attribute LLM and embedding calls in this block to ``user_id`` and/or ``project``."""
+    scope = dict(_usage_scope.get())
+    scope.update({key: value for key, value in fields.items() if value is not None})
+    token = _usage_scope.set(scope)
+    try:
+        yield scope
+    finally:
+        _usage_scope.reset(token)
+
+
+def current_usage_scope():
+    return dict(_usage_scope.get())
+
+
+def estimate_tokens(texts):
+    """Rough count of about four characters per token, for offline runs."""
+    return sum(len(text) // 4 + 1 for text in texts)
+
+
+def set_token_estimator(estimator):
+    """Count tokens with ``estimator`` instead of tiktoken; None restores tiktoken.
+
+    Only for offline benchmarks and tests, see fake_backends.install.
+    """
+    global _estimator
+    _estimator = estimator
+
+
+def _get_encoding():
+    global _encoding
+    if _encoding is None:
+        # Downloaded on first use; a failure is retried on the next call
+        _encoding = tiktoken.get_encoding("cl100k_base")
+    return _encoding
+
+
+def count_text_tokens(texts, allow_estimate=False):
+    """Tokens in ``texts`` as counted by the OpenAI embedding models.
+
+    Raises when the tokenizer cannot be loaded, unless ``allow_estimate``
+    is set for figures that tolerate an approximation, such as billing.
+    """
+    if _estimator is not None:
+        return _estimator(texts)
+    try:
+        encoding = _get_encoding()
+    except Exception as e:
+        if not allow_estimate:
+            raise
+        logging.warning(f"tiktoken encoding unavailable, estimating tokens: {e}")
+        return estimate_tokens(texts)
+    return sum(len(encoding.encode(text)) for text in texts)
+
+
+def price_for(model, prices):
+    matches = [name for name in prices if model.startswith(name)]
+    return prices[max(matches, key=len)] if matches else None
+
+
+def estimate_cost(model, prompt_tokens, completion_tokens, cached_tokens, embedding_tokens):
+    """Estimated USD cost of token counts of one model; 0 for unknown models."""
+    cost = 0.0
+    chat_price = price_for(model, MODEL_PRICES)
+    if chat_price:
+        input_price, cached_price, output_price = chat_price
+        cost += (prompt_tokens - cached_tokens) * input_price + cached_tokens * cached_price
+        cost += completion_tokens * output_price
+    embedding_price = price_for(model, EMBEDDING_PRICES)
+    if embedding_price:
+        cost += embedding_tokens * embedding_price
+    return cost / 1_000_000
+
+
+class TokenUsageTracker(BaseCallbackHandler):
+    """Token counts per day, user, project and model, written to the DB in batches."""
+
+    def __init__(self, flush_interval=TOKEN_USAGE_FLUSH_INTERVAL):
+        self.flush_interval = flush_interval
+        self._db_service = None
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        # (day, user_id, project, model) -> [requests, prompt, completion, cached, embedding]
+        self._pending = defaultdict(lambda: [0, 0, 0, 0, 0])
+        self._flusher_thread = None
+        self._stop_flusher = threading.Event()
+
+    @property
+    def db_service(self):
+        if self._db_service is None:
+            self._db_service = DatabaseService()
+        return self._db_service
+
+    def on_llm_end(self, response, **kwargs):
+        for model, prompt_tokens, cached_tokens, completion_tokens in usage_from_result(response):
+            self._add(model, (1, prompt_tokens, completion_tokens, cached_tokens, 0))
+
+    def record_embeddings(self, model, texts):
+        """Count tokens sent to an embeddings model; the API client does not report them."""
+        self._add(model, (1, 0, 0, 0, count_text_tokens(texts, allow_estimate=True)))
+
+    def _add(self, model, counts):
+        scope = _usage_scope.get()
+        key = (date.today().isoformat(), scope["user_id"], scope["project"], model)
+        with self._lock:
+            totals = self._pending[key]
+            for index, count in enumerate(counts):
+                totals[index] += count
+
+    def pending_rows(self):
+        with self._lock:
+            return [(*key, *counts) for key, counts in self._pending.items()]
+
+    def flush(self):
+        """Write all pending counters in one batch."""
+        with self._flush_lock:
+            with self._lock:
+                pending = self._pending
+                self._pending = defaultdict(lambda: [0, 0, 0, 0, 0])
+            if not pending:
+                return 0
+            rows = [(*key, *counts) for key, counts in pending.items()]
+            if not self.db_service.add_token_usage(rows):
+                # Keep the counters for the next attempt
+                with self._lock:
+                    for key, counts in pending.items():
+                        totals = self._pending[key]
+                        for index, count in enumerate(counts):
+                            totals[index] += count
+                return 0
+            return len(rows)
+
+    def usage(self, since, user_id=None):
+        """Saved plus pending usage since ``since`` as get_token_usage rows."""
+        totals = defaultdict(lambda: [0, 0, 0, 0, 0])
+        pending = [
+            (row_user_id, project, model, *counts)
+            for day, row_user_id, project, model, *counts in self.pending_rows()
+            if day >= since.isoformat() and (user_id is None or row_user_id == user_id)
+        ]
+        for row_user_id, project, model, *counts in list(self.db_service.get_token_usage(since, user_id)) + pending:
+            row_totals = totals[(row_user_id, project, model)]
+            for index, count in enumerate(counts):
+                row_totals[index] += count or 0
+        return [(*key, *counts) for key, counts in totals.items()]
+
+    def start_flusher(self):
+        """Flush counters every flush_interval seconds."""
+        if self._flusher_thread and self._flusher_thread.is_alive():
+            return
+        self._stop_flusher.clear()
+        self._flusher_thread = threading.Thread(
+            target=self._flush_periodically,
+            name="token-usage-flusher",
+            daemon=True,
+        )
+        self._flusher_thread.start()
+
+    def _flush_periodically(self):
+        while not self._stop_flusher.wait(self.flush_interval):
+            try:
+                self.flush()
+            except Exception as e:
+                logging.error(f"Error flushing token usage: {e}")
+
+    def close(self):
+        self._stop_flusher.set()
+        if self._flusher_thread:
+            self._flusher_thread.join()
+        # Final flush so no usage is lost at shutdown
+        self.flush()
+
+
+token_usage_tracker = TokenUsageTracker()
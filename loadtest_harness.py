@@ -0,0 +1,261 @@
+# loadtest_harness.py
+"""Drive BotHandlers with simulated users to see how latency scales with concurrency.
+
+    python loadtest_harness.py --users 1,5,10,25 --rounds 3 --chat-latency 0.5
+
+Each simulated user sends /projects and picks a project, then repeatedly
+asks a question, checks /status and downloads a referenced file. Updates go
+through Application.process_update with the handlers of bot.py and the same
+PerUserUpdateProcessor, so the --workers slot limit applies as in production.
+Latencies include the time an update waits for a worker slot.
+
+Updates are real telegram.Update objects. Bot API calls are answered by a
+fake request backend, the OpenAI clients by fake_backends and the database
+is a temporary SQLite file, so no network or Postgres is needed.
+"""
+
+import os
+import tempfile
+
+# Must be set before settings is imported
+_workdir = tempfile.mkdtemp(prefix="ask_andrew_loadtest_")
+os.environ["DB_BACKEND"] = "sqlite"
+os.environ["SQLITE_PATH"] = os.path.join(_workdir, "loadtest.sqlite3")
+os.environ["INDEX_CACHE_DIR"] = os.path.join(_workdir, "index_cache")
+os.environ.setdefault("OPENAI_API_KEY", "loadtest-key")
+
+import argparse
+import asyncio
+import contextlib
+import io
+import itertools
+import json
+import logging
+import shutil
+import statistics
+import time
+
+from telegram import Update
+from telegram.ext import ApplicationBuilder, ExtBot
+from telegram.request import BaseRequest
+
+import corpus_generator
+import fake_backends
+import handlers as handlers_module
+from db_service import DatabaseService
+from bot import add_handlers
+from handlers import BotHandlers
+from helpers import percentile, print_table
+from llm_service import LLMService
+from settings import UPDATE_WORKERS
+from update_processor import PerUserUpdateProcessor
+from webhook_harness import build_update
+
+PROJECT_NAME = "LoadTest"
+QUESTIONS = (
+    "Who approved the facade mock-up?",
+    "What happened to the level 3 slab pour?",
+    "When was the fire strategy priced?",
+)
+_message_ids = itertools.count(1)
+_file_ids = itertools.count(1)
+
+
+class FakeTelegramRequest(BaseRequest):
+    """Answers Bot API calls locally, after ``latency`` seconds."""
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.calls = {}
+
+    @property
+    def read_timeout(self):
+        return None
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+    async def do_request(self, url, method, request_data=None, read_timeout=None,
+                         write_timeout=None, connect_timeout=None, pool_timeout=None):
+        endpoint = url.rsplit("/", 1)[-1]
+        self.calls[endpoint] = self.calls.get(endpoint, 0) + 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        parameters = request_data.parameters if request_data else {}
+
+        if endpoint == "getMe":
+            result = {"id": 1, "is_bot": True, "first_name": "Andrew", "username": "ask_andrew_loadtest_bot"}
+        elif endpoint in ("sendMessage", "editMessageText", "sendDocument"):
+            chat_id = parameters.get("chat_id", 0)
+            result = {
+                "message_id": parameters.get("message_id") or next(_message_ids),
+                "date": int(time.time()),
+                "chat": {"id": chat_id, "type": "private"},
+                "text": parameters.get("text", ""),
+            }
+            if endpoint == "sendDocument":
+                file_id = parameters.get("document") if isinstance(parameters.get("document"), str) else None
+                file_id = file_id or f"loadtest-file-{next(_file_ids)}"
+                result["document"] = {"file_id": file_id, "file_unique_id": file_id}
+        else:
+            result = True
+        return 200, json.dumps({"ok": True, "result": result}).encode("utf-8")
+
+
+def build_callback_update(user_id, data):
+    """A callback query update for a button under a previous bot message."""
+    update = build_update(user_id, "")
+    message = update["message"]
+    message["from"] = {"id": 1, "is_bot": True, "first_name": "Andrew"}
+    return {
+        "update_id": update["update_id"],
+        "callback_query": {
+            "id": str(update["update_id"]),
+            "from": {"id": user_id, "is_bot": False, "first_name": f"Load{user_id}", "language_code": "en"},
+            "chat_instance": str(user_id),
+            "message": message,
+            "data": data,
+        },
+    }
+
+
+class LoadTest:
+    def __init__(self, application):
+        self.application = application
+        # operation -> latencies in seconds
+        self.latencies = {}
+
+    async def dispatch(self, operation, update_data):
+        """Process one update the way the application's update fetcher does."""
+        update = Update.de_json(update_data, self.application.bot)
+        started = time.perf_counter()
+        await self.application.update_processor.process_update(
+            update, self.application.process_update(update)
+        )
+        self.latencies.setdefault(operation, []).append(time.perf_counter() - started)
+
+    async def simulate_user(self, user_id, rounds, file_name):
+        await self.dispatch("projects", build_update(user_id, "/projects"))
+        await self.dispatch("project_selection", build_callback_update(user_id, PROJECT_NAME))
+        for round_number in range(rounds):
+            question = QUESTIONS[(user_id + round_number) % len(QUESTIONS)]
+            await self.dispatch("handle_message", build_update(user_id, question))
+            await self.dispatch("status", build_update(user_id, "/status"))
+            await self.dispatch("send_file", build_callback_update(user_id, f"get_file:{file_name}"))
+
+
+async def count_error(update, context):
+    context.bot_data["errors"] = context.bot_data.get("errors", 0) + 1
+
+
+def grant_users(bot_handlers, user_ids):
+    for user_id in user_ids:
+        bot_handlers.auth_service.save_user_info(user_id, f"Load{user_id}", "en")
+        bot_handlers.auth_service.grant_access(user_id)
+
+
+async def run_level(application, bot_handlers, users, rounds, first_user_id, file_name):
+    user_ids = [first_user_id + index for index in range(users)]
+    await asyncio.to_thread(grant_users, bot_handlers, user_ids)
+    load_test = LoadTest(application)
+    errors_before = application.bot_data.get("errors", 0)
+    started = time.perf_counter()
+    await asyncio.gather(*(load_test.simulate_user(user_id, rounds, file_name) for user_id in user_ids))
+    elapsed = time.perf_counter() - started
+    await asyncio.to_thread(bot_handlers.message_writer.flush)
+
+    requests = sum(len(latencies) for latencies in load_test.latencies.values())
+    row = {
+        "users": users,
+        "requests": requests,
+        "errors": application.bot_data.get("errors", 0) - errors_before,
+        "seconds": elapsed,
+        "requests_per_s": requests / elapsed,
+    }
+    for operation, latencies in load_test.latencies.items():
+        row[f"{operation}_p50_ms"] = statistics.median(latencies) * 1000
+        row[f"{operation}_p95_ms"] = percentile(latencies, 0.95) * 1000
+    return row
+
+
+async def main_async(args, workdir=_workdir):
+    corpus_path = os.path.join(workdir, "corpus")
+    corpus_generator.generate_corpus(corpus_path, args.files, args.paragraphs)
+    handlers_module.PROJECT_PATHS[PROJECT_NAME] = corpus_path
+    handlers_module.QA_MODE = args.qa_mode
+    fake_backends.install(chat_latency=args.chat_latency, embedding_latency=args.embedding_latency)
+
+    db_service = DatabaseService()
+    db_service.ensure_schema()
+    db_service.close()
+    # Build the index up front so every level measures the same warm path
+    await asyncio.to_thread(LLMService().load_and_index_documents, corpus_path)
+
+    request = FakeTelegramRequest(args.telegram_latency)
+    bot = ExtBot("123456:loadtest", request=request, get_updates_request=FakeTelegramRequest())
+    application = (
+        ApplicationBuilder()
+        .bot(bot)
+        .concurrent_updates(PerUserUpdateProcessor(workers=args.workers))
+        .build()
+    )
+    bot_handlers = BotHandlers()
+    add_handlers(application, bot_handlers)
+    application.add_error_handler(count_error)
+    await application.initialize()
+
+    rows = []
+    try:
+        for level, users in enumerate(args.users):
+            # Fresh users per level, so sessions and histories start empty
+            rows.append(await run_level(
+                application, bot_handlers, users, args.rounds,
+                first_user_id=800000000 + level * 100000,
+                file_name="document_0000.pdf",
+            ))
+    finally:
+        bot_handlers.message_writer.close()
+        await application.shutdown()
+        fake_backends.uninstall()
+    return rows, request.calls
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", default="1,5,10,25", help="Comma separated concurrency levels")
+    parser.add_argument("--rounds", type=int, default=3, help="Question/status/file rounds per user")
+    parser.add_argument("--files", type=int, default=12)
+    parser.add_argument("--paragraphs", type=int, default=20, help="Filler paragraphs per file")
+    parser.add_argument("--chat-latency", type=float, default=0.2, help="Seconds per chat call")
+    parser.add_argument("--embedding-latency", type=float, default=0.02, help="Seconds per embeddings call")
+    parser.add_argument("--telegram-latency", type=float, default=0.02, help="Seconds per Bot API call")
+    parser.add_argument("--workers", type=int, default=UPDATE_WORKERS, help="Update worker slots")
+    parser.add_argument("--qa-mode", default="sequential", choices=("sequential", "pipelined"))
+    parser.add_argument("--json", help="Also write the results to this file")
+    parser.add_argument("--keep", action="store_true", help="Keep the temporary database and corpus")
+    parser.add_argument("--verbose", action="store_true", help="Show the database service output")
+    args = parser.parse_args()
+    args.users = [int(users) for users in args.users.split(",")]
+
+    logging.basicConfig(level=logging.WARNING)
+    # The database services print a line per write
+    output = contextlib.nullcontext() if args.verbose else contextlib.redirect_stdout(io.StringIO())
+    try:
+        with output:
+            rows, calls = asyncio.run(main_async(args))
+    finally:
+        if not args.keep:
+            shutil.rmtree(_workdir, ignore_errors=True)
+
+    print_table(rows, float_format=".1f", min_width=10)
+    print(f"Bot API calls: {calls}")
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(rows, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
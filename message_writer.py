@@ -0,0 +1,54 @@
+# message_writer.py
+
+import logging
+import queue
+import threading
+
+
+class MessageWriter:
+    """Saves chat messages from a background thread, in submission order.
+
+    Handlers enqueue messages and reply without waiting for the database.
+    """
+
+    def __init__(self):
+        self._queue = queue.Queue()
+        self._thread = None
+        self._start_lock = threading.Lock()
+
+    def save_message(self, db_service, conversation_id, sender, user_id, message):
+        self._ensure_started()
+        self._queue.put((db_service, conversation_id, sender, user_id, message))
+
+    def flush(self):
+        """Block until every queued message is written."""
+        self._queue.join()
+
+    def close(self):
+        with self._start_lock:
+            thread = self._thread
+            self._thread = None
+        if thread:
+            self._queue.put(None)
+            thread.join()
+
+    def _ensure_started(self):
+        with self._start_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._write_messages, name="message-writer", daemon=True
+                )
+                self._thread.start()
+
+    def _write_messages(self):
+        while True:
+            item = self._queue.get()
+            try:
+                if item is None:
+                    return
+                db_service, conversation_id, sender, user_id, message = item
+                db_service.save_message(conversation_id, sender, user_id, message)
+            except Exception as e:
+                logging.error(f"Error saving message: {e}")
+            finally:
+                self._queue.task_done()
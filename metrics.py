@@ -0,0 +1,207 @@
+# metrics.py
+
+import asyncio
+import bisect
+import contextvars
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Upper bounds in seconds, from fast DB reads to slow ingestion phases
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+# Event loop lag is healthy below a few milliseconds
+LAG_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5)
+
+# Stage -> seconds of the update being handled, see collect_timings
+_current_timings = contextvars.ContextVar("current_timings", default=None)
+
+
+class Histogram:
+    """Prometheus-style cumulative histogram with one series per stage.
+
+    With ``label=None`` there is a single unlabelled series, observed
+    under the stage None.
+    """
+
+    def __init__(self, name, help_text, buckets=DEFAULT_BUCKETS, label="stage"):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = tuple(buckets)
+        self.label = label
+        self._lock = threading.Lock()
+        # stage -> [count per bucket (last one is +Inf), sum, count]
+        self._series = {}
+
+    def observe(self, stage, seconds):
+        index = bisect.bisect_left(self.buckets, seconds)
+        with self._lock:
+            series = self._series.get(stage)
+            if series is None:
+                series = self._series[stage] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += seconds
+            series[2] += 1
+
+    def quantile(self, stage, q):
+        """Estimate of the q-quantile, interpolated within its bucket like histogram_quantile."""
+        with self._lock:
+            series = self._series.get(stage)
+            if not series or not series[2]:
+                return None
+            bucket_counts, count = list(series[0]), series[2]
+        rank = q * count
+        cumulative = 0
+        lower = 0.0
+        for upper, bucket_count in zip(self.buckets + (float("inf"),), bucket_counts):
+            if bucket_count and cumulative + bucket_count >= rank:
+                if upper == float("inf"):
+                    return lower
+                return lower + (upper - lower) * (rank - cumulative) / bucket_count
+            cumulative += bucket_count
+            lower = upper
+        return lower
+
+    def stages(self):
+        with self._lock:
+            return list(self._series)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = {stage: (list(counts), total, count) for stage, (counts, total, count) in self._series.items()}
+        for stage in sorted(series, key=str):
+            counts, total, count = series[stage]
+            label = f'{self.label}="{stage}"' if self.label else ""
+            prefix = f"{label}," if label else ""
+            cumulative = 0
+            for upper, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                lines.append(f'{self.name}_bucket{{{prefix}le="{upper}"}} {cumulative}')
+            lines.append(f'{self.name}_bucket{{{prefix}le="+Inf"}} {count}')
+            suffix = f"{{{label}}}" if label else ""
+            lines.append(f"{self.name}_sum{suffix} {total}")
+            lines.append(f"{self.name}_count{suffix} {count}")
+        return "\n".join(lines) + "\n"
+
+
+stage_seconds = Histogram(
+    "ask_andrew_stage_seconds",
+    "Time spent per stage of handling updates and indexing documents.",
+)
+event_loop_lag_seconds = Histogram(
+    "ask_andrew_event_loop_lag_seconds",
+    "How late the event loop woke up a sleeping task.",
+    buckets=LAG_BUCKETS,
+    label=None,
+)
+
+
+@contextmanager
+def span(stage):
+    """Time a block as ``stage``: into the histogram and the current update's timings."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        stage_seconds.observe(stage, elapsed)
+        timings = _current_timings.get()
+        if timings is not None:
+            timings[stage] = round(timings.get(stage, 0.0) + elapsed, 4)
+
+
+@contextmanager
+def collect_timings():
+    """Collect the spans of the current update into a dict.
+
+    Nested calls share the outer dict. Work started with asyncio.to_thread
+    inherits it; plain thread pools need contextvars.copy_context().
+    """
+    timings = _current_timings.get()
+    if timings is not None:
+        yield timings
+        return
+    timings = {}
+    token = _current_timings.set(timings)
+    try:
+        yield timings
+    finally:
+        _current_timings.reset(token)
+
+
+def current_timings():
+    return _current_timings.get()
+
+
+def detached_context():
+    """Copy of the current context without the update's timings.
+
+    Pass it to asyncio.create_task for background work that outlives the
+    update, so its spans do not land in (or mutate) a finished update's
+    timings. Other context, such as llm_usage.usage_scope, is kept.
+    """
+    context = contextvars.copy_context()
+    context.run(_current_timings.set, None)
+    return context
+
+
+class EventLoopLagMonitor:
+    """Samples how late the event loop wakes up a sleeping task.
+
+    Lag means handlers run blocking code on the loop. Samples go to
+    event_loop_lag_seconds.
+    """
+
+    def __init__(self, interval=1.0):
+        self.interval = interval
+        self.last_lag = 0.0
+        self._task = None
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._sample())
+
+    def stop(self):
+        if self._task:
+            self._task.cancel()
+            self._task = None
+
+    async def _sample(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            started = loop.time()
+            await asyncio.sleep(self.interval)
+            self.last_lag = max(0.0, loop.time() - started - self.interval)
+            event_loop_lag_seconds.observe(None, self.last_lag)
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.rstrip("/") != "/metrics":
+            self.send_error(404)
+            return
+        body = (stage_seconds.render() + event_loop_lag_seconds.render()).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # Scrapes every few seconds would flood the bot log
+        pass
+
+
+def start_metrics_server(host, port):
+    """Serve /metrics in Prometheus text format from a daemon thread."""
+    try:
+        server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    except OSError as e:
+        logging.error(f"Error starting metrics endpoint on {host}:{port}: {e}")
+        return None
+    thread = threading.Thread(target=server.serve_forever, name="metrics-server", daemon=True)
+    thread.start()
+    logging.info(f"Metrics endpoint listening on http://{host}:{port}/metrics")
+    return server
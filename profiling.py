@@ -0,0 +1,233 @@
+# profiling.py
+
+import asyncio
+import functools
+import json
+import logging
+import os
+import random
+import sys
+import threading
+import time
+import uuid
+from datetime import datetime
+
+from telegram import Update
+
+from settings import (
+    PROFILING,
+    PROFILE_DIR,
+    PROFILE_THRESHOLD_SECONDS,
+    PROFILE_SAMPLE_RATE,
+    PROFILE_SAMPLE_INTERVAL,
+    PROFILE_DISK_QUOTA_MB,
+)
+from metrics import collect_timings
+from llm_usage import current_usage_scope
+
+# Innermost frames of threads that are only waiting
+_IDLE_MODULES = ("threading.py", "queue.py", "selectors.py")
+
+
+def _fold(frame):
+    """'file:function:line;...' from the outermost frame to ``frame``."""
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        names.append(f"{os.path.basename(code.co_filename)}:{code.co_name}:{frame.f_lineno}")
+        frame = frame.f_back
+    return ";".join(reversed(names))
+
+
+def _await_chain(coroutine):
+    """Folded stack of where a suspended coroutine is waiting."""
+    names = []
+    while coroutine is not None:
+        frame = getattr(coroutine, "cr_frame", None)
+        if frame is None:
+            break
+        code = frame.f_code
+        names.append(f"{os.path.basename(code.co_filename)}:{code.co_name}:{frame.f_lineno}")
+        coroutine = getattr(coroutine, "cr_await", None)
+    return ";".join(names)
+
+
+class _Session:
+    def __init__(self, name, user_id, thread_id, coroutine=None):
+        self.name = name
+        self.user_id = user_id
+        self.thread_id = thread_id
+        self.coroutine = coroutine
+        self.started_at = datetime.now()
+        self.samples = {}
+        self.sample_count = 0
+
+    def add(self, stack):
+        self.samples[stack] = self.samples.get(stack, 0) + 1
+
+
+class SamplingProfiler:
+    """Captures stack samples of some calls and keeps the profiles of slow ones.
+
+    A ``sample_rate`` share of wrapped calls is sampled every ``interval``
+    seconds by one shared thread. Sync calls sample the calling thread.
+    Coroutines sample their await chain and whatever blocks the event loop.
+    Calls slower than ``threshold`` seconds are written to ``directory`` as
+    JSON with folded stacks (flamegraph input). The oldest profiles are
+    deleted to stay under ``disk_quota`` bytes.
+    """
+
+    def __init__(self, directory=PROFILE_DIR, threshold=PROFILE_THRESHOLD_SECONDS,
+                 sample_rate=PROFILE_SAMPLE_RATE, interval=PROFILE_SAMPLE_INTERVAL,
+                 disk_quota=PROFILE_DISK_QUOTA_MB * 2**20):
+        self.directory = directory
+        self.threshold = threshold
+        self.sample_rate = sample_rate
+        self.interval = interval
+        self.disk_quota = disk_quota
+        self.written = 0
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._sessions = set()
+        self._thread = None
+
+    def wrap(self, name, func):
+        if asyncio.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                if random.random() >= self.sample_rate:
+                    return await func(*args, **kwargs)
+                coroutine = func(*args, **kwargs)
+                session = _Session(name, user_id_of(args), threading.get_ident(), coroutine)
+                with collect_timings() as timings:
+                    started = time.perf_counter()
+                    self._start(session)
+                    try:
+                        return await coroutine
+                    finally:
+                        self._stop(session)
+                        elapsed = time.perf_counter() - started
+                        if elapsed >= self.threshold:
+                            await asyncio.to_thread(self.write_profile, session, elapsed, dict(timings))
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if random.random() >= self.sample_rate:
+                return func(*args, **kwargs)
+            session = _Session(name, user_id_of(args), threading.get_ident())
+            with collect_timings() as timings:
+                started = time.perf_counter()
+                self._start(session)
+                try:
+                    return func(*args, **kwargs)
+                finally:
+                    self._stop(session)
+                    elapsed = time.perf_counter() - started
+                    if elapsed >= self.threshold:
+                        self.write_profile(session, elapsed, dict(timings))
+        return wrapper
+
+    def _start(self, session):
+        with self._lock:
+            self._sessions.add(session)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._sample, name="profiler", daemon=True)
+                self._thread.start()
+
+    def _stop(self, session):
+        with self._lock:
+            self._sessions.discard(session)
+
+    def _sample(self):
+        while True:
+            time.sleep(self.interval)
+            with self._lock:
+                sessions = list(self._sessions)
+                if not sessions:
+                    # Restarted by the next sampled call
+                    self._thread = None
+                    return
+            frames = sys._current_frames()
+            for session in sessions:
+                session.sample_count += 1
+                frame = frames.get(session.thread_id)
+                if frame is not None and not frame.f_code.co_filename.endswith(_IDLE_MODULES):
+                    prefix = "loop" if session.coroutine is not None else "thread"
+                    session.add(f"{prefix};{_fold(frame)}")
+                if session.coroutine is not None:
+                    chain = _await_chain(session.coroutine)
+                    if chain:
+                        session.add(f"await;{chain}")
+            # Frames keep their locals alive
+            del frames
+
+    def write_profile(self, session, elapsed, timings):
+        profile = {
+            "name": session.name,
+            "user_id": session.user_id,
+            "started_at": session.started_at.isoformat(timespec="seconds"),
+            "elapsed_seconds": round(elapsed, 4),
+            "threshold_seconds": self.threshold,
+            "timings": timings,
+            "sample_interval": self.interval,
+            "sample_count": session.sample_count,
+            "samples": sorted(session.samples.items(), key=lambda item: item[1], reverse=True),
+        }
+        file_name = (
+            f"{session.started_at.strftime('%Y%m%d-%H%M%S')}_{session.name}_"
+            f"{session.user_id}_{uuid.uuid4().hex[:8]}.json"
+        )
+        try:
+            data = json.dumps(profile, indent=1, default=str).encode("utf-8")
+            with self._write_lock:
+                os.makedirs(self.directory, exist_ok=True)
+                if not self._make_room(len(data)):
+                    logging.warning(f"Profile of {session.name} dropped, larger than the disk quota")
+                    return None
+                path = os.path.join(self.directory, file_name)
+                with open(path, "wb") as f:
+                    f.write(data)
+        except Exception as e:
+            # Profiling must never fail the profiled call
+            logging.error(f"Error writing profile of {session.name}: {e}")
+            return None
+        self.written += 1
+        logging.warning(f"{session.name} took {elapsed:.1f}s, profile written to {path}")
+        return path
+
+    def _make_room(self, size):
+        """Delete the oldest profiles until ``size`` more bytes fit in the quota."""
+        if size > self.disk_quota:
+            return False
+        profiles = []
+        for entry in os.scandir(self.directory):
+            if entry.is_file() and entry.name.endswith(".json"):
+                stat = entry.stat()
+                profiles.append((stat.st_mtime, entry.path, stat.st_size))
+        profiles.sort()
+        used = sum(profile_size for _, _, profile_size in profiles)
+        while profiles and used + size > self.disk_quota:
+            _, path, profile_size = profiles.pop(0)
+            os.remove(path)
+            used -= profile_size
+        return True
+
+
+def user_id_of(args):
+    """The user of a handler's update argument, else the user calls are billed to."""
+    for arg in args:
+        if isinstance(arg, Update) and arg.effective_user:
+            return arg.effective_user.id
+    return current_usage_scope()["user_id"]
+
+
+profiler = SamplingProfiler()
+
+
+def profile_methods(cls, names, profiler=profiler, enabled=PROFILING):
+    """Wrap methods of ``cls`` with the profiler when profiling is switched on."""
+    if not enabled:
+        return
+    for name in names:
+        setattr(cls, name, profiler.wrap(f"{cls.__name__}.{name}", getattr(cls, name)))
@@ -0,0 +1,185 @@
+# retrieval_eval.py
+"""Compare retrieval quality and speed across chunking, k and index settings.
+
+    python retrieval_eval.py --folder <project folder> --labels labels.json
+    python retrieval_eval.py --chunk-sizes 500,1000,2000 --k 2,5,10 --indexes flat,hnsw,ivf
+
+Labels are a JSON list of {"question": ..., "sources": [file names]}. Without
+--folder a corpus_generator corpus is evaluated, with one question per
+generated fact. Embeddings come from fake_backends.HashingEmbeddings, so runs
+are offline and repeatable; compare configurations against each other rather
+than reading the numbers as production quality.
+"""
+
+import argparse
+import json
+import os
+import statistics
+import tempfile
+import time
+
+import faiss
+import numpy as np
+from langchain.text_splitter import CharacterTextSplitter, RecursiveCharacterTextSplitter
+from langchain_community.docstore.in_memory import InMemoryDocstore
+from langchain_community.vectorstores import FAISS
+
+import corpus_generator
+import fake_backends
+import llm_clients
+from dir_cache import directory_cache
+from helpers import print_table
+from llm_service import LLMService
+from llm_usage import count_text_tokens
+from settings import DOCS_IN_RETRIEVER
+
+SPLITTERS = {
+    "character": CharacterTextSplitter,
+    "recursive": RecursiveCharacterTextSplitter,
+}
+
+
+def generated_labels(facts):
+    """One question per corpus_generator fact, worded without the fact number."""
+    labels = []
+    for file_name, text in facts.values():
+        statement = text.split(": ", 1)[1].rstrip(".")
+        for subject in corpus_generator.SUBJECTS:
+            if statement.startswith(subject):
+                statement = statement[len(subject) + 1:]
+                break
+        labels.append({"question": f"Who {statement}?", "sources": [file_name]})
+    return labels
+
+
+def build_index(index_type, embeddings, texts, vectors, metadatas):
+    """A FAISS vector store over precomputed vectors with the given index type."""
+    matrix = np.array(vectors, dtype="float32")
+    dimension = matrix.shape[1]
+    if index_type == "flat":
+        # What llm_service builds via FAISS.from_embeddings
+        index = faiss.IndexFlatL2(dimension)
+    elif index_type == "hnsw":
+        index = faiss.IndexHNSWFlat(dimension, 32)
+    elif index_type == "ivf":
+        lists = max(1, int(len(texts) ** 0.5))
+        index = faiss.IndexIVFFlat(faiss.IndexFlatL2(dimension), dimension, lists)
+        index.train(matrix)
+        index.nprobe = max(1, lists // 4)
+    else:
+        raise ValueError(f"Unknown index type: {index_type}")
+
+    vector_store = FAISS(embeddings, index, InMemoryDocstore(), {})
+    vector_store.add_embeddings(list(zip(texts, vectors)), metadatas=metadatas)
+    return vector_store
+
+
+def score(results, expected_sources):
+    """(recall, reciprocal rank) of one ranked result list."""
+    sources = [doc.metadata.get("source") for doc in results]
+    recall = len(set(sources) & expected_sources) / len(expected_sources)
+    for rank, source in enumerate(sources, start=1):
+        if source in expected_sources:
+            return recall, 1 / rank
+    return recall, 0.0
+
+
+def evaluate(documents, labels, embeddings, splitter, chunk_size, overlap, index_types, ks):
+    """Rows of metrics for one chunking, per index type and k."""
+    text_splitter = SPLITTERS[splitter](chunk_size=chunk_size, chunk_overlap=overlap)
+    chunks = text_splitter.split_documents(documents)
+    texts = [chunk.page_content for chunk in chunks]
+
+    started = time.perf_counter()
+    vectors = embeddings.embed_documents(texts)
+    embed_seconds = time.perf_counter() - started
+
+    rows = []
+    for index_type in index_types:
+        started = time.perf_counter()
+        vector_store = build_index(index_type, embeddings, texts, vectors, [chunk.metadata for chunk in chunks])
+        build_seconds = embed_seconds + time.perf_counter() - started
+
+        for k in ks:
+            recalls, reciprocal_ranks, latencies, context_tokens = [], [], [], []
+            for label in labels:
+                started = time.perf_counter()
+                results = vector_store.similarity_search(label["question"], k=k)
+                latencies.append(time.perf_counter() - started)
+                recall, reciprocal_rank = score(results, set(label["sources"]))
+                recalls.append(recall)
+                reciprocal_ranks.append(reciprocal_rank)
+                context_tokens.append(count_text_tokens(doc.page_content for doc in results))
+            rows.append({
+                "splitter": splitter,
+                "chunk_size": chunk_size,
+                "overlap": overlap,
+                "index": index_type,
+                "k": k,
+                "chunks": len(chunks),
+                "recall": statistics.mean(recalls),
+                "mrr": statistics.mean(reciprocal_ranks),
+                "build_s": build_seconds,
+                "query_ms": statistics.median(latencies) * 1000,
+                "context_tokens": statistics.mean(context_tokens),
+            })
+    return rows
+
+
+def parse_list(value, convert=str):
+    return [convert(item) for item in value.split(",") if item]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--folder", help="Project folder to evaluate, requires --labels")
+    parser.add_argument("--labels", help="JSON file of questions and expected source files")
+    parser.add_argument("--files", type=int, default=30, help="Generated corpus size")
+    parser.add_argument("--paragraphs", type=int, default=40, help="Filler paragraphs per generated file")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--splitters", default="character", help=f"Any of {','.join(SPLITTERS)}")
+    parser.add_argument("--chunk-sizes", default="500,1000,2000")
+    parser.add_argument("--overlaps", default="100")
+    parser.add_argument("--k", default=f"2,{DOCS_IN_RETRIEVER},10")
+    parser.add_argument("--indexes", default="flat,hnsw", help="Any of flat,hnsw,ivf")
+    parser.add_argument("--embedding-size", type=int, default=256)
+    parser.add_argument("--json", help="Also write the rows to this file")
+    args = parser.parse_args()
+    if args.folder and not args.labels:
+        parser.error("--folder requires --labels")
+
+    fake_backends.install(embedding_size=args.embedding_size)
+    embeddings = llm_clients.get_embeddings()
+    rows = []
+    try:
+        with tempfile.TemporaryDirectory() as workdir:
+            folder_path = args.folder
+            if folder_path:
+                with open(args.labels, encoding="utf-8") as f:
+                    labels = json.load(f)
+            else:
+                folder_path = os.path.join(workdir, "corpus")
+                facts = corpus_generator.generate_corpus(folder_path, args.files, args.paragraphs, seed=args.seed)
+                labels = generated_labels(facts)
+            documents = LLMService().load_documents(folder_path, directory_cache.valid_files(folder_path))
+
+        ks = sorted(set(parse_list(args.k, int)))
+        for splitter in parse_list(args.splitters):
+            for chunk_size in parse_list(args.chunk_sizes, int):
+                for overlap in parse_list(args.overlaps, int):
+                    rows.extend(evaluate(
+                        documents, labels, embeddings, splitter, chunk_size, overlap,
+                        parse_list(args.indexes), ks,
+                    ))
+    finally:
+        fake_backends.uninstall()
+
+    print(f"{len(labels)} questions over {len(documents)} documents")
+    print_table(rows)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(rows, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,38 @@
+# session_store.py
+
+import asyncio
+import logging
+
+from dir_cache import directory_cache
+
+
+async def restore_session(db_service, llm_service, user_id, user_data):
+    """Rehydrate ``user_data`` on the first update after a restart.
+
+    The user's last folder comes from the folders table (see save_folder).
+    It is attached to an index that is already in memory or in the index
+    cache; documents are never ingested here. Returns True if a session was
+    restored.
+    """
+    if user_data.get("session_restored"):
+        return False
+    user_data["session_restored"] = True
+    if "folder_path" in user_data:
+        # Set by this process already, nothing to restore
+        return False
+
+    folder_path = await asyncio.to_thread(db_service.get_last_folder, user_id)
+    if not folder_path or not directory_cache.is_dir(folder_path):
+        return False
+
+    try:
+        user_data["folder_path"] = folder_path
+        user_data["valid_files_in_folder"] = await asyncio.to_thread(
+            directory_cache.valid_files, folder_path
+        )
+        if await asyncio.to_thread(llm_service.attach_index, folder_path):
+            user_data["vector_store_loaded"] = True
+    except OSError as e:
+        logging.warning(f"Error restoring session folder {folder_path}: {e}")
+        return False
+    return True
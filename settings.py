@@ -8,6 +8,10 @@ load_dotenv()
 TELEGRAM_TOKEN = os.getenv("TELEGRAM_TOKEN")
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 
+# Storage backend: "postgres" or "sqlite" (embedded, single node)
+DB_BACKEND = os.getenv("DB_BACKEND", "postgres")
+SQLITE_PATH = os.getenv("SQLITE_PATH", "ask_andrew_bot.sqlite3")
+
 MODEL_NAME = "gpt-4o"
 """
 gpt-4o
@@ -35,4 +39,120 @@ KNOWLEDGE_BASE_PATH = (
 )
 
 CHAT_HISTORY_LEVEL=10
-DOCS_IN_RETRIEVER=5
\ No newline at end of file
+DOCS_IN_RETRIEVER=5
+
+# Seconds an access decision stays cached in AuthService
+AUTH_CACHE_TTL = 300
+# Postgres NOTIFY channel used to broadcast access changes between processes
+ACCESS_CHANGES_CHANNEL = "user_access_changed"
+# Seconds between bulk writes of users.last_active
+LAST_ACTIVE_FLUSH_INTERVAL = 60
+
+# Exception logging: one row per stack fingerprint per window, capped inserts
+EXCEPTION_WINDOW_SECONDS = 60
+EXCEPTION_MAX_INSERTS_PER_WINDOW = 20
+EXCEPTION_CONTEXT_MAX_CHARS = 2000
+
+# Time-partitioned log tables: table -> partition column
+PARTITIONED_TABLES = {"messages": "date", "event_log": "timestamp"}
+PARTITION_MONTHS_AHEAD = 2
+# Partitions older than this are detached, exported to ARCHIVE_DIR and dropped
+RETENTION_MONTHS = 12
+ARCHIVE_DIR = os.getenv("ARCHIVE_DIR", "archive")
+# Chat history is only read from recent partitions
+HISTORY_LOOKBACK_DAYS = 90
+
+# Concurrent update handling: updates of different users run in parallel on
+# UPDATE_WORKERS slots, each user's updates stay ordered
+UPDATE_WORKERS = int(os.getenv("UPDATE_WORKERS", "16"))
+MAX_PENDING_UPDATES = 256
+
+# Update delivery: "polling" or "webhook"
+BOT_MODE = os.getenv("BOT_MODE", "polling")
+# Public base URL Telegram posts to, e.g. https://bot.example.com
+WEBHOOK_URL = os.getenv("WEBHOOK_URL")
+WEBHOOK_LISTEN = os.getenv("WEBHOOK_LISTEN", "0.0.0.0")
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", "8443"))
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "telegram")
+# Checked against the X-Telegram-Bot-Api-Secret-Token header of every request
+WEBHOOK_SECRET_TOKEN = os.getenv("WEBHOOK_SECRET_TOKEN")
+
+# LLM admission control: concurrent OpenAI calls and max seconds in the queue
+LLM_MAX_CONCURRENT_REQUESTS = int(os.getenv("LLM_MAX_CONCURRENT_REQUESTS", "8"))
+LLM_QUEUE_TIMEOUT = 120
+
+# Shared HTTP connection pool for all OpenAI clients
+OPENAI_MAX_CONNECTIONS = 20
+OPENAI_TIMEOUT = 60
+
+VALID_FILE_EXTENSIONS = (".pdf", ".docx", ".xlsx")
+# Seconds between background rescans of cached document folders
+DIR_SCAN_REFRESH_INTERVAL = 60
+# Folders unused for this long are no longer rescanned, and at most this
+# many listings are kept (least recently used are dropped first)
+DIR_SCAN_IDLE_SECONDS = 3600
+DIR_SCAN_MAX_FOLDERS = 200
+
+# Built FAISS indexes are saved here and reloaded while their folder is unchanged
+INDEX_CACHE_DIR = os.getenv("INDEX_CACHE_DIR", "index_cache")
+# Indexes kept in memory; evicted ones are reloaded from INDEX_CACHE_DIR
+INDEX_MEMORY_MAX_FOLDERS = int(os.getenv("INDEX_MEMORY_MAX_FOLDERS", "8"))
+INDEX_IDLE_SECONDS = 6 * 3600
+# Number of indexes loaded or built in parallel by the startup warm-up
+INDEX_WARMUP_CONCURRENCY = 2
+
+# Answer FOLLOWING_QUESTIONS in the background once a project index is ready
+PREFETCH_SUGGESTED_ANSWERS = True
+
+# Question answering: "sequential", or "pipelined" to search documents while
+# the chat history loads and the question is rewritten
+QA_MODE = os.getenv("QA_MODE", "sequential")
+
+# Conversation history: the latest conversations go into prompts verbatim,
+# older ones are folded into a per-user summary in the background
+CONVERSATION_SUMMARIES = True
+HISTORY_VERBATIM_CONVERSATIONS = 3
+# Conversations collected past the verbatim window before the summary is updated
+SUMMARY_BATCH_CONVERSATIONS = 3
+SUMMARY_MAX_WORDS = 250
+
+# Chat model per pipeline stage. "simple_answer" is used for questions the
+# classifier marks as simple lookups when COMPLEXITY_ROUTING is on.
+MODEL_ROUTING = {
+    "rewrite": "gpt-4o-mini",
+    "answer": MODEL_NAME,
+    "simple_answer": "gpt-4o-mini",
+    "summarization": "gpt-4o-mini",
+    "classification": "gpt-4o-mini",
+}
+COMPLEXITY_ROUTING = os.getenv("COMPLEXITY_ROUTING", "off") == "on"
+
+# Local Prometheus endpoint with per-stage latency histograms (0 disables it)
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+METRICS_PORT = int(os.getenv("METRICS_PORT", "9464"))
+# Seconds between event-loop lag samples, see metrics.EventLoopLagMonitor
+EVENT_LOOP_LAG_INTERVAL = float(os.getenv("EVENT_LOOP_LAG_INTERVAL", "1.0"))
+
+# Stack-sampling profiler for slow handlers and LLM calls, see profiling.py.
+# A share of calls is sampled; profiles of those slower than the threshold
+# are written to PROFILE_DIR, oldest deleted beyond the quota.
+PROFILING = os.getenv("PROFILING", "off") == "on"
+PROFILE_DIR = os.getenv("PROFILE_DIR", "profiles")
+PROFILE_THRESHOLD_SECONDS = float(os.getenv("PROFILE_THRESHOLD_SECONDS", "10"))
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0.1"))
+PROFILE_SAMPLE_INTERVAL = 0.01
+PROFILE_DISK_QUOTA_MB = int(os.getenv("PROFILE_DISK_QUOTA_MB", "100"))
+
+# USD per million tokens: (input, cached input, output). Response model names
+# such as "gpt-4o-2024-08-06" match the longest prefix.
+MODEL_PRICES = {
+    "gpt-4o": (2.50, 1.25, 10.00),
+    "gpt-4o-mini": (0.15, 0.075, 0.60),
+}
+EMBEDDING_PRICES = {
+    "text-embedding-ada-002": 0.10,
+    "text-embedding-3-small": 0.02,
+    "text-embedding-3-large": 0.13,
+}
+# Seconds between batched writes of token usage counters
+TOKEN_USAGE_FLUSH_INTERVAL = 60
@@ -0,0 +1,529 @@
+# sqlite_db_service.py
+import json
+import sqlite3
+import threading
+from collections import defaultdict
+from datetime import datetime, date, timedelta
+
+from db_service import DatabaseService
+from settings import SQLITE_PATH, HISTORY_LOOKBACK_DAYS
+
+SCHEMA = [
+    """
+    CREATE TABLE IF NOT EXISTS users (
+        user_id INTEGER PRIMARY KEY,
+        user_name TEXT,
+        language_code TEXT,
+        date_joined TEXT,
+        last_active TEXT,
+        is_active INTEGER NOT NULL DEFAULT 1,
+        access INTEGER NOT NULL DEFAULT 0,
+        role TEXT
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS folders (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER,
+        user_name TEXT,
+        folder TEXT,
+        date_time TEXT
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS folders_user_idx ON folders (user_id, date_time)",
+    """
+    CREATE TABLE IF NOT EXISTS messages (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        conversation_id TEXT,
+        sender_type TEXT,
+        user_id INTEGER,
+        message_text TEXT,
+        date TEXT NOT NULL DEFAULT (date('now', 'localtime')),
+        timestamp TEXT NOT NULL DEFAULT (strftime('%H:%M:%f', 'now', 'localtime'))
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS messages_user_idx ON messages (user_id, date)",
+    "CREATE INDEX IF NOT EXISTS messages_conversation_idx ON messages (conversation_id)",
+    """
+    CREATE TABLE IF NOT EXISTS event_log (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER,
+        event_type TEXT,
+        user_message TEXT,
+        system_response TEXT,
+        conversation_id TEXT,
+        timestamp TEXT,
+        timings TEXT
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS exceptions (
+        exception_id TEXT PRIMARY KEY,
+        exception_type TEXT,
+        exception_message TEXT,
+        stack_trace TEXT,
+        occurred_at TEXT,
+        user_id INTEGER,
+        data_context TEXT,
+        resolved INTEGER,
+        resolved_at TEXT,
+        resolver_notes TEXT,
+        fingerprint TEXT,
+        occurrence_count INTEGER NOT NULL DEFAULT 1,
+        last_occurred_at TEXT
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS exceptions_fingerprint_idx ON exceptions (fingerprint)",
+    """
+    CREATE TABLE IF NOT EXISTS telegram_file_cache (
+        file_path TEXT PRIMARY KEY,
+        file_size INTEGER NOT NULL,
+        file_mtime REAL NOT NULL,
+        file_id TEXT NOT NULL,
+        updated_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS token_usage (
+        day TEXT NOT NULL,
+        user_id INTEGER NOT NULL,
+        project TEXT NOT NULL,
+        model TEXT NOT NULL,
+        requests INTEGER NOT NULL DEFAULT 0,
+        prompt_tokens INTEGER NOT NULL DEFAULT 0,
+        completion_tokens INTEGER NOT NULL DEFAULT 0,
+        cached_tokens INTEGER NOT NULL DEFAULT 0,
+        embedding_tokens INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (day, user_id, project, model)
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS conversation_summaries (
+        user_id INTEGER PRIMARY KEY,
+        summary TEXT NOT NULL,
+        summarized_until TEXT NOT NULL,
+        updated_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP
+    )
+    """,
+]
+
+# Columns added after the first release: (table, column, type)
+COLUMN_MIGRATIONS = [
+    ("event_log", "timings", "TEXT"),
+]
+
+
+def to_text(value):
+    if isinstance(value, datetime):
+        return value.isoformat(sep=" ")
+    if isinstance(value, date):
+        return value.isoformat()
+    return value
+
+
+class SQLiteDatabaseService(DatabaseService):
+    """Embedded storage backend for single-node deployments and load tests."""
+
+    def __init__(self, path=SQLITE_PATH):
+        self.path = path
+        # One connection per service, shared by the bot's worker threads
+        self._lock = threading.Lock()
+        self.conn = self.connect()
+        self.ensure_schema()
+
+    def connect(self):
+        connection = sqlite3.connect(
+            self.path, check_same_thread=False, isolation_level=None, timeout=30
+        )
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("PRAGMA synchronous=NORMAL")
+        return connection
+
+    def _execute(self, query, params=(), many=False):
+        with self._lock:
+            if not many:
+                return self.conn.execute(query, params)
+            # Batches are written in one transaction
+            self.conn.execute("BEGIN")
+            try:
+                cursor = self.conn.executemany(query, params)
+                self.conn.execute("COMMIT")
+                return cursor
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+
+    def ensure_schema(self):
+        with self._lock:
+            for statement in SCHEMA:
+                self.conn.execute(statement)
+            for table, column, column_type in COLUMN_MIGRATIONS:
+                columns = [row[1] for row in self.conn.execute(f"PRAGMA table_info({table})")]
+                if column not in columns:
+                    self.conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {column_type}")
+
+    def save_folder(self, user_id, user_name, folder):
+        try:
+            date_time = datetime.now().strftime("%Y-%m-%d, %H:%M:%S")
+            self._execute(
+                "INSERT INTO folders (user_id, user_name, folder, date_time) VALUES (?, ?, ?, ?)",
+                (user_id, user_name, folder, date_time),
+            )
+            print("Contex Folder Data SAVED!!!")
+        except Exception as e:
+            print(f"Error saving folder data: {e}")
+
+    def get_last_folder(self, user_id):
+        try:
+            row = self._execute(
+                "SELECT folder FROM folders WHERE user_id = ? ORDER BY date_time DESC, id DESC LIMIT 1",
+                (user_id,),
+            ).fetchone()
+            return row[0] if row else None
+        except Exception as e:
+            print(f"An error occurred while fetching folder: {e}")
+            return None
+
+    def save_event_log(self, user_id, event_type, user_message, system_response, conversation_id, timestamp=None, timings=None):
+        try:
+            if timestamp is None:
+                timestamp = datetime.now()
+            self._execute(
+                """
+                INSERT INTO event_log (user_id, event_type, user_message, system_response, conversation_id, timestamp, timings)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+                """,
+                (
+                    user_id,
+                    event_type,
+                    user_message,
+                    system_response,
+                    conversation_id,
+                    to_text(timestamp),
+                    json.dumps(timings) if timings else None,
+                ),
+            )
+            print("Event log saved successfully.")
+        except Exception as e:
+            print(f"Error saving event log: {e}")
+
+    def log_exception(
+        self,
+        exception_id,
+        exception_type,
+        exception_message,
+        stack_trace,
+        occurred_at,
+        user_id,
+        data_context,
+        resolved,
+        resolved_at=None,
+        resolver_notes=None,
+        fingerprint=None,
+        occurrence_count=1,
+    ):
+        try:
+            self._execute(
+                """
+                INSERT INTO exceptions (exception_id, exception_type, exception_message, stack_trace, occurred_at, user_id, data_context, resolved, resolved_at, resolver_notes, fingerprint, occurrence_count, last_occurred_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                """,
+                (
+                    exception_id,
+                    exception_type,
+                    exception_message,
+                    stack_trace,
+                    to_text(occurred_at),
+                    user_id,
+                    data_context,
+                    resolved,
+                    to_text(resolved_at),
+                    resolver_notes,
+                    fingerprint,
+                    occurrence_count,
+                    to_text(occurred_at),
+                ),
+            )
+        except Exception as e:
+            print(f"Failed to log exception: {e}")
+
+    def add_exception_occurrences(self, rows):
+        try:
+            self._execute(
+                """
+                UPDATE exceptions
+                SET occurrence_count = occurrence_count + ?,
+                    last_occurred_at = MAX(COALESCE(last_occurred_at, ''), ?)
+                WHERE exception_id = ?
+                """,
+                [(count, to_text(last_occurred_at), exception_id) for exception_id, count, last_occurred_at in rows],
+                many=True,
+            )
+        except Exception as e:
+            print(f"Failed to update exception counters: {e}")
+
+    def save_message(self, conversation_id, sender_type, user_id, message_text):
+        try:
+            self._execute(
+                "INSERT INTO messages (conversation_id, sender_type, user_id, message_text) VALUES (?, ?, ?, ?)",
+                (conversation_id, sender_type, user_id, message_text),
+            )
+            print("Message saved successfully")
+        except Exception as e:
+            print(f"Error saving message: {e}")
+
+    def get_chat_history(self, dialog_numbers, user_id):
+        try:
+            since = (date.today() - timedelta(days=HISTORY_LOOKBACK_DAYS)).isoformat()
+
+            # Step 1: Get the last 'dialog_numbers' conversation_ids for the user
+            conversation_ids = [
+                row[0]
+                for row in self._execute(
+                    """
+                    SELECT conversation_id, MAX(date || ' ' || timestamp) AS last_datetime
+                    FROM messages
+                    WHERE user_id = ? AND sender_type = 'user' AND date >= ?
+                    GROUP BY conversation_id
+                    ORDER BY last_datetime DESC
+                    LIMIT ?
+                    """,
+                    (user_id, since, dialog_numbers),
+                ).fetchall()
+            ]
+            if not conversation_ids:
+                return []
+
+            # Step 2: Fetch messages for these conversation_ids, ordered by datetime
+            placeholders = ", ".join("?" for _ in conversation_ids)
+            messages = self._execute(
+                f"""
+                SELECT conversation_id, sender_type, message_text
+                FROM messages
+                WHERE conversation_id IN ({placeholders}) AND date >= ?
+                ORDER BY conversation_id, date, timestamp, id
+                """,
+                (*conversation_ids, since),
+            ).fetchall()
+
+            conversations = defaultdict(list)
+            for conversation_id, sender_type, message_text in messages:
+                conversations[conversation_id].append((sender_type, message_text))
+
+            # Step 3: Construct the chat history
+            chat_history = []
+            for conversation_id in conversation_ids:
+                for sender_type, message_text in conversations.get(conversation_id, []):
+                    if sender_type == "user":
+                        chat_history.append(f"HumanMessage: {message_text}")
+                    elif sender_type == "bot":
+                        chat_history.append(f"AIMessage: {message_text}")
+            return chat_history
+
+        except Exception as e:
+            print(f"An error occurred: {e}")
+            return []
+
+    def get_conversations(self, user_id, after=None, limit=None):
+        try:
+            since = (date.today() - timedelta(days=HISTORY_LOOKBACK_DAYS)).isoformat()
+            conversation_data = self._execute(
+                """
+                SELECT conversation_id, MAX(date || ' ' || timestamp) AS last_datetime
+                FROM messages
+                WHERE user_id = ? AND sender_type = 'user' AND date >= ?
+                GROUP BY conversation_id
+                HAVING ? IS NULL OR MAX(date || ' ' || timestamp) > ?
+                ORDER BY last_datetime DESC
+                LIMIT ?
+                """,
+                (user_id, since, to_text(after), to_text(after), -1 if limit is None else limit),
+            ).fetchall()[::-1]
+            if not conversation_data:
+                return []
+
+            conversation_ids = [row[0] for row in conversation_data]
+            placeholders = ", ".join("?" for _ in conversation_ids)
+            messages = self._execute(
+                f"""
+                SELECT conversation_id, sender_type, message_text
+                FROM messages
+                WHERE conversation_id IN ({placeholders}) AND date >= ?
+                ORDER BY date, timestamp, id
+                """,
+                (*conversation_ids, since),
+            ).fetchall()
+
+            conversations = defaultdict(list)
+            for conversation_id, sender_type, message_text in messages:
+                if sender_type == "user":
+                    conversations[conversation_id].append(f"HumanMessage: {message_text}")
+                elif sender_type == "bot":
+                    conversations[conversation_id].append(f"AIMessage: {message_text}")
+            return [
+                (last_datetime, conversations.get(conversation_id, []))
+                for conversation_id, last_datetime in conversation_data
+            ]
+
+        except Exception as e:
+            print(f"Error reading conversations: {e}")
+            return []
+
+    def get_conversation_summary(self, user_id):
+        try:
+            return self._execute(
+                "SELECT summary, summarized_until FROM conversation_summaries WHERE user_id = ?",
+                (user_id,),
+            ).fetchone()
+        except Exception as e:
+            print(f"Error reading conversation summary: {e}")
+            return None
+
+    def save_conversation_summary(self, user_id, summary, summarized_until):
+        try:
+            self._execute(
+                """
+                INSERT INTO conversation_summaries (user_id, summary, summarized_until, updated_at)
+                VALUES (?, ?, ?, CURRENT_TIMESTAMP)
+                ON CONFLICT (user_id) DO UPDATE
+                SET summary = excluded.summary,
+                    summarized_until = excluded.summarized_until,
+                    updated_at = excluded.updated_at
+                """,
+                (user_id, summary, to_text(summarized_until)),
+            )
+        except Exception as e:
+            print(f"Error saving conversation summary: {e}")
+
+    def add_token_usage(self, rows):
+        try:
+            self._execute(
+                """
+                INSERT INTO token_usage (
+                    day, user_id, project, model, requests, prompt_tokens,
+                    completion_tokens, cached_tokens, embedding_tokens
+                )
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT (day, user_id, project, model) DO UPDATE
+                SET requests = requests + excluded.requests,
+                    prompt_tokens = prompt_tokens + excluded.prompt_tokens,
+                    completion_tokens = completion_tokens + excluded.completion_tokens,
+                    cached_tokens = cached_tokens + excluded.cached_tokens,
+                    embedding_tokens = embedding_tokens + excluded.embedding_tokens
+                """,
+                [(to_text(day), *rest) for day, *rest in rows],
+                many=True,
+            )
+            return True
+        except Exception as e:
+            print(f"Failed to save token usage: {e}")
+            return False
+
+    def get_token_usage(self, since, user_id=None):
+        try:
+            return self._execute(
+                """
+                SELECT user_id, project, model, SUM(requests), SUM(prompt_tokens),
+                       SUM(completion_tokens), SUM(cached_tokens), SUM(embedding_tokens)
+                FROM token_usage
+                WHERE day >= ? AND (? IS NULL OR user_id = ?)
+                GROUP BY user_id, project, model
+                """,
+                (to_text(since), user_id, user_id),
+            ).fetchall()
+        except Exception as e:
+            print(f"Error reading token usage: {e}")
+            return []
+
+    def get_cached_file_id(self, file_path, file_size, file_mtime):
+        try:
+            row = self._execute(
+                """
+                SELECT file_id FROM telegram_file_cache
+                WHERE file_path = ? AND file_size = ? AND file_mtime = ?
+                """,
+                (file_path, file_size, file_mtime),
+            ).fetchone()
+            return row[0] if row else None
+        except Exception as e:
+            print(f"Error reading cached file_id: {e}")
+            return None
+
+    def save_file_id(self, file_path, file_size, file_mtime, file_id):
+        try:
+            self._execute(
+                """
+                INSERT INTO telegram_file_cache (file_path, file_size, file_mtime, file_id, updated_at)
+                VALUES (?, ?, ?, ?, CURRENT_TIMESTAMP)
+                ON CONFLICT (file_path) DO UPDATE
+                SET file_size = excluded.file_size,
+                    file_mtime = excluded.file_mtime,
+                    file_id = excluded.file_id,
+                    updated_at = excluded.updated_at
+                """,
+                (file_path, file_size, file_mtime, file_id),
+            )
+        except Exception as e:
+            print(f"Error saving file_id: {e}")
+
+    def delete_file_id(self, file_path):
+        try:
+            self._execute("DELETE FROM telegram_file_cache WHERE file_path = ?", (file_path,))
+        except Exception as e:
+            print(f"Error deleting file_id: {e}")
+
+    def check_user_access(self, user_id):
+        try:
+            row = self._execute(
+                "SELECT access FROM users WHERE user_id = ? AND is_active = 1",
+                (user_id,),
+            ).fetchone()
+            return bool(row[0]) if row else False
+        except Exception as e:
+            print(f"Error checking user access: {e}")
+            return False
+
+    def save_user_info(self, user_id, user_name, language_code):
+        now = to_text(datetime.utcnow())
+        try:
+            self._execute(
+                """
+                INSERT INTO users (user_id, user_name, language_code, date_joined, last_active, is_active, access, role)
+                VALUES (?, ?, ?, ?, ?, 1, 0, 'user')
+                ON CONFLICT (user_id) DO UPDATE
+                SET user_name = excluded.user_name,
+                    language_code = excluded.language_code,
+                    last_active = excluded.last_active
+                """,
+                (user_id, user_name, language_code, now, now),
+            )
+            print("User info saved/updated successfully.")
+        except Exception as e:
+            print(f"Error saving user info: {e}")
+
+    def update_last_active(self, user_id):
+        self.bulk_update_last_active([(user_id, datetime.utcnow())])
+
+    def bulk_update_last_active(self, rows):
+        try:
+            self._execute(
+                "UPDATE users SET last_active = ? WHERE user_id = ?",
+                [(to_text(last_active), user_id) for user_id, last_active in rows],
+                many=True,
+            )
+            print(f"last_active updated for {len(rows)} users.")
+            return True
+        except Exception as e:
+            print(f"Error updating last_active in bulk: {e}")
+            return False
+
+    def grant_access(self, user_id):
+        try:
+            self._execute("UPDATE users SET access = 1 WHERE user_id = ?", (user_id,))
+            print(f"Access granted to user {user_id}.")
+        except Exception as e:
+            print(f"Error granting access: {e}")
+
+    def close(self):
+        self.conn.close()
+        DatabaseService._instances.discard(self)
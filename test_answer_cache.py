@@ -0,0 +1,67 @@
+# test_answer_cache.py
+
+import os
+from unittest.mock import patch, MagicMock
+
+import pytest
+
+from answer_cache import SuggestedAnswerCache
+from dir_cache import directory_cache
+from llm_scheduler import LLMScheduler
+
+
+@pytest.mark.asyncio
+@patch('answer_cache.LLMService')
+async def test_prefetched_answers_follow_index_version(mock_llm_service_class, tmp_path):
+    report = tmp_path / 'report.pdf'
+    report.write_bytes(b'pdf')
+    folder = str(tmp_path)
+    snapshot = directory_cache.refresh(folder)
+
+    llm_service = MagicMock()
+    llm_service.attach_index.return_value = True
+    llm_service.index_fingerprint = snapshot.fingerprint
+    llm_service.generate_response.side_effect = lambda question, chat_history: (f"Answer: {question}", ['report.pdf'])
+    mock_llm_service_class.return_value = llm_service
+
+    cache = SuggestedAnswerCache(questions=['Q1', 'Q2'])
+    assert await cache.prefetch(folder, LLMScheduler()) == 2
+    assert cache.get(folder, 'Q1') == ("Answer: Q1", ['report.pdf'])
+    assert cache.get(folder, 'Other question') is None
+
+    # Already answered for this index version
+    assert await cache.prefetch(folder, LLMScheduler()) == 0
+
+    # A changed folder is a new index version
+    report.write_bytes(b'updated pdf')
+    os.utime(report, (1, 1))
+    directory_cache.refresh(folder)
+    assert cache.get(folder, 'Q1') is None
+    directory_cache.invalidate(folder)
+
+
+@pytest.mark.asyncio
+@patch('answer_cache.current_date')
+@patch('answer_cache.LLMService')
+async def test_prefetched_answers_expire_with_the_day(mock_llm_service_class, mock_current_date, tmp_path):
+    (tmp_path / 'report.pdf').write_bytes(b'pdf')
+    folder = str(tmp_path)
+    snapshot = directory_cache.refresh(folder)
+
+    llm_service = MagicMock()
+    llm_service.attach_index.return_value = True
+    llm_service.index_fingerprint = snapshot.fingerprint
+    llm_service.generate_response.side_effect = lambda question, chat_history: (f"Answer: {question}", [])
+    mock_llm_service_class.return_value = llm_service
+
+    mock_current_date.return_value = '2024-03-04'
+    cache = SuggestedAnswerCache(questions=["What are next week's deadlines?"])
+    assert await cache.prefetch(folder, LLMScheduler()) == 1
+    assert cache.get(folder, "What are next week's deadlines?") is not None
+
+    # Same folder, next day: the answer is stale
+    mock_current_date.return_value = '2024-03-05'
+    assert cache.get(folder, "What are next week's deadlines?") is None
+    assert await cache.prefetch(folder, LLMScheduler()) == 1
+    assert len(cache._answers) == 1
+    directory_cache.invalidate(folder)
@@ -0,0 +1,56 @@
+# test_archive_service.py
+
+from datetime import date
+from unittest.mock import MagicMock, patch
+
+from archive_service import ArchiveService, month_start
+
+
+@patch('archive_service.DatabaseService')
+def test_ensure_partitions_starts_after_legacy_partition(mock_db_service):
+    next_month = month_start(date.today(), 1)
+    cursor = MagicMock()
+    cursor.fetchone.return_value = (1,)
+    cursor.fetchall.return_value = [
+        ("messages_legacy", f"FOR VALUES FROM (MINVALUE) TO ('{next_month}')"),
+        ("messages_default", "DEFAULT"),
+    ]
+    connection = mock_db_service.return_value.connect.return_value
+    connection.cursor.return_value.__enter__.return_value = cursor
+
+    ArchiveService(tables={"messages": "date"}).ensure_partitions(months_ahead=2)
+
+    statements = [call.args[0] for call in cursor.execute.call_args_list]
+    created = [statement for statement in statements if statement.startswith("CREATE TABLE")]
+    # This month is covered by the legacy partition
+    assert created == [
+        f"CREATE TABLE messages_p{next_month:%Y_%m} (LIKE messages INCLUDING DEFAULTS)",
+        f"CREATE TABLE messages_p{month_start(next_month, 1):%Y_%m} (LIKE messages INCLUDING DEFAULTS)",
+    ]
+    # Rows of the new months are moved out of the DEFAULT partition before attaching
+    moves = [statement for statement in statements if "DELETE FROM messages_default" in statement]
+    assert len(moves) == 2
+    assert statements.index(moves[0]) < statements.index(
+        next(statement for statement in statements if "ATTACH PARTITION" in statement)
+    )
+
+
+@patch('archive_service.DatabaseService')
+def test_migration_recreates_indexes_on_partitioned_table(mock_db_service):
+    cursor = MagicMock()
+    cursor.fetchone.return_value = None
+    cursor.fetchall.return_value = [
+        ("messages_user_idx", "CREATE INDEX messages_user_idx ON public.messages_legacy USING btree (user_id, date)"),
+    ]
+    connection = mock_db_service.return_value.connect.return_value
+    connection.cursor.return_value.__enter__.return_value = cursor
+
+    assert ArchiveService(tables={"messages": "date"}).migrate_to_partitioned("messages", "date")
+
+    statements = [call.args[0] for call in cursor.execute.call_args_list]
+    assert "ALTER INDEX messages_user_idx RENAME TO messages_user_idx_legacy" in statements
+    assert "CREATE INDEX messages_user_idx ON messages USING btree (user_id, date)" in statements
+    # Indexes on the parent exist before new partitions are added
+    assert statements.index("CREATE INDEX messages_user_idx ON messages USING btree (user_id, date)") < next(
+        index for index, statement in enumerate(statements) if "PARTITION OF messages DEFAULT" in statement
+    )
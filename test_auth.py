@@ -0,0 +1,94 @@
+# test_auth.py
+
+from unittest.mock import patch
+
+from auth import AuthService
+
+
+@patch('auth.DatabaseService')
+def test_access_is_cached(mock_db_service):
+    auth_service = AuthService()
+    db_service = mock_db_service.return_value
+    db_service.check_user_access.return_value = True
+
+    assert auth_service.check_user_access(1) is True
+    assert auth_service.check_user_access(1) is True
+
+    # Second check is served from memory
+    db_service.check_user_access.assert_called_once_with(1)
+
+
+@patch('auth.DatabaseService')
+def test_grant_access_invalidates_cache(mock_db_service):
+    auth_service = AuthService()
+    db_service = mock_db_service.return_value
+    db_service.check_user_access.return_value = False
+
+    assert auth_service.check_user_access(1) is False
+
+    db_service.check_user_access.return_value = True
+    auth_service.grant_access(1)
+
+    assert auth_service.check_user_access(1) is True
+    assert db_service.check_user_access.call_count == 2
+
+
+@patch('auth.DatabaseService')
+def test_save_user_info_only_on_change(mock_db_service):
+    auth_service = AuthService()
+    db_service = mock_db_service.return_value
+
+    auth_service.save_user_info(1, 'Test User', 'en')
+    auth_service.save_user_info(1, 'Test User', 'en')
+    assert db_service.save_user_info.call_count == 1
+
+    # A changed language is written through
+    auth_service.save_user_info(1, 'Test User', 'ru')
+    assert db_service.save_user_info.call_count == 2
+
+
+@patch('auth.DatabaseService')
+def test_expired_access_is_reloaded(mock_db_service):
+    auth_service = AuthService(cache_ttl=0)
+    db_service = mock_db_service.return_value
+    db_service.check_user_access.return_value = True
+
+    auth_service.check_user_access(1)
+    auth_service.check_user_access(1)
+
+    assert db_service.check_user_access.call_count == 2
+
+
+@patch('auth.DatabaseService')
+def test_last_active_is_flushed_in_bulk(mock_db_service):
+    auth_service = AuthService()
+    db_service = mock_db_service.return_value
+    db_service.bulk_update_last_active.return_value = True
+
+    auth_service.update_last_active(1)
+    auth_service.update_last_active(2)
+    auth_service.update_last_active(1)
+
+    # Nothing is written until the flush
+    db_service.update_last_active.assert_not_called()
+    assert auth_service.flush_last_active() == 2
+
+    rows = db_service.bulk_update_last_active.call_args[0][0]
+    assert sorted(user_id for user_id, _ in rows) == [1, 2]
+
+    # Nothing left to write
+    assert auth_service.flush_last_active() == 0
+    assert db_service.bulk_update_last_active.call_count == 1
+
+
+@patch('auth.DatabaseService')
+def test_failed_flush_is_retried(mock_db_service):
+    auth_service = AuthService()
+    db_service = mock_db_service.return_value
+    db_service.bulk_update_last_active.return_value = False
+
+    auth_service.update_last_active(1)
+    assert auth_service.flush_last_active() == 0
+
+    db_service.bulk_update_last_active.return_value = True
+    assert auth_service.flush_last_active() == 1
@@ -0,0 +1,57 @@
+# test_conversation_history.py
+
+import time
+import uuid
+
+import pytest
+from langchain.schema import SystemMessage
+from langchain_core.language_models.fake_chat_models import FakeListChatModel
+
+import llm_clients
+from conversation_history import ConversationHistory
+from sqlite_db_service import SQLiteDatabaseService
+
+
+@pytest.fixture
+def db_service(tmp_path):
+    service = SQLiteDatabaseService(path=str(tmp_path / "bot.sqlite3"))
+    yield service
+    service.close()
+
+
+@pytest.fixture
+def fake_chat_model():
+    llm_clients.set_factories(
+        chat_factory=lambda model_name, **params: FakeListChatModel(responses=["User asked about deadlines."])
+    )
+    yield
+    llm_clients.set_factories()
+
+
+def add_conversation(db_service, user_id, number):
+    conversation_id = str(uuid.uuid4())
+    db_service.save_message(conversation_id, "user", user_id, f"Question {number}")
+    db_service.save_message(conversation_id, "bot", None, f"Answer {number}")
+    # Message timestamps have millisecond resolution
+    time.sleep(0.01)
+
+
+def test_older_conversations_are_folded_into_summary(db_service, fake_chat_model):
+    history = ConversationHistory(verbatim=2, batch=2)
+    for number in range(3):
+        add_conversation(db_service, 1, number)
+
+    # Not enough conversations past the verbatim window yet
+    assert history.refresh(db_service, 1) is False
+    assert len(history.load(db_service, 1)) == 6
+
+    add_conversation(db_service, 1, 3)
+    assert history.refresh(db_service, 1) is True
+
+    chat_history = history.load(db_service, 1)
+    assert isinstance(chat_history[0], SystemMessage)
+    assert "User asked about deadlines." in chat_history[0].content
+    # Only the latest two conversations stay verbatim, oldest first
+    assert [message.content for message in chat_history[1:]] == [
+        "Question 2", "Answer 2", "Question 3", "Answer 3",
+    ]
@@ -0,0 +1,54 @@
+# test_dir_cache.py
+
+import os
+
+from dir_cache import DirectoryScanCache
+
+
+def test_valid_files_are_cached(tmp_path):
+    (tmp_path / 'report.pdf').write_bytes(b'pdf')
+    (tmp_path / 'image.jpg').write_bytes(b'jpg')
+    cache = DirectoryScanCache()
+
+    assert cache.valid_files(str(tmp_path)) == ['report.pdf']
+
+    # New files only show up after a refresh
+    (tmp_path / 'data.xlsx').write_bytes(b'xlsx')
+    assert cache.valid_files(str(tmp_path)) == ['report.pdf']
+    assert cache.hits == 1
+
+    cache.refresh(str(tmp_path))
+    assert cache.valid_files(str(tmp_path)) == ['data.xlsx', 'report.pdf']
+
+
+def test_fingerprint_tracks_valid_file_changes(tmp_path):
+    report = tmp_path / 'report.pdf'
+    report.write_bytes(b'pdf')
+    cache = DirectoryScanCache()
+    fingerprint = cache.refresh(str(tmp_path)).fingerprint
+
+    # Irrelevant files do not change the fingerprint
+    (tmp_path / 'notes.txt').write_bytes(b'txt')
+    assert cache.refresh(str(tmp_path)).fingerprint == fingerprint
+
+    report.write_bytes(b'updated pdf')
+    os.utime(report, (1, 1))
+    assert cache.refresh(str(tmp_path)).fingerprint != fingerprint
+
+
+def test_unused_folders_are_dropped(tmp_path):
+    folders = []
+    for name in ('a', 'b', 'c'):
+        folder = tmp_path / name
+        folder.mkdir()
+        folders.append(str(folder))
+    cache = DirectoryScanCache(idle_seconds=3600, max_folders=2)
+
+    for folder in folders:
+        cache.get_snapshot(folder)
+    # The least recently used folder is no longer listed or rescanned
+    assert list(cache._snapshots) == folders[1:]
+
+    cache.idle_seconds = 0
+    assert sorted(cache.evict_idle()) == folders[1:]
+    assert not cache._snapshots
@@ -0,0 +1,67 @@
+# test_exception_handlers.py
+
+from datetime import datetime
+from unittest.mock import MagicMock
+
+from exception_handlers import ExceptionTracker, capture_context, exception_fingerprint
+
+
+def raise_value_error():
+    raise ValueError("boom")
+
+
+def make_tracker(**kwargs):
+    tracker = ExceptionTracker(**kwargs)
+    tracker._db_service = MagicMock()
+    return tracker
+
+
+def record(tracker, fingerprint='abc'):
+    tracker.record(
+        exception_type='ValueError',
+        exception_message='boom',
+        stack_trace='',
+        fingerprint=fingerprint,
+        occurred_at=datetime.now(),
+        user_id=1,
+        data_context='',
+    )
+
+
+def test_fingerprint_ignores_message():
+    fingerprints = set()
+    for _ in range(2):
+        try:
+            raise_value_error()
+        except ValueError as e:
+            e.args = (f"boom {len(fingerprints)}",)
+            fingerprints.add(exception_fingerprint(e))
+    assert len(fingerprints) == 1
+
+
+def test_repeated_exceptions_are_counted_not_inserted():
+    tracker = make_tracker(window_seconds=60)
+
+    for _ in range(5):
+        record(tracker)
+
+    assert tracker.db_service.log_exception.call_count == 1
+
+    tracker.flush()
+    rows = tracker.db_service.add_exception_occurrences.call_args[0][0]
+    assert rows[0][1] == 4
+
+
+def test_inserts_are_rate_limited():
+    tracker = make_tracker(window_seconds=60, max_inserts=2)
+
+    for i in range(5):
+        record(tracker, fingerprint=str(i))
+
+    assert tracker.db_service.log_exception.call_count == 2
+
+
+def test_context_is_size_capped():
+    data_context = capture_context('x' * 10000, max_chars=100)
+    assert data_context.startswith('x' * 100)
+    assert data_context.endswith('[truncated]')
@@ -0,0 +1,38 @@
+# test_fake_backends.py
+
+import fake_backends
+from corpus_generator import generate_corpus
+from dir_cache import directory_cache
+from llm_service import LLMService
+
+
+def test_hashing_embeddings_are_deterministic_and_similar_for_shared_words():
+    embeddings = fake_backends.HashingEmbeddings(size=64)
+    first, same, other = embeddings.embed_documents(
+        ["facade mock-up approved", "facade mock-up approved", "parking ventilation"]
+    )
+    query = embeddings.embed_query("who approved the facade")
+
+    assert first == same
+    assert sum(a * b for a, b in zip(query, first)) > sum(a * b for a, b in zip(query, other))
+
+
+def test_generated_corpus_indexes_with_fake_backends(tmp_path, monkeypatch):
+    monkeypatch.setattr("llm_service.INDEX_CACHE_DIR", str(tmp_path / "index_cache"))
+    folder = str(tmp_path / "corpus")
+    facts = generate_corpus(folder, files=3, paragraphs=5, facts_per_file=2, seed=7)
+    fake_backends.install()
+    try:
+        service = LLMService()
+        assert service.load_and_index_documents(folder) == "Documents successfully indexed."
+        answer, _ = service.generate_response("Who approved the facade mock-up?", [])
+    finally:
+        fake_backends.uninstall()
+        LLMService._indexes.pop(folder, None)
+        LLMService._token_counts.pop(folder, None)
+
+    assert sorted(directory_cache.get_snapshot(folder).valid_files) == [
+        "document_0000.pdf", "document_0001.docx", "document_0002.xlsx"
+    ]
+    assert len(facts) == 6
+    assert answer.startswith("Answer:")
@@ -66,17 +66,17 @@ async def test_status_no_folder(mock_auth_service, mock_update, mock_context):
 
 
 @patch('handlers.AuthService')
-@patch('handlers.os')
+@patch('handlers.directory_cache')
 @pytest.mark.asyncio
-async def test_folder_valid_path(mock_os, mock_auth_service, mock_update, mock_context):
+async def test_folder_valid_path(mock_directory_cache, mock_auth_service, mock_update, mock_context):
     bot_handlers = BotHandlers()
     bot_handlers.auth_service = mock_auth_service.return_value
     bot_handlers.auth_service.check_user_access.return_value = True
 
-    # Mock os.path.isdir to return True
-    mock_os.path.isdir.return_value = True
-    # Mock os.listdir to return valid files
-    mock_os.listdir.return_value = ['121212.pdf', 'report.docx', 'data.xlsx']
+    # Mock the folder check to return True
+    mock_directory_cache.is_dir.return_value = True
+    # Mock the cached folder listing to return valid files
+    mock_directory_cache.valid_files.return_value = ['121212.pdf', 'report.docx', 'data.xlsx']
 
     # Simulate the /folder command
     mock_update.message.text = '/folder'
@@ -107,18 +107,18 @@ async def test_folder_valid_path(mock_os, mock_auth_service, mock_update, mock_c
     assert "Context storage is" in args[0]
 
 @patch('handlers.AuthService')
-@patch('handlers.os')
+@patch('handlers.directory_cache')
 @pytest.mark.asyncio
-async def test_folder_invalid_path(mock_os, mock_auth_service, mock_update, mock_context):
+async def test_folder_invalid_path(mock_directory_cache, mock_auth_service, mock_update, mock_context):
     bot_handlers = BotHandlers()
     bot_handlers.auth_service = mock_auth_service.return_value
     bot_handlers.auth_service.check_user_access.return_value = True
 
-    # Mock os.path.isdir to return True
-    mock_os.path.isdir.return_value = True
+    # Mock the folder check to return True
+    mock_directory_cache.is_dir.return_value = True
 
-    # Mock os.listdir to return invalid files
-    mock_os.listdir.return_value = ['image.jpg', 'archive.zip']
+    # The cached listing has no valid files (e.g. only image.jpg, archive.zip)
+    mock_directory_cache.valid_files.return_value = []
 
     # Simulate the /folder command
     mock_update.message.text = '/folder'
@@ -148,15 +148,15 @@ async def test_folder_invalid_path(mock_os, mock_auth_service, mock_update, mock
 
 
 @patch('handlers.AuthService')
-@patch('handlers.os')
+@patch('handlers.directory_cache')
 @pytest.mark.asyncio
-async def test_folder_invalid_path(mock_os, mock_auth_service, mock_update, mock_context):
+async def test_folder_invalid_path(mock_directory_cache, mock_auth_service, mock_update, mock_context):
     bot_handlers = BotHandlers()
     bot_handlers.auth_service = mock_auth_service.return_value
     bot_handlers.auth_service.check_user_access.return_value = True
 
-    # Mock os.path.isdir to return False
-    mock_os.path.isdir.return_value = False
+    # Mock the folder check to return False
+    mock_directory_cache.is_dir.return_value = False
 
     # Simulate the /folder command
     mock_update.message.text = '/folder'
@@ -241,6 +241,7 @@ async def test_handle_message(mock_os, mock_db_service, mock_auth_service, mock_
 
     # Mock DatabaseService
     mock_context.user_data['db_service'] = mock_db_service.return_value
+    mock_db_service.return_value.get_conversation_summary.return_value = None
 
     # Mock the LLMService
     llm_service = MagicMock()
@@ -271,4 +272,122 @@ async def test_handle_message(mock_os, mock_db_service, mock_auth_service, mock_
     # **Assertion to check if the bot's response contains the expected text**
     assert "This is a test response." in args[0]
 
+@patch('handlers.QA_MODE', 'pipelined')
+@patch('handlers.AuthService')
+@pytest.mark.asyncio
+async def test_handle_message_pipelined(mock_auth_service, mock_update, mock_context):
+    bot_handlers = BotHandlers()
+    bot_handlers.auth_service = mock_auth_service.return_value
+    bot_handlers.auth_service.check_user_access.return_value = True
+
+    db_service = MagicMock()
+    db_service.get_conversation_summary.return_value = None
+    db_service.get_conversations.return_value = []
+    db_service.get_last_folder.return_value = None
+    mock_context.user_data['db_service'] = db_service
+
+    llm_service = MagicMock()
+    llm_service.generate_response_pipelined.side_effect = (
+        lambda question, load_chat_history: (load_chat_history(), ("Pipelined response.", ["source1.pdf"]))[1]
+    )
+    mock_context.user_data['llm_service'] = llm_service
+    mock_context.user_data['vector_store_loaded'] = True
+    mock_context.user_data['folder_path'] = '/path/to/folder'
+    mock_context.user_data['valid_files_in_folder'] = ['document.pdf']
+
+    mock_update.message.text = 'What is the summary?'
+
+    await bot_handlers.handle_message(mock_update, mock_context)
+
+    args, kwargs = mock_update.message.reply_text.call_args
+    assert "Pipelined response." in args[0]
+
+    # Messages are written in the background, question first
+    bot_handlers.message_writer.flush()
+    senders = [call.args[1] for call in db_service.save_message.call_args_list]
+    assert senders == ["user", "bot"]
+    bot_handlers.message_writer.close()
+
 # Continue with more tests for other methods...
+
+
+@patch('handlers.AuthService')
+@pytest.mark.asyncio
+async def test_send_file_reuses_file_id(mock_auth_service, mock_update, mock_context, tmp_path):
+    bot_handlers = BotHandlers()
+    bot_handlers.auth_service = mock_auth_service.return_value
+    bot_handlers.auth_service.check_user_access.return_value = True
+    bot_handlers.file_id_cache = MagicMock()
+    bot_handlers.file_id_cache.get.side_effect = [None, 'cached-file-id']
+
+    (tmp_path / 'drawing.pdf').write_bytes(b'%PDF')
+    mock_context.user_data['folder_path'] = str(tmp_path)
+
+    query = MagicMock()
+    query.answer = AsyncMock()
+    query.data = 'get_file:drawing.pdf'
+    query.message.reply_document = AsyncMock()
+    query.message.reply_document.return_value.document.file_id = 'new-file-id'
+    mock_update.callback_query = query
+
+    # First download uploads the file and remembers its file_id
+    await bot_handlers.send_file(mock_update, mock_context)
+    bot_handlers.file_id_cache.put.assert_called_once()
+    assert bot_handlers.file_id_cache.put.call_args[0][3] == 'new-file-id'
+
+    # Second download is sent by file_id
+    await bot_handlers.send_file(mock_update, mock_context)
+    args, kwargs = query.message.reply_document.call_args
+    assert kwargs['document'] == 'cached-file-id'
+
+
+@patch('handlers.AuthService')
+@patch('handlers.LLMService')
+@pytest.mark.asyncio
+async def test_warm_up_indexes(mock_llm_service, mock_auth_service, tmp_path):
+    (tmp_path / 'plan.pdf').write_bytes(b'%PDF')
+    mock_llm_service.return_value.load_and_index_documents.return_value = "Documents successfully indexed."
+
+    bot_handlers = BotHandlers()
+    with patch('handlers.PROJECT_PATHS', {'Lima': str(tmp_path)}), \
+            patch('handlers.KNOWLEDGE_BASE_PATH', str(tmp_path / 'missing')):
+        await bot_handlers.warm_up_indexes()
+
+    assert bot_handlers.index_readiness == {'Lima': 'ready', 'knowledge_base': 'unavailable'}
+    mock_llm_service.return_value.load_and_index_documents.assert_called_once_with(str(tmp_path))
+
+
+@patch('handlers.AuthService')
+@patch('handlers.os')
+@pytest.mark.asyncio
+async def test_runtime_stats(mock_os, mock_auth_service, mock_update, mock_context):
+    bot_handlers = BotHandlers()
+    mock_os.getenv.return_value = '987654321'
+
+    # Only the admin gets the report
+    await bot_handlers.runtime_stats(mock_update, mock_context)
+    args, _ = mock_update.message.reply_text.call_args
+    assert args[0] == "You are not authorized to perform this action."
+
+    mock_update.effective_user.id = 987654321
+    await bot_handlers.runtime_stats(mock_update, mock_context)
+    args, _ = mock_update.message.reply_text.call_args
+    assert "Indexes:" in args[0]
+    assert "LLM requests: 0/" in args[0]
+    assert "RSS:" in args[0]
+
+
+@patch('handlers.token_usage_tracker')
+@patch('handlers.AuthService')
+@patch('handlers.os')
+@pytest.mark.asyncio
+async def test_usage_report_rejects_non_positive_days(mock_os, mock_auth_service, mock_tracker, mock_update, mock_context):
+    bot_handlers = BotHandlers()
+    mock_os.getenv.return_value = '123456789'
+
+    for days in ('0', '-5', 'week'):
+        mock_context.args = [days]
+        await bot_handlers.usage_report(mock_update, mock_context)
+        args, _ = mock_update.message.reply_text.call_args
+        assert args[0] == "Usage: /usage_report [days]"
+    mock_tracker.usage.assert_not_called()
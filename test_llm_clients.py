@@ -0,0 +1,17 @@
+# test_llm_clients.py
+
+from unittest.mock import MagicMock
+
+import llm_clients
+
+
+def test_clients_are_shared_per_model_and_parameters():
+    chat_factory = MagicMock(side_effect=lambda model, **params: MagicMock())
+    llm_clients.set_factories(chat_factory=chat_factory)
+    try:
+        assert llm_clients.get_chat_model('gpt-4o') is llm_clients.get_chat_model('gpt-4o')
+        assert llm_clients.get_chat_model('gpt-4o') is not llm_clients.get_chat_model('gpt-4o-mini')
+        assert llm_clients.get_chat_model('gpt-4o', temperature=0) is not llm_clients.get_chat_model('gpt-4o')
+        assert chat_factory.call_count == 3
+    finally:
+        llm_clients.set_factories()
@@ -0,0 +1,116 @@
+# test_llm_scheduler.py
+
+import asyncio
+import threading
+
+import pytest
+
+from llm_scheduler import LLMScheduler, QueueTimeoutError
+
+
+@pytest.mark.asyncio
+async def test_concurrency_is_capped():
+    scheduler = LLMScheduler(max_concurrent=2, max_wait=5)
+    lock = threading.Lock()
+    active = []
+    peak = []
+
+    def call():
+        with lock:
+            active.append(1)
+            peak.append(len(active))
+        threading.Event().wait(0.05)
+        with lock:
+            active.pop()
+        return 'answer'
+
+    results = await asyncio.gather(*(scheduler.submit(i, call) for i in range(5)))
+
+    assert results == ['answer'] * 5
+    assert max(peak) == 2
+    assert scheduler.running == 0 and scheduler.queued == 0
+
+
+@pytest.mark.asyncio
+async def test_users_are_served_round_robin():
+    scheduler = LLMScheduler(max_concurrent=1, max_wait=5)
+    order = []
+
+    # Hold the only slot until all requests are queued
+    scheduler.running = 1
+    tasks = [
+        asyncio.create_task(scheduler.submit(user, order.append, f"{user}{n}"))
+        for user, n in [('a', 1), ('a', 2), ('a', 3), ('b', 1)]
+    ]
+    await asyncio.sleep(0)
+    scheduler.running = 0
+    scheduler._dispatch()
+    await asyncio.gather(*tasks)
+
+    assert order[:3] == ['a1', 'b1', 'a2']
+
+
+@pytest.mark.asyncio
+async def test_background_requests_wait_for_user_requests():
+    scheduler = LLMScheduler(max_concurrent=1, max_wait=5)
+    order = []
+    positions = []
+
+    async def on_queued(position):
+        positions.append(position)
+
+    scheduler.running = 1
+    tasks = [asyncio.create_task(scheduler.submit(
+        'prefetch', order.append, 'p1', on_queued=on_queued, background=True
+    ))]
+    await asyncio.sleep(0)
+    tasks += [
+        asyncio.create_task(scheduler.submit(user, order.append, user))
+        for user in ('a', 'b')
+    ]
+    await asyncio.sleep(0)
+    assert scheduler.queued == 3
+    assert scheduler.position('prefetch', scheduler._background_queues['prefetch'][0]) == 3
+    scheduler.running = 0
+    scheduler._dispatch()
+    await asyncio.gather(*tasks)
+
+    assert positions == [1]
+    assert order == ['a', 'b', 'p1']
+
+
+@pytest.mark.asyncio
+async def test_queue_position_and_timeout():
+    scheduler = LLMScheduler(max_concurrent=1, max_wait=0.05)
+    positions = []
+
+    async def on_queued(position):
+        positions.append(position)
+
+    # Occupy the only slot
+    scheduler.running = 1
+
+    with pytest.raises(QueueTimeoutError):
+        await scheduler.submit('a', lambda: None, on_queued=on_queued)
+
+    assert positions == [1]
+    assert scheduler.queued == 0
+    assert scheduler.timed_out == 1
+
+
+@pytest.mark.asyncio
+async def test_failing_queue_notification_does_not_leak_the_request():
+    scheduler = LLMScheduler(max_concurrent=1, max_wait=5)
+    scheduler.running = 1
+
+    async def on_queued(position):
+        raise RuntimeError("reply failed")
+
+    with pytest.raises(RuntimeError):
+        await scheduler.submit('a', lambda: None, on_queued=on_queued)
+    assert scheduler.queued == 0
+
+    # The slot is still usable once it is released
+    scheduler.running = 0
+    assert await scheduler.submit('b', lambda: 'answer') == 'answer'
+    assert scheduler.running == 0
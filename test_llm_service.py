@@ -0,0 +1,130 @@
+# test_llm_service.py
+
+from unittest.mock import patch, MagicMock
+
+import pytest
+from langchain.schema import Document
+from langchain_community.embeddings import DeterministicFakeEmbedding
+from langchain_community.vectorstores import FAISS
+from langchain_core.language_models.fake_chat_models import FakeListChatModel
+from langchain_core.messages import AIMessage
+from langchain_core.outputs import ChatGeneration, LLMResult
+
+import llm_clients
+from llm_service import LLMService, build_answer_prompt, merge_documents
+from llm_usage import PromptCacheStats
+
+
+@pytest.fixture
+def fake_models():
+    """Fake chat models by model name, with their canned responses."""
+    responses = {}
+    llm_clients.set_factories(
+        chat_factory=lambda model_name, **params: FakeListChatModel(responses=responses[model_name])
+    )
+    yield responses
+    llm_clients.set_factories()
+
+
+def make_service():
+    llm_service = LLMService()
+    documents = [
+        Document(page_content=f"Meeting notes {i}", metadata={"source": f"notes{i}.pdf"})
+        for i in range(10)
+    ]
+    llm_service.vector_store = FAISS.from_documents(documents, DeterministicFakeEmbedding(size=16))
+    return llm_service
+
+
+def test_pipelined_response_without_history(fake_models):
+    fake_models["gpt-4o"] = ["The answer."]
+    llm_service = make_service()
+    load_chat_history = MagicMock(return_value=[])
+
+    response, source_files = llm_service.generate_response_pipelined("What was decided?", load_chat_history)
+
+    assert response == "The answer."
+    assert source_files
+    load_chat_history.assert_called_once()
+
+
+def test_pipelined_response_uses_rewritten_query(fake_models):
+    # The rewrite runs on the cheaper model
+    fake_models["gpt-4o-mini"] = ["Standalone query"]
+    fake_models["gpt-4o"] = ["The answer."]
+    llm_service = make_service()
+    llm_service.retrieve = MagicMock(wraps=llm_service.retrieve)
+
+    response, _ = llm_service.generate_response_pipelined(
+        "And the deadline?", lambda: [("human", "What was decided?"), ("ai", "A new layout.")]
+    )
+
+    assert response == "The answer."
+    queries = sorted(call.args[0] for call in llm_service.retrieve.call_args_list)
+    assert queries == ["And the deadline?", "Standalone query"]
+
+
+def test_merge_documents_prefers_primary():
+    a = Document(page_content="a", metadata={"source": "a.pdf"})
+    b = Document(page_content="b", metadata={"source": "b.pdf"})
+    c = Document(page_content="c", metadata={"source": "c.pdf"})
+
+    assert merge_documents([a, b], [b, c], 3) == [a, b, c]
+    assert merge_documents([a, b], [b, c], 2) == [a, b]
+
+
+@patch('llm_service.COMPLEXITY_ROUTING', True)
+def test_simple_questions_are_routed_to_cheaper_model(fake_models):
+    fake_models["gpt-4o-mini"] = ["SIMPLE", "Cheap answer.", "COMPLEX"]
+    fake_models["gpt-4o"] = ["Full answer."]
+    llm_service = make_service()
+
+    response, _ = llm_service.generate_response("When is the next meeting?")
+    assert response == "Cheap answer."
+
+    response, _ = llm_service.generate_response("Compare the risks of both layouts.")
+    assert response == "Full answer."
+
+
+def test_answer_prompt_starts_with_static_prefix():
+    first = build_answer_prompt().format_messages(
+        input="Q1", chat_history=[], context="Context A", current_date="2024-05-01"
+    )
+    second = build_answer_prompt().format_messages(
+        input="Q2", chat_history=[], context="Context B", current_date="2024-05-02"
+    )
+
+    assert first[0] == second[0]
+    assert "Context A" not in first[0].content
+    assert first[-1].content == "Q1"
+
+
+def test_cached_prompt_tokens_are_recorded():
+    stats = PromptCacheStats()
+    message = AIMessage(
+        content="The answer.",
+        usage_metadata={
+            "input_tokens": 2000,
+            "output_tokens": 50,
+            "total_tokens": 2050,
+            "input_token_details": {"cache_read": 1536},
+        },
+        response_metadata={"model_name": "gpt-4o"},
+    )
+    stats.on_llm_end(LLMResult(generations=[[ChatGeneration(message=message)]]))
+
+    assert stats.snapshot()["gpt-4o"] == {"requests": 1, "prompt_tokens": 2000, "cached_tokens": 1536}
+    assert stats.hit_rate("gpt-4o") == 0.768
+
+
+def test_least_recently_used_indexes_are_evicted():
+    with patch('llm_service.INDEX_MEMORY_MAX_FOLDERS', 2), \
+            patch.object(LLMService, '_indexes', type(LLMService._indexes)()), \
+            patch.object(LLMService, '_index_last_used', {}):
+        for folder in ('a', 'b'):
+            LLMService._remember_index(folder, 'fp', MagicMock())
+        # A lookup makes "a" the most recently used index
+        assert LLMService._get_built_index('a', 'fp') is not None
+        LLMService._remember_index('c', 'fp', MagicMock())
+
+        assert list(LLMService._indexes) == ['a', 'c']
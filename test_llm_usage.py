@@ -0,0 +1,82 @@
+# test_llm_usage.py
+
+from datetime import date
+from unittest.mock import MagicMock
+
+import pytest
+from langchain_core.messages import AIMessage
+from langchain_core.outputs import ChatGeneration, LLMResult
+
+from llm_usage import TokenUsageTracker, count_text_tokens, estimate_cost, usage_scope
+from sqlite_db_service import SQLiteDatabaseService
+
+
+@pytest.fixture
+def db_service(tmp_path):
+    service = SQLiteDatabaseService(path=str(tmp_path / "bot.sqlite3"))
+    yield service
+    service.close()
+
+
+def llm_result(model, input_tokens, output_tokens, cached_tokens=0):
+    message = AIMessage(
+        content="Answer.",
+        usage_metadata={
+            "input_tokens": input_tokens,
+            "output_tokens": output_tokens,
+            "total_tokens": input_tokens + output_tokens,
+            "input_token_details": {"cache_read": cached_tokens},
+        },
+        response_metadata={"model_name": model},
+    )
+    return LLMResult(generations=[[ChatGeneration(message=message)]])
+
+
+def test_usage_is_aggregated_per_user_and_project(db_service):
+    tracker = TokenUsageTracker()
+    tracker._db_service = db_service
+
+    with usage_scope(user_id=1, project="/projects/a"):
+        tracker.on_llm_end(llm_result("gpt-4o-2024-08-06", 1000, 100, cached_tokens=500))
+        tracker.on_llm_end(llm_result("gpt-4o-2024-08-06", 1000, 100))
+        tracker.record_embeddings("text-embedding-ada-002", ["some query"])
+    tracker.on_llm_end(llm_result("gpt-4o-mini", 200, 20))
+
+    # One write for all pending counters
+    assert tracker.flush() == 3
+    assert tracker.flush() == 0
+
+    with usage_scope(user_id=1, project="/projects/a"):
+        tracker.on_llm_end(llm_result("gpt-4o-2024-08-06", 10, 1))
+
+    # Saved and pending usage are combined
+    rows = {row[:3]: list(row[3:]) for row in tracker.usage(date.today(), user_id=1)}
+    assert rows[(1, "/projects/a", "gpt-4o-2024-08-06")] == [3, 2010, 201, 500, 0]
+    assert rows[(1, "/projects/a", "text-embedding-ada-002")][4] > 0
+    assert (0, "", "gpt-4o-mini") not in rows
+
+
+def test_estimate_cost_uses_longest_model_prefix():
+    # 500 uncached and 500 cached input tokens, 100 output tokens
+    assert estimate_cost("gpt-4o-2024-08-06", 1000, 100, 500, 0) == pytest.approx(
+        (500 * 2.50 + 500 * 1.25 + 100 * 10.00) / 1_000_000
+    )
+    assert estimate_cost("gpt-4o-mini-2024-07-18", 1000, 0, 0, 0) == pytest.approx(0.15 / 1000)
+    assert estimate_cost("unknown-model", 1000, 100, 0, 0) == 0
+
+
+def test_token_counts_are_not_guessed_when_the_tokenizer_fails(monkeypatch):
+    import llm_usage
+
+    encoding = MagicMock()
+    encoding.encode.side_effect = lambda text: text.split()
+    get_encoding = MagicMock(side_effect=[OSError("offline"), OSError("offline"), encoding])
+    monkeypatch.setattr(llm_usage, "_encoding", None)
+    monkeypatch.setattr(llm_usage.tiktoken, "get_encoding", get_encoding)
+
+    with pytest.raises(OSError):
+        count_text_tokens(["one two three"])
+    # Billing may use an estimate
+    assert count_text_tokens(["one two three"], allow_estimate=True) == 4
+    # The failure is not remembered
+    assert count_text_tokens(["one two three"]) == 3
@@ -0,0 +1,38 @@
+# test_loadtest_harness.py
+
+import argparse
+import asyncio
+import os
+import shutil
+
+import handlers
+from llm_service import LLMService
+
+
+def test_load_test_runs_through_the_update_processor(tmp_path, monkeypatch):
+    # The harness points the environment at its own temporary files on import
+    for name in ("DB_BACKEND", "SQLITE_PATH", "INDEX_CACHE_DIR", "OPENAI_API_KEY"):
+        if name in os.environ:
+            monkeypatch.setenv(name, os.environ[name])
+        else:
+            monkeypatch.delenv(name, raising=False)
+    import loadtest_harness
+    shutil.rmtree(loadtest_harness._workdir, ignore_errors=True)
+
+    monkeypatch.setattr(handlers, "PROJECT_PATHS", dict(handlers.PROJECT_PATHS))
+    monkeypatch.setattr(handlers, "QA_MODE", handlers.QA_MODE)
+    monkeypatch.setattr("llm_service.INDEX_CACHE_DIR", str(tmp_path / "index_cache"))
+    args = argparse.Namespace(
+        users=[2], rounds=1, files=3, paragraphs=3, chat_latency=0.0,
+        embedding_latency=0.0, telegram_latency=0.0, workers=1, qa_mode="sequential",
+    )
+    folder = str(tmp_path / "corpus")
+    try:
+        rows, calls = asyncio.run(loadtest_harness.main_async(args, workdir=str(tmp_path)))
+    finally:
+        LLMService._indexes.pop(folder, None)
+        LLMService._token_counts.pop(folder, None)
+
+    assert rows[0]["errors"] == 0
+    assert rows[0]["requests"] == 2 * 5
+    assert calls["sendDocument"] == 2
@@ -0,0 +1,89 @@
+# test_metrics.py
+
+import asyncio
+import time
+import urllib.request
+
+import pytest
+
+from metrics import Histogram, EventLoopLagMonitor, event_loop_lag_seconds, collect_timings, current_timings, detached_context, span, stage_seconds, start_metrics_server
+
+
+def test_histogram_quantiles_and_rendering():
+    histogram = Histogram("test_seconds", "Test.", buckets=(0.1, 1, 10))
+    for seconds in (0.05, 0.05, 0.5, 5):
+        histogram.observe("retrieval", seconds)
+
+    assert histogram.quantile("retrieval", 0.5) == pytest.approx(0.1)
+    assert 1 < histogram.quantile("retrieval", 0.99) <= 10
+    assert histogram.quantile("generation", 0.5) is None
+
+    text = histogram.render()
+    assert 'test_seconds_bucket{stage="retrieval",le="1"} 3' in text
+    assert 'test_seconds_bucket{stage="retrieval",le="+Inf"} 4' in text
+    assert 'test_seconds_count{stage="retrieval"} 4' in text
+
+
+@pytest.mark.asyncio
+async def test_spans_are_collected_per_update():
+    def rewrite():
+        with span("rewrite"):
+            pass
+
+    with collect_timings() as timings:
+        with span("auth"):
+            pass
+        # Spans in worker threads count towards the same update
+        await asyncio.to_thread(rewrite)
+        with collect_timings() as nested:
+            assert nested is timings
+
+    assert set(timings) == {"auth", "rewrite"}
+    with span("outside"):
+        pass
+    assert "outside" not in timings
+
+
+def test_metrics_endpoint():
+    with span("retrieval"):
+        pass
+    server = start_metrics_server("127.0.0.1", 0)
+    try:
+        port = server.server_address[1]
+        with urllib.request.urlopen(f"http://127.0.0.1:{port}/metrics") as response:
+            body = response.read().decode("utf-8")
+        assert response.status == 200
+        assert f'{stage_seconds.name}_count{{stage="retrieval"}}' in body
+    finally:
+        server.shutdown()
+
+
+@pytest.mark.asyncio
+async def test_event_loop_lag_monitor_measures_blocked_loop():
+    monitor = EventLoopLagMonitor(interval=0.01)
+    monitor.start()
+    await asyncio.sleep(0)
+    # Block the loop while the monitor sleeps
+    time.sleep(0.05)
+    # Let the late sample be taken, but not the next one
+    await asyncio.sleep(0.005)
+    monitor.stop()
+
+    assert monitor.last_lag >= 0.03
+    assert event_loop_lag_seconds.quantile(None, 1.0) >= 0.03
+    assert "event_loop_lag" not in stage_seconds.stages()
+    assert 'ask_andrew_event_loop_lag_seconds_bucket{le="+Inf"}' in event_loop_lag_seconds.render()
+
+
+@pytest.mark.asyncio
+async def test_detached_tasks_do_not_write_into_update_timings():
+    async def background():
+        with span("background_step"):
+            pass
+        return current_timings()
+
+    with collect_timings() as timings:
+        task_timings = await asyncio.create_task(background(), context=detached_context())
+
+    assert task_timings is None
+    assert "background_step" not in timings
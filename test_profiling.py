@@ -0,0 +1,72 @@
+# test_profiling.py
+
+import asyncio
+import json
+import os
+import time
+from unittest.mock import MagicMock
+
+from telegram import Update
+
+import pytest
+
+from profiling import SamplingProfiler, profile_methods
+
+
+def slow_step():
+    time.sleep(0.05)
+
+
+def test_slow_calls_are_profiled_to_disk(tmp_path):
+    profiler = SamplingProfiler(str(tmp_path), threshold=0.03, sample_rate=1.0, interval=0.005)
+
+    class Service:
+        def work(self, delay):
+            if delay:
+                slow_step()
+            return "done"
+
+    profile_methods(Service, ("work",), profiler=profiler, enabled=True)
+
+    assert Service().work(False) == "done"
+    assert os.listdir(tmp_path) == []
+
+    assert Service().work(True) == "done"
+    (file_name,) = os.listdir(tmp_path)
+    with open(tmp_path / file_name) as f:
+        profile = json.load(f)
+    assert profile["name"] == "Service.work"
+    assert profile["elapsed_seconds"] >= 0.05
+    assert any("slow_step" in stack for stack, _ in profile["samples"])
+
+
+@pytest.mark.asyncio
+async def test_async_handler_profile_records_user_and_await_chain(tmp_path):
+    profiler = SamplingProfiler(str(tmp_path), threshold=0.03, sample_rate=1.0, interval=0.005)
+
+    async def handle(update, context):
+        await asyncio.sleep(0.05)
+
+    update = MagicMock(spec=Update)
+    update.effective_user.id = 42
+    await profiler.wrap("BotHandlers.handle", handle)(update, None)
+
+    (file_name,) = os.listdir(tmp_path)
+    with open(tmp_path / file_name) as f:
+        profile = json.load(f)
+    assert profile["user_id"] == 42
+    assert any(stack.startswith("await;") and ":handle:" in stack for stack, _ in profile["samples"])
+
+
+def test_unsampled_calls_and_disk_quota(tmp_path):
+    profiler = SamplingProfiler(str(tmp_path), threshold=0, sample_rate=0.0)
+    profiler.wrap("f", lambda: None)()
+    assert profiler.written == 0
+
+    profiler = SamplingProfiler(str(tmp_path), threshold=0, sample_rate=1.0, disk_quota=2000)
+    call = profiler.wrap("f", lambda: None)
+    for _ in range(10):
+        call()
+    total = sum(os.path.getsize(tmp_path / name) for name in os.listdir(tmp_path))
+    assert profiler.written == 10
+    assert total <= 2000
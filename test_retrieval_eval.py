@@ -0,0 +1,26 @@
+# test_retrieval_eval.py
+
+from langchain.schema import Document
+
+from fake_backends import HashingEmbeddings
+from retrieval_eval import build_index, score
+
+
+def test_score_recall_and_reciprocal_rank():
+    results = [Document(page_content="a", metadata={"source": source}) for source in ("x.pdf", "y.pdf", "z.pdf")]
+
+    assert score(results, {"y.pdf"}) == (1.0, 0.5)
+    assert score(results, {"z.pdf", "missing.pdf"}) == (0.5, 1 / 3)
+    assert score(results, {"missing.pdf"}) == (0.0, 0.0)
+
+
+def test_index_types_find_the_matching_chunk():
+    embeddings = HashingEmbeddings(size=64)
+    texts = ["facade mock-up approved", "parking ventilation design", "roof drainage layout"]
+    vectors = embeddings.embed_documents(texts)
+    metadatas = [{"source": f"{index}.pdf"} for index in range(len(texts))]
+
+    for index_type in ("flat", "hnsw", "ivf"):
+        vector_store = build_index(index_type, embeddings, texts, vectors, metadatas)
+        results = vector_store.similarity_search("parking ventilation", k=1)
+        assert results[0].metadata["source"] == "1.pdf"
@@ -0,0 +1,51 @@
+# test_session_store.py
+
+from unittest.mock import MagicMock
+
+import pytest
+
+from session_store import restore_session
+from sqlite_db_service import SQLiteDatabaseService
+
+
+@pytest.fixture
+def db_service(tmp_path):
+    service = SQLiteDatabaseService(path=str(tmp_path / "bot.sqlite3"))
+    yield service
+    service.close()
+
+
+@pytest.mark.asyncio
+async def test_session_is_restored_after_restart(db_service, tmp_path):
+    folder = tmp_path / 'docs'
+    folder.mkdir()
+    (folder / 'report.pdf').write_bytes(b'pdf')
+
+    db_service.save_folder(1, 'Test User', str(folder))
+
+    # Fresh process: empty user_data and an index that is only in the cache
+    user_data = {}
+    llm_service = MagicMock()
+    llm_service.attach_index.return_value = True
+
+    assert await restore_session(db_service, llm_service, 1, user_data) is True
+    assert user_data['folder_path'] == str(folder)
+    assert user_data['valid_files_in_folder'] == ['report.pdf']
+    assert user_data['vector_store_loaded'] is True
+    llm_service.attach_index.assert_called_once_with(str(folder))
+    llm_service.load_and_index_documents.assert_not_called()
+
+    # Only the first update of a user is rehydrated
+    assert await restore_session(db_service, llm_service, 1, user_data) is False
+
+
+
+@pytest.mark.asyncio
+async def test_missing_last_folder_is_not_restored(db_service, tmp_path):
+    db_service.save_folder(1, 'Test User', str(tmp_path / 'deleted'))
+    user_data = {}
+    llm_service = MagicMock()
+
+    assert await restore_session(db_service, llm_service, 1, user_data) is False
+    assert 'folder_path' not in user_data
+    llm_service.attach_index.assert_not_called()
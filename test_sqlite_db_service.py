@@ -0,0 +1,80 @@
+# test_sqlite_db_service.py
+
+import json
+import uuid
+from datetime import datetime
+
+import pytest
+
+from db_service import DatabaseService
+from sqlite_db_service import SQLiteDatabaseService
+
+
+@pytest.fixture
+def db_service(tmp_path):
+    service = SQLiteDatabaseService(path=str(tmp_path / "bot.sqlite3"))
+    yield service
+    service.close()
+
+
+def test_backend_is_selected_from_settings():
+    service = DatabaseService()
+    assert isinstance(service, SQLiteDatabaseService)
+    service.close()
+
+
+def test_incomplete_backend_fails_on_creation():
+    class IncompleteService(DatabaseService):
+        def ensure_schema(self):
+            pass
+
+    with pytest.raises(TypeError):
+        IncompleteService()
+
+
+def test_user_access(db_service):
+    db_service.save_user_info(1, 'Test User', 'en')
+    assert db_service.check_user_access(1) is False
+
+    db_service.grant_access(1)
+    assert db_service.check_user_access(1) is True
+
+    assert db_service.bulk_update_last_active([(1, datetime.utcnow())])
+
+
+def test_last_folder(db_service):
+    assert db_service.get_last_folder(1) is None
+
+    db_service.save_folder(1, 'Test User', '/first')
+    db_service.save_folder(1, 'Test User', '/second')
+
+    assert db_service.get_last_folder(1) == '/second'
+
+
+def test_chat_history(db_service):
+    conversation_id = str(uuid.uuid4())
+    db_service.save_message(conversation_id, 'user', 1, 'What is the summary?')
+    db_service.save_message(conversation_id, 'bot', None, 'A summary.')
+
+    assert db_service.get_chat_history(10, 1) == [
+        'HumanMessage: What is the summary?',
+        'AIMessage: A summary.',
+    ]
+
+
+def test_file_id_cache(db_service):
+    db_service.save_file_id('/docs/drawing.pdf', 100, 1.5, 'file-id')
+
+    assert db_service.get_cached_file_id('/docs/drawing.pdf', 100, 1.5) == 'file-id'
+    # A changed file misses the cache
+    assert db_service.get_cached_file_id('/docs/drawing.pdf', 120, 2.0) is None
+
+    db_service.delete_file_id('/docs/drawing.pdf')
+    assert db_service.get_cached_file_id('/docs/drawing.pdf', 100, 1.5) is None
+
+
+def test_event_log_keeps_stage_timings(db_service):
+    db_service.save_event_log(1, 'ai_conversation', 'Question', 'Answer', str(uuid.uuid4()), timings={'retrieval': 0.12})
+
+    row = db_service.conn.execute("SELECT timings FROM event_log").fetchone()
+    assert json.loads(row[0]) == {'retrieval': 0.12}
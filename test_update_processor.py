@@ -0,0 +1,55 @@
+# test_update_processor.py
+
+import asyncio
+from unittest.mock import MagicMock
+
+import pytest
+from telegram import Update
+
+from update_processor import PerUserUpdateProcessor
+
+
+def make_update(user_id):
+    update = MagicMock(spec=Update)
+    update.effective_user.id = user_id
+    return update
+
+
+@pytest.mark.asyncio
+async def test_updates_of_one_user_stay_ordered():
+    processor = PerUserUpdateProcessor(workers=4)
+    await processor.initialize()
+    events = []
+
+    async def handle(name, delay):
+        events.append(f"start {name}")
+        await asyncio.sleep(delay)
+        events.append(f"end {name}")
+
+    await asyncio.gather(
+        processor.process_update(make_update(1), handle('first', 0.05)),
+        processor.process_update(make_update(1), handle('second', 0)),
+    )
+
+    assert events == ['start first', 'end first', 'start second', 'end second']
+    # Locks of idle users are released
+    assert processor._user_locks == {}
+
+
+@pytest.mark.asyncio
+async def test_different_users_run_concurrently():
+    processor = PerUserUpdateProcessor(workers=4)
+    await processor.initialize()
+    events = []
+
+    async def handle(name):
+        events.append(f"start {name}")
+        await asyncio.sleep(0.05)
+        events.append(f"end {name}")
+
+    await asyncio.gather(
+        processor.process_update(make_update(1), handle('a')),
+        processor.process_update(make_update(2), handle('b')),
+    )
+
+    assert events[:2] == ['start a', 'start b']
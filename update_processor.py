@@ -0,0 +1,58 @@
+# update_processor.py
+
+import asyncio
+
+from telegram import Update
+from telegram.ext import BaseUpdateProcessor
+
+from settings import UPDATE_WORKERS, MAX_PENDING_UPDATES
+
+
+class PerUserUpdateProcessor(BaseUpdateProcessor):
+    """Processes updates concurrently while keeping each user's updates in order.
+
+    Updates of one user are serialized with a per-user lock, so messages and
+    ConversationHandler state transitions are handled in arrival order.
+    Updates of different users run in parallel on up to ``workers`` slots.
+    Updates waiting on their user's lock do not hold a worker slot.
+    """
+
+    def __init__(self, workers=UPDATE_WORKERS, max_pending_updates=MAX_PENDING_UPDATES):
+        super().__init__(max_concurrent_updates=max(max_pending_updates, workers))
+        self.workers = workers
+        self._worker_slots = None
+        # user key -> [lock, number of updates holding or waiting for it]
+        self._user_locks = {}
+
+    @staticmethod
+    def user_key(update):
+        if isinstance(update, Update):
+            if update.effective_user:
+                return update.effective_user.id
+            if update.effective_chat:
+                return update.effective_chat.id
+        return None
+
+    async def do_process_update(self, update, coroutine):
+        key = self.user_key(update)
+        if key is None:
+            async with self._worker_slots:
+                await coroutine
+            return
+
+        entry = self._user_locks.setdefault(key, [asyncio.Lock(), 0])
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                async with self._worker_slots:
+                    await coroutine
+        finally:
+            entry[1] -= 1
+            if not entry[1]:
+                del self._user_locks[key]
+
+    async def initialize(self):
+        self._worker_slots = asyncio.Semaphore(self.workers)
+
+    async def shutdown(self):
+        self._user_locks.clear()
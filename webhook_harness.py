@@ -0,0 +1,102 @@
+# webhook_harness.py
+"""Post fake Telegram updates to a bot running in webhook mode.
+
+Start the bot with BOT_MODE=webhook, then for example:
+
+    python webhook_harness.py --users 5 --messages 3 --text "/status"
+
+Each request carries the secret token header, so the harness also checks
+that the server rejects requests with a wrong token (--wrong-secret).
+"""
+
+import argparse
+import itertools
+import json
+import statistics
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+from settings import WEBHOOK_PORT, WEBHOOK_PATH, WEBHOOK_SECRET_TOKEN
+
+_update_ids = itertools.count(int(time.time()))
+
+
+def build_update(user_id, text):
+    """A minimal private-chat message update as Telegram would send it."""
+    update_id = next(_update_ids)
+    user = {
+        "id": user_id,
+        "is_bot": False,
+        "first_name": f"Load{user_id}",
+        "language_code": "en",
+    }
+    message = {
+        "message_id": update_id,
+        "date": int(time.time()),
+        "chat": {"id": user_id, "type": "private", "first_name": user["first_name"]},
+        "from": user,
+        "text": text,
+    }
+    if text.startswith("/"):
+        command = text.split()[0]
+        message["entities"] = [{"type": "bot_command", "offset": 0, "length": len(command)}]
+    return {"update_id": update_id, "message": message}
+
+
+def post_update(url, secret_token, update):
+    request = urllib.request.Request(
+        url,
+        data=json.dumps(update).encode("utf-8"),
+        headers={
+            "Content-Type": "application/json",
+            "X-Telegram-Bot-Api-Secret-Token": secret_token or "",
+        },
+        method="POST",
+    )
+    started = time.perf_counter()
+    try:
+        with urllib.request.urlopen(request, timeout=30) as response:
+            status = response.status
+    except urllib.error.HTTPError as e:
+        status = e.code
+    return status, time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--url", default=f"http://127.0.0.1:{WEBHOOK_PORT}/{WEBHOOK_PATH}")
+    parser.add_argument("--secret", default=WEBHOOK_SECRET_TOKEN)
+    parser.add_argument("--wrong-secret", action="store_true", help="Send an invalid secret token.")
+    parser.add_argument("--users", type=int, default=1)
+    parser.add_argument("--messages", type=int, default=1, help="Messages per user.")
+    parser.add_argument("--text", default="/status")
+    parser.add_argument("--first-user-id", type=int, default=900000000)
+    args = parser.parse_args()
+
+    secret_token = "invalid-" + (args.secret or "") if args.wrong_secret else args.secret
+    updates = [
+        build_update(args.first_user_id + user, args.text)
+        for _ in range(args.messages)
+        for user in range(args.users)
+    ]
+
+    with ThreadPoolExecutor(max_workers=args.users) as pool:
+        results = list(pool.map(lambda update: post_update(args.url, secret_token, update), updates))
+
+    statuses = {}
+    for status, _ in results:
+        statuses[status] = statuses.get(status, 0) + 1
+    latencies = sorted(latency * 1000 for _, latency in results)
+
+    print(f"Posted {len(results)} updates to {args.url}")
+    print(f"Status codes: {statuses}")
+    print(
+        f"Delivery latency ms: p50={statistics.median(latencies):.1f} "
+        f"max={latencies[-1]:.1f}"
+    )
+
+
+if __name__ == "__main__":
+    main()